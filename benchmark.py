@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+###############################################################################
+#
+# Purpose: Benchmark RecordManager operations at production sizes.
+# Date:    Mon 19 Oct 2026
+# Copyright (c) 2026 Andrew Nisbet
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+from time import perf_counter
+from holdings import HoldingsIndex
+from oclc4 import RecordManager
+from record import Record
+
+VERSION='1.00.00'
+
+def makeManager(workDir:str) -> RecordManager:
+    """
+    Creates a RecordManager with an empty configuration in the work directory.
+
+    Parameters:
+    - workDir directory for the config file, logs and any checkpoints.
+
+    Return:
+    - RecordManager object.
+    """
+    config_file = os.path.join(workDir, 'bench.json')
+    with open(config_file, 'w') as f:
+        json.dump({}, f)
+    return RecordManager(configFile=config_file)
+
+def makeLists(holdings:int, adds:int, deletes:int, seed:int=42) -> tuple:
+    """
+    Builds synthetic holdings, add records and delete numbers shaped like a
+    reclamation: most adds are already holdings, a few are new or have no
+    OCLC number, and most deletes are holdings with a few strays and
+    duplicates.
+
+    Parameters:
+    - holdings number of OCLC numbers in the holdings report.
+    - adds number of add records.
+    - deletes number of delete OCLC numbers.
+    - seed for the random number generator so runs are repeatable.
+
+    Return:
+    - tuple of (holdings list, add Record list, delete list).
+    """
+    rand = random.Random(seed)
+    holdings_list = [f"{n}" for n in range(1, holdings + 1)]
+    add_records = []
+    for i in range(adds):
+        choice = rand.random()
+        if choice < 0.02:
+            oclc_number = ''
+        elif choice < 0.10:
+            oclc_number = f"{holdings + i + 1}"
+        else:
+            oclc_number = holdings_list[rand.randrange(holdings)]
+        add_records.append(Record(data=[], tcn=f"epl{i:08d}", oclcNumber=oclc_number))
+    delete_list = []
+    for i in range(deletes):
+        if rand.random() < 0.01:
+            delete_list.append(f"{holdings * 2 + i}")
+        else:
+            delete_list.append(holdings_list[rand.randrange(holdings)])
+    return (holdings_list, add_records, delete_list)
+
+def benchNormalizeLists(holdings:int, adds:int, deletes:int) -> float:
+    """
+    Times RecordManager.normalizeLists() on synthetic lists. Logging is
+    sent to a scratch directory so the reported time reflects normalization.
+
+    Parameters:
+    - holdings number of OCLC numbers in the holdings report.
+    - adds number of add records.
+    - deletes number of delete OCLC numbers.
+
+    Return:
+    - Elapsed seconds.
+    """
+    (holdings_list, add_records, delete_list) = makeLists(holdings, adds, deletes)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        try:
+            manager = makeManager(work_dir)
+            manager.oclc_holdings = HoldingsIndex(holdings_list)
+            manager.add_records = add_records
+            manager.delete_numbers = delete_list
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                start = perf_counter()
+                manager.normalizeLists()
+                elapsed = perf_counter() - start
+        finally:
+            os.chdir(cwd)
+    print(f"normalizeLists: {holdings} holdings, {adds} adds, {deletes} deletes in {elapsed:.2f} seconds")
+    print(f"  {len(manager.delete_numbers)} deletes, {len(manager.rejected)} rejected")
+    return elapsed
+
+def benchHoldingsMemory(holdings:int) -> tuple:
+    """
+    Compares the memory used by holdings stored as a list of strings
+    with the same holdings in a HoldingsIndex.
+
+    Parameters:
+    - holdings number of OCLC numbers in the holdings report.
+
+    Return:
+    - tuple of (list bytes, index bytes).
+    """
+    # Real OCLC numbers are 8 to 10 digits.
+    holdings_list = [f"{n}" for n in range(100000000, 100000000 + holdings)]
+    list_bytes = sys.getsizeof(holdings_list) + sum(sys.getsizeof(n) for n in holdings_list)
+    index = HoldingsIndex(holdings_list)
+    index_bytes = sys.getsizeof(index)
+    print(f"holdings memory: {holdings} numbers, list {list_bytes / 1048576:.1f} MB, index {index_bytes / 1048576:.1f} MB")
+    return (list_bytes, index_bytes)
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog = 'benchmark',
+        usage='%(prog)s [options]' ,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description='''\
+            Times RecordManager operations on synthetic production-sized data.
+            ''',
+    )
+    parser.add_argument('--holdings', action='store', type=int, default=1000000, help='number of OCLC holdings. Default 1000000.')
+    parser.add_argument('--adds', action='store', type=int, default=300000, help='number of add records. Default 300000.')
+    parser.add_argument('--deletes', action='store', type=int, default=100000, help='number of delete numbers. Default 100000.')
+    parser.add_argument('--version', action='version', version='%(prog)s ' + VERSION)
+    args = parser.parse_args(argv)
+    benchHoldingsMemory(holdings=args.holdings)
+    benchNormalizeLists(holdings=args.holdings, adds=args.adds, deletes=args.deletes)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
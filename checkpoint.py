@@ -0,0 +1,189 @@
+###############################################################################
+#
+# Purpose: Periodic checkpoints of an update written in the background.
+# Date:    Mon 19 Oct 2026
+# Copyright (c) 2026 Andrew Nisbet
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+import gzip
+import io
+import os
+import tempfile
+import threading
+from time import monotonic
+from logit import logit
+
+def writeAtomic(fileName:str, text, encoding:str='utf-8'):
+    """
+    Writes a file so that it is either completely written or not changed
+    at all. The text goes to a temporary file in the same directory, which
+    is synced and then renamed over the original. Files ending in '.gz'
+    are gzip compressed.
+
+    Parameters:
+    - fileName of the file to write.
+    - text to write, either a string or an iterable of strings which are
+      written as they are produced.
+    - encoding of the file.
+
+    Returns:
+    - None
+    """
+    if isinstance(text, str):
+        text = [text]
+    directory = os.path.dirname(os.path.abspath(fileName))
+    fd, temp_name = tempfile.mkstemp(prefix=f".{os.path.basename(fileName)}.", suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as raw:
+            stream = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) if fileName.endswith('.gz') else raw
+            fp = io.TextIOWrapper(stream, encoding=encoding)
+            for chunk in text:
+                fp.write(chunk)
+            fp.flush()
+            fp.detach()
+            if stream is not raw:
+                stream.close()
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(temp_name, fileName)
+    except BaseException:
+        try:
+            os.unlink(temp_name)
+        except FileNotFoundError:
+            pass
+        raise
+
+def openText(fileName:str, encoding:str='utf-8'):
+    """
+    Opens a file written by writeAtomic() for reading, decompressing it
+    if the name ends in '.gz'.
+
+    Parameters:
+    - fileName of the file to read.
+    - encoding of the file.
+
+    Returns:
+    - Text file object.
+    """
+    if fileName.endswith('.gz'):
+        return gzip.open(fileName, 'rt', encoding=encoding)
+    return open(fileName, 'rt', encoding=encoding)
+
+class Checkpointer:
+    """
+    Saves a checkpoint every 'everyRecords' outcomes or 'everySeconds'
+    seconds, whichever comes first. The snapshot is taken on the calling
+    thread, so it is consistent, and written on a background thread so the
+    request loop doesn't wait for the disk. If the last checkpoint is still
+    being written the next one is put off until it finishes.
+    """
+    def __init__(self, snapshot, write, everyRecords:int=1000, everySeconds:float=300.0):
+        """
+        Constructor
+
+        Parameters:
+        - snapshot function that returns a copy of the state to save, or
+          None if there is nothing to write.
+        - write function that saves a snapshot, run on the background thread.
+        - everyRecords number of outcomes between checkpoints, 0 for no limit.
+        - everySeconds seconds between checkpoints, 0 for no limit.
+
+        Returns:
+        - Checkpointer object.
+        """
+        self.snapshot = snapshot
+        self.write = write
+        self.every_records = everyRecords
+        self.every_seconds = everySeconds
+        self.count = 0
+        self.last_time = monotonic()
+        self.thread = None
+        self.written = 0
+
+    def isDue(self) -> bool:
+        """
+        Tests if a checkpoint is due.
+
+        Parameters:
+        - None
+
+        Returns:
+        - True if enough outcomes or time have passed since the last checkpoint.
+        """
+        if self.every_records > 0 and self.count >= self.every_records:
+            return True
+        return self.every_seconds > 0 and monotonic() - self.last_time >= self.every_seconds
+
+    def tick(self):
+        """
+        Counts an outcome and starts a checkpoint if one is due.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        self.count += 1
+        if self.isDue():
+            self.checkpoint()
+
+    def checkpoint(self) -> bool:
+        """
+        Takes a snapshot and starts writing it in the background.
+
+        Parameters:
+        - None
+
+        Returns:
+        - True if a checkpoint was started, and False if the previous one
+          is still being written.
+        """
+        if self.thread is not None and self.thread.is_alive():
+            return False
+        self.count = 0
+        self.last_time = monotonic()
+        state = self.snapshot()
+        if state is None:
+            return True
+        self.thread = threading.Thread(target=self._write_, args=(state,), name='checkpoint', daemon=True)
+        self.thread.start()
+        return True
+
+    def _write_(self, state):
+        try:
+            self.write(state)
+            self.written += 1
+        except Exception as e:
+            logit(f"checkpoint failed: {e}", level='error')
+
+    def wait(self):
+        """
+        Waits for a checkpoint that is being written to finish.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    doctest.testfile("checkpoint.tst")
@@ -0,0 +1,69 @@
+Tests for Checkpointer
+======================
+
+>>> import os
+>>> from checkpoint import Checkpointer, writeAtomic
+
+Test writeAtomic
+----------------
+>>> writeAtomic('test_checkpoint.json', '[1, 2, 3]')
+>>> open('test_checkpoint.json').read()
+'[1, 2, 3]'
+>>> writeAtomic('test_checkpoint.json', '[4]')
+>>> open('test_checkpoint.json').read()
+'[4]'
+
+No temporary files are left behind.
+>>> [f for f in os.listdir('.') if f.startswith('.test_checkpoint.json')]
+[]
+
+If the write fails the original is untouched.
+>>> writeAtomic('test_checkpoint.json', '\udcff')
+Traceback (most recent call last):
+...
+UnicodeEncodeError: 'utf-8' codec can't encode character '\udcff' in position 0: surrogates not allowed
+>>> open('test_checkpoint.json').read()
+'[4]'
+>>> [f for f in os.listdir('.') if f.startswith('.test_checkpoint.json')]
+[]
+>>> os.unlink('test_checkpoint.json')
+
+Test checkpoints by record count
+--------------------------------
+The snapshot is taken when the checkpoint starts, so later changes
+to the state don't leak into it.
+>>> state = []
+>>> saved = []
+>>> checkpointer = Checkpointer(snapshot=lambda: state[:], write=saved.append, everyRecords=2, everySeconds=0)
+>>> state.append('a')
+>>> checkpointer.tick()
+>>> checkpointer.wait()
+>>> saved
+[]
+>>> state.append('b')
+>>> checkpointer.tick()
+>>> state.append('c')
+>>> checkpointer.wait()
+>>> saved
+[['a', 'b']]
+>>> checkpointer.written
+1
+
+Test checkpoints by time
+------------------------
+>>> checkpointer = Checkpointer(snapshot=lambda: state[:], write=saved.append, everyRecords=0, everySeconds=0.01)
+>>> checkpointer.isDue()
+False
+>>> import time
+>>> time.sleep(0.02)
+>>> checkpointer.tick()
+>>> checkpointer.wait()
+>>> saved[-1]
+['a', 'b', 'c']
+
+A snapshot of None means there is nothing to write.
+>>> checkpointer = Checkpointer(snapshot=lambda: None, write=saved.append, everyRecords=1, everySeconds=0)
+>>> checkpointer.tick()
+>>> checkpointer.wait()
+>>> checkpointer.written
+0
@@ -0,0 +1,346 @@
+###############################################################################
+#
+# Purpose: Run updates from the files dropped in a directory.
+# Date:    Mon 19 Oct 2026
+# Copyright (c) 2026 Andrew Nisbet
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+import os
+import shutil
+import threading
+from datetime import datetime
+from os.path import exists, isfile, join, splitext
+from logit import logit
+
+# Seconds between looks at the drop directory.
+POLL_SECONDS = 10.0
+# Seconds before the first retry of work left by an update, doubled for
+# each retry up to MAX_RETRY_SECONDS.
+RETRY_SECONDS = 5.0
+MAX_RETRY_SECONDS = 45.0
+# Updates of a batch before what is left is saved for the next start.
+MAX_ATTEMPTS = 8
+ADD_EXTENSIONS = ('.flat', '.mrk', '.zip')
+DELETE_EXTENSIONS = ('.lst', '.txt', '.json')
+# Subdirectories of the drop directory for the batch being updated, the
+# files of batches that have finished, and files that couldn't be read.
+WORK_DIR = 'work'
+DONE_DIR = 'done'
+FAILED_DIR = 'failed'
+
+class Daemon:
+    """
+    Watches a drop directory for flat, mrk and zip files of adds and lists
+    of deletes, and runs an update of each batch of files in the same
+    process, so the web service session and auth token stay warm between
+    updates. Work an update leaves, like requests that got server errors,
+    is retried on the same RecordManager after a short backoff, with the
+    ledger making sure confirmed requests aren't sent again.
+
+    A file is picked up once its size and modification time are the same
+    on two looks, so files still being copied in are left alone. The files
+    of a batch are moved to work/ while it is updated and to done/ after,
+    or to failed/ if they can't be read.
+    If the daemon stops part way, the next start recovers the saved state,
+    or replays the journal over the lists still in work/, like --recover.
+    """
+    def __init__(self, dropDir:str, newManager, configFile:str='prod.json', recordLimit:int=-1, checkpointRecords:int=1000,
+        checkpointSeconds:float=300.0, pollSeconds:float=POLL_SECONDS, retrySeconds:float=RETRY_SECONDS,
+        maxRetrySeconds:float=MAX_RETRY_SECONDS, maxAttempts:int=MAX_ATTEMPTS):
+        """
+        Constructor
+
+        Parameters:
+        - dropDir directory to watch.
+        - newManager function that returns a new RecordManager for a batch.
+        - configFile configuration JSON file of the web services.
+        - recordLimit maximum records per stage, -1 for all.
+        - checkpointRecords, checkpointSeconds see RecordManager.startCheckpoints().
+        - pollSeconds seconds between looks at the drop directory.
+        - retrySeconds seconds before the first retry of leftover work.
+        - maxRetrySeconds longest wait between retries.
+        - maxAttempts updates of a batch before its leftover work is saved.
+
+        Returns:
+        - Daemon object.
+        """
+        self.drop_dir = dropDir
+        self.work_dir = join(dropDir, WORK_DIR)
+        self.done_dir = join(dropDir, DONE_DIR)
+        self.failed_dir = join(dropDir, FAILED_DIR)
+        self.new_manager = newManager
+        self.config_file = configFile
+        self.record_limit = recordLimit
+        self.checkpoint_records = checkpointRecords
+        self.checkpoint_seconds = checkpointSeconds
+        self.poll_seconds = pollSeconds
+        self.retry_seconds = retrySeconds
+        self.max_retry_seconds = maxRetrySeconds
+        self.max_attempts = maxAttempts
+        self.stopping = threading.Event()
+        # File name: (size, modification time) from the last look.
+        self.seen = {}
+        self.batches = 0
+        # Optional MetricsExporter, moved on to each batch's manager.
+        self.exporter = None
+        # The manager of the batch being updated, or an idle one.
+        self.manager = newManager()
+        os.makedirs(self.work_dir, exist_ok=True)
+        os.makedirs(self.done_dir, exist_ok=True)
+        os.makedirs(self.failed_dir, exist_ok=True)
+
+    def scan(self) -> list:
+        """
+        Looks for add and delete files that have stopped changing.
+
+        Parameters:
+        - None
+
+        Returns:
+        - Sorted list of the file names that are ready, without the directory.
+        """
+        ready = []
+        seen = {}
+        for name in sorted(os.listdir(self.drop_dir)):
+            path = join(self.drop_dir, name)
+            ext = splitext(name)[1].lower()
+            if name.startswith('.') or not isfile(path) or ext not in ADD_EXTENSIONS + DELETE_EXTENSIONS:
+                continue
+            stat = os.stat(path)
+            seen[name] = (stat.st_size, stat.st_mtime)
+            if stat.st_size > 0 and self.seen.get(name) == seen[name]:
+                ready.append(name)
+        self.seen = seen
+        return ready
+
+    def _lists_(self, names:list) -> tuple:
+        adds = [name for name in names if splitext(name)[1].lower() in ADD_EXTENSIONS]
+        deletes = [name for name in names if splitext(name)[1].lower() in DELETE_EXTENSIONS]
+        return (adds, deletes)
+
+    def _readLists_(self, manager, adds:list, deletes:list):
+        delete_numbers = []
+        for name in deletes:
+            logit(f"starting to read deletes in {name}", timestamp=True)
+            manager.readDeleteList(fileName=join(self.work_dir, name))
+            delete_numbers.extend(manager.delete_numbers)
+        manager.delete_numbers = delete_numbers
+        for name in adds:
+            logit(f"starting to read adds in {name}", timestamp=True)
+            manager.readFlatOrMrkRecords(fileName=join(self.work_dir, name))
+        if manager.holdings_store is not None:
+            manager.readHoldingsStore()
+        manager.normalizeLists(recordLimit=self.record_limit)
+
+    def _hasSavedState_(self, manager) -> bool:
+        if manager.state_store is not None:
+            return manager.state_store.pendingCount() > 0
+        return any(exists(name) for name in (manager._findAddsCheckpoint_(), f"{manager.backup_prefix}deletes.json"))
+
+    def recover(self):
+        """
+        Finishes the work a previous process left, from its saved state, or
+        the journal and the lists in work/ if it stopped before it could
+        save its state.
+
+        Parameters:
+        - None
+
+        Returns:
+        - The RecordManager that recovered the work, or None if there was
+          nothing to recover.
+        """
+        names = sorted(os.listdir(self.work_dir))
+        manager = self.new_manager()
+        if self._hasSavedState_(manager):
+            logit(f"recovering the saved state of the last update", timestamp=True)
+            manager.restoreState()
+        elif names:
+            logit(f"recovering the update of {', '.join(names)}", timestamp=True)
+            (adds, deletes) = self._lists_(names)
+            self._readLists_(manager, adds, deletes)
+        else:
+            manager.closeStores()
+            return None
+        journal_file = f"{manager.backup_prefix}journal.jsonl"
+        manager.replayJournal(journal_file)
+        self._update_(manager, recover=True)
+        self._finishBatch_(names)
+        return manager
+
+    def runBatch(self, names:list) -> bool:
+        """
+        Updates OCLC with a batch of files from the drop directory. Work an
+        earlier batch left is saved under the same file names, so it is
+        recovered first, and the files wait in the drop directory while
+        any of it is still left.
+
+        Parameters:
+        - names of the ready files, see scan().
+
+        Returns:
+        - True if the batch was run, and False if it has to wait.
+        """
+        if self._hasSavedState_(self.manager):
+            manager = self.recover()
+            if manager is not None and self._hasSavedState_(manager):
+                logit(f"*warning, work of an earlier update is still left, {', '.join(names)} will wait", timestamp=True)
+                return False
+        for name in names:
+            shutil.move(join(self.drop_dir, name), join(self.work_dir, name))
+            self.seen.pop(name, None)
+        logit(f"starting an update of {', '.join(names)}", timestamp=True)
+        manager = self.new_manager()
+        (adds, deletes) = self._lists_(names)
+        try:
+            self._readLists_(manager, adds, deletes)
+        except Exception as e:
+            logit(f"**error, failed to read {', '.join(names)}, moving them to {self.failed_dir}:\n{e}", timestamp=True)
+            manager.closeStores()
+            self._finishBatch_(sorted(os.listdir(self.work_dir)), self.failed_dir)
+            return True
+        # Confirmations only apply to the update they were made in.
+        if manager.ledger is not None:
+            manager.ledger.clear()
+        self._update_(manager, recover=False)
+        self._finishBatch_(sorted(os.listdir(self.work_dir)))
+        return True
+
+    def _update_(self, manager, recover:bool):
+        """
+        Runs the update, and runs it again on the same manager while it
+        leaves work, waiting a little longer each time.
+
+        Parameters:
+        - manager RecordManager with the lists read and normalized.
+        - recover append to the journal of the last process.
+
+        Returns:
+        - None
+        """
+        self._setManager_(manager)
+        manager.openJournal(f"{manager.backup_prefix}journal.jsonl", append=recover)
+        try:
+            attempt = 1
+            while True:
+                manager.checkpoint_kept = False
+                manager.startCheckpoints(everyRecords=self.checkpoint_records, everySeconds=self.checkpoint_seconds)
+                try:
+                    manager.runUpdate(webServiceConfig=self.config_file, recordLimit=self.record_limit)
+                except KeyboardInterrupt:
+                    logit(f"system interrupt received")
+                    manager.saveState()
+                    logit(f"progress saved.")
+                    raise
+                except Exception as e:
+                    logit(f"an exception ({e}) occured, saving state.")
+                    manager.saveState()
+                    logit(f"progress saved.")
+                if manager.pastDeadline():
+                    # The work left waits for the next window.
+                    self.stop()
+                left = manager.getRemainingCount()
+                if left == 0:
+                    self._removeSavedState_(manager)
+                    logit(f"update finished after {attempt} attempt(s)", timestamp=True)
+                    return
+                if attempt >= self.max_attempts or self.stopping.is_set():
+                    if not manager.deadline_reached:
+                        manager.saveState()
+                    logit(f"*warning, {left} request(s) left after {attempt} attempt(s), saved for the next start.", timestamp=True)
+                    return
+                wait = min(self.retry_seconds * 2 ** (attempt - 1), self.max_retry_seconds)
+                logit(f"{left} request(s) left, retrying in {wait:.0f} second(s)", timestamp=True)
+                if self.stopping.wait(wait):
+                    manager.saveState()
+                    return
+                attempt += 1
+        finally:
+            manager.closeJournal()
+            self.batches += 1
+
+    def _setManager_(self, manager):
+        # The manager being replaced won't be used again, so its databases are closed.
+        if manager is not self.manager:
+            self.manager.closeStores()
+        self.manager = manager
+        if self.exporter is not None:
+            self.exporter.manager = manager
+
+    def _removeSavedState_(self, manager):
+        # A retry that finishes the work makes the state saved by an earlier attempt stale.
+        if manager.state_store is not None:
+            return
+        for file_name in (manager._findAddsCheckpoint_(), f"{manager.backup_prefix}deletes.json"):
+            if exists(file_name):
+                manager._removeCheckpoint_(file_name)
+
+    def _finishBatch_(self, names:list, toDir:str=None):
+        # Batches often reuse file names, so the moved files are stamped.
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        for name in names:
+            path = join(self.work_dir, name)
+            if not exists(path):
+                continue
+            target = join(toDir or self.done_dir, f"{stamp}_{name}")
+            copy = 1
+            while exists(target):
+                target = join(toDir or self.done_dir, f"{stamp}-{copy}_{name}")
+                copy += 1
+            shutil.move(path, target)
+
+    def run(self):
+        """
+        Recovers any work a previous process left, then updates each batch
+        of files dropped in the directory until stop() is called or the
+        managers' deadline passes.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        logit(f"watching {self.drop_dir} for {', '.join(ADD_EXTENSIONS)} adds and {', '.join(DELETE_EXTENSIONS)} deletes", timestamp=True)
+        self.recover()
+        while not self.stopping.is_set():
+            if self.manager.pastDeadline():
+                logit(f"daemon stopped for its deadline after {self.batches} update(s)", timestamp=True)
+                break
+            names = self.scan()
+            if not names:
+                self.stopping.wait(self.poll_seconds)
+            elif not self.runBatch(names):
+                self.stopping.wait(self.max_retry_seconds)
+
+    def stop(self):
+        self.stopping.set()
+
+    def close(self):
+        """
+        Closes the databases of the last manager. Call once run() returns.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        self.manager.closeStores()
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    doctest.testfile("daemon.tst")
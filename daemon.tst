@@ -0,0 +1,174 @@
+Tests for the daemon
+====================
+
+>>> import io, os, shutil, tempfile
+>>> from contextlib import redirect_stdout
+>>> from daemon import Daemon
+>>> from oclc4 import RecordManager
+>>> from record import SET, MATCH
+
+A manager whose update raises, like a dropped connection, the first
+'failures' times, and otherwise completes every record.
+>>> config = os.path.abspath('prod.json')
+>>> test_dir = os.path.abspath('test')
+>>> class FlakyManager(RecordManager):
+...     failures = 0
+...     updates = 0
+...     def runUpdate(self, webServiceConfig='prod.json', recordLimit=-1, ingest=None):
+...         FlakyManager.updates += 1
+...         if FlakyManager.failures > 0:
+...             FlakyManager.failures -= 1
+...             raise ConnectionError('connection reset')
+...         for record in list(self.action_index.records(SET, MATCH)):
+...             record.setCompleted()
+...         self.delete_numbers = []
+>>> cwd = os.getcwd()
+>>> os.chdir(tempfile.mkdtemp())
+>>> os.mkdir('drop')
+>>> daemon = Daemon('drop', newManager=lambda: FlakyManager(configFile=config), configFile=config, retrySeconds=0.01, maxAttempts=3)
+>>> sorted(os.listdir('drop'))
+['done', 'failed', 'work']
+
+Test picking up files
+---------------------
+A file is ready once it hasn't changed between two looks. Other files
+are left alone.
+>>> shutil.copy(os.path.join(test_dir, 'addlong.flat'), 'drop/adds.flat')
+'drop/adds.flat'
+>>> shutil.copy(os.path.join(test_dir, 'deletelong.lst'), 'drop/deletes.lst')
+'drop/deletes.lst'
+>>> _ = open('drop/notes.md', 'w').write('not a list')
+>>> daemon.scan()
+[]
+>>> daemon.scan()
+['adds.flat', 'deletes.lst']
+>>> _ = open('drop/deletes.lst', 'a').write('7777\n')
+>>> daemon.scan()
+['adds.flat']
+>>> daemon.scan()
+['adds.flat', 'deletes.lst']
+
+Test retrying leftover work
+---------------------------
+The first update fails, so its state is saved and the update is run again
+on the same manager after the backoff.
+>>> FlakyManager.failures = 1
+>>> out = io.StringIO()
+>>> with redirect_stdout(out):
+...     ran = daemon.runBatch(['adds.flat', 'deletes.lst'])
+>>> ran
+True
+>>> [line.split('] ')[-1] for line in out.getvalue().splitlines() if 'attempt' in line or 'left' in line or 'exception' in line]
+['an exception (connection reset) occured, saving state.', '8 request(s) left, retrying in 0 second(s)', 'update finished after 2 attempt(s)']
+>>> FlakyManager.updates, daemon.manager.getRemainingCount()
+(2, 0)
+
+The state saved by the failed update is removed once the work is done,
+and the files are moved to done/.
+>>> sorted(name for name in os.listdir('.') if name.startswith('oclc_update_'))
+['oclc_update_journal.jsonl']
+>>> os.listdir('drop/work')
+[]
+>>> sorted(name.split('_', 1)[1] for name in os.listdir('drop/done'))
+['adds.flat', 'deletes.lst']
+
+Each attempt writes the records it updated to the bib overlay, but a
+record already written isn't written again by the next attempt.
+>>> class PartialManager(RecordManager):
+...     def runUpdate(self, webServiceConfig='prod.json', recordLimit=-1, ingest=None):
+...         record = self.action_index.records(SET, MATCH)[0]
+...         record.updateOclcNumber('4242' + record.getOclcNumber())
+...         record.setCompleted()
+...         self.generateUpdatedSlimFlat('overlay.flat')
+>>> os.mkdir('drop2')
+>>> partial = Daemon('drop2', newManager=lambda: PartialManager(configFile=config), configFile=config, retrySeconds=0.01, maxAttempts=3)
+>>> shutil.copy(os.path.join(test_dir, 'testB.flat'), 'drop2/testB.flat')
+'drop2/testB.flat'
+>>> out = io.StringIO()
+>>> with redirect_stdout(out):
+...     ran = partial.runBatch(['testB.flat'])
+>>> [line.split('] ')[-1] for line in out.getvalue().splitlines() if 'attempt' in line]
+['update finished after 2 attempt(s)']
+>>> open('overlay.flat').read().count('*** DOCUMENT BOUNDARY ***')
+2
+
+Work that is still left after the last attempt is saved for the next start.
+>>> FlakyManager.failures = 3
+>>> FlakyManager.updates = 0
+>>> shutil.copy(os.path.join(test_dir, 'deletelong.lst'), 'drop/more.lst')
+'drop/more.lst'
+>>> with redirect_stdout(io.StringIO()):
+...     ran = daemon.runBatch(['more.lst'])
+>>> FlakyManager.updates, os.path.exists('oclc_update_deletes.json')
+(3, True)
+
+The next batch would save its state under the same names, so the saved
+work is recovered first. While it is still left the new files wait in
+the drop directory.
+>>> FlakyManager.failures = 3
+>>> FlakyManager.updates = 0
+>>> saved = open('oclc_update_deletes.json').read()
+>>> shutil.copy(os.path.join(test_dir, 'deletelong.lst'), 'drop/next.lst')
+'drop/next.lst'
+>>> out = io.StringIO()
+>>> with redirect_stdout(out):
+...     ran = daemon.runBatch(['next.lst'])
+>>> ran, FlakyManager.updates, open('oclc_update_deletes.json').read() == saved, os.path.exists('drop/next.lst')
+(False, 3, True, True)
+>>> [line.split('] ')[-1] for line in out.getvalue().splitlines() if 'wait' in line]
+['*warning, work of an earlier update is still left, next.lst will wait']
+
+Once the saved work is done the batch goes ahead.
+>>> FlakyManager.updates = 0
+>>> FlakyManager.failures = 0
+>>> out = io.StringIO()
+>>> with redirect_stdout(out):
+...     ran = daemon.runBatch(['next.lst'])
+>>> ran, FlakyManager.updates, os.path.exists('drop/next.lst')
+(True, 2, False)
+>>> [line.split('] ')[-1] for line in out.getvalue().splitlines() if 'recover' in line or 'attempt' in line]
+['recovering the saved state of the last update', 'update finished after 1 attempt(s)', 'update finished after 1 attempt(s)']
+
+Leave work for the next start again.
+>>> FlakyManager.failures = 3
+>>> shutil.copy(os.path.join(test_dir, 'deletelong.lst'), 'drop/last.lst')
+'drop/last.lst'
+>>> with redirect_stdout(io.StringIO()):
+...     ran = daemon.runBatch(['last.lst'])
+>>> ran, os.path.exists('oclc_update_deletes.json')
+(True, True)
+
+Test recovering at start
+------------------------
+The next daemon finishes the saved work before it looks for new files.
+The idle manager it started with is closed once the recovering manager
+takes over.
+>>> daemon = Daemon('drop', newManager=lambda: FlakyManager(configFile=config, ledgerDb='ledger.db'), configFile=config, retrySeconds=0.01)
+>>> idle = daemon.manager
+>>> out = io.StringIO()
+>>> with redirect_stdout(out):
+...     recovered = daemon.recover()
+>>> recovered is daemon.manager, idle.ledger, recovered.ledger is not None
+(True, None, True)
+>>> [line.split('] ')[-1] for line in out.getvalue().splitlines() if 'recover' in line or 'attempt' in line]
+['recovering the saved state of the last update', 'update finished after 1 attempt(s)']
+>>> os.path.exists('oclc_update_deletes.json')
+False
+>>> with redirect_stdout(io.StringIO()):
+...     recovered = daemon.recover()
+>>> print(recovered)
+None
+
+A list that can't be read is moved to failed/.
+>>> with open('drop/broken.flat', 'wb') as f:
+...     _ = f.write(b'\xff\xfe not utf-8')
+>>> with redirect_stdout(io.StringIO()):
+...     ran = daemon.runBatch(['broken.flat'])
+>>> [name.split('_', 1)[1] for name in os.listdir('drop/failed')]
+['broken.flat']
+
+The last manager's databases are closed with the daemon.
+>>> daemon.close()
+>>> print(daemon.manager.ledger)
+None
+>>> os.chdir(cwd)
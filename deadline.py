@@ -0,0 +1,108 @@
+###############################################################################
+#
+# Purpose: Stop sending requests in time to finish before a deadline.
+# Date:    Mon 19 Oct 2026
+# Copyright (c) 2026 Andrew Nisbet
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+import argparse
+import re
+from datetime import datetime, timedelta
+
+# Seconds before the deadline that new requests stop, to let the requests
+# in flight finish and the state be saved.
+DRAIN_SECONDS = 60.0
+RUNTIME_UNITS = {'s': 1, 'm': 60, 'h': 3600}
+
+class Deadline:
+    """
+    The time a run has to be finished by, like the end of a maintenance
+    window. New requests stop 'drainSeconds' before it.
+    """
+    def __init__(self, at:datetime, drainSeconds:float=DRAIN_SECONDS):
+        """
+        Constructor
+
+        Parameters:
+        - at time the run has to be finished by.
+        - drainSeconds seconds before 'at' that new requests stop.
+
+        Returns:
+        - Deadline object.
+        """
+        self.at = at
+        self.stop_at = at - timedelta(seconds=max(drainSeconds, 0.0))
+
+    def passed(self, now:datetime=None) -> bool:
+        """
+        Tests if it is too late to send new requests.
+
+        Parameters:
+        - now optional time to test, default the current time.
+
+        Returns:
+        - True if no more requests should be sent and False otherwise.
+        """
+        return (now or datetime.now()) >= self.stop_at
+
+    def __str__(self) -> str:
+        return self.at.strftime('%Y-%m-%d %H:%M:%S')
+
+def parseDeadline(text:str, now:datetime=None) -> datetime:
+    """
+    Reads a time of day like '06:30' from the command line. A time that has
+    already passed today is tomorrow, so an overnight run can be given the
+    end of its window.
+
+    Parameters:
+    - text 'HH:MM' in 24 hour time.
+    - now optional time the run starts, default the current time.
+
+    Returns:
+    - datetime of the next time it is 'HH:MM'.
+    """
+    try:
+        clock = datetime.strptime(text.strip(), '%H:%M')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected HH:MM like 06:30, got '{text}'")
+    now = now or datetime.now()
+    at = now.replace(hour=clock.hour, minute=clock.minute, second=0, microsecond=0)
+    if at <= now:
+        at += timedelta(days=1)
+    return at
+
+def parseRuntime(text:str) -> float:
+    """
+    Reads a run time like '90m', '2h', '1h30m' or '5400' (seconds) from the
+    command line.
+
+    Parameters:
+    - text the run time, a number of seconds or of h, m and s units.
+
+    Returns:
+    - The run time in seconds.
+    """
+    value = text.strip().lower()
+    if re.fullmatch(r'\d+(\.\d+)?', value):
+        return float(value)
+    parts = re.findall(r'(\d+(?:\.\d+)?)([hms])', value)
+    if not parts or ''.join(number + unit for (number, unit) in parts) != value:
+        raise argparse.ArgumentTypeError(f"expected a run time like 90m, 2h, 1h30m or 5400, got '{text}'")
+    return sum(float(number) * RUNTIME_UNITS[unit] for (number, unit) in parts)
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    doctest.testfile("deadline.tst")
@@ -0,0 +1,38 @@
+Tests for run deadlines
+=======================
+
+>>> from datetime import datetime
+>>> from deadline import Deadline, parseDeadline, parseRuntime
+
+Test reading a deadline
+-----------------------
+A time later today is today, and one that has passed is tomorrow.
+>>> evening = datetime(2026, 10, 19, 22, 15)
+>>> print(parseDeadline('23:45', now=evening))
+2026-10-19 23:45:00
+>>> print(parseDeadline('06:30', now=evening))
+2026-10-20 06:30:00
+>>> parseDeadline('6:30pm')
+Traceback (most recent call last):
+...
+argparse.ArgumentTypeError: expected HH:MM like 06:30, got '6:30pm'
+
+Test reading a run time
+-----------------------
+>>> [parseRuntime(text) for text in ['5400', '90m', '2h', '1h30m', '45s', '1.5h']]
+[5400.0, 5400.0, 7200.0, 5400.0, 45.0, 5400.0]
+>>> parseRuntime('90 minutes')
+Traceback (most recent call last):
+...
+argparse.ArgumentTypeError: expected a run time like 90m, 2h, 1h30m or 5400, got '90 minutes'
+
+Test when requests stop
+-----------------------
+New requests stop the drain time before the deadline.
+>>> deadline = Deadline(datetime(2026, 10, 20, 6, 30), drainSeconds=120)
+>>> str(deadline)
+'2026-10-20 06:30:00'
+>>> deadline.passed(now=datetime(2026, 10, 20, 6, 27, 59))
+False
+>>> deadline.passed(now=datetime(2026, 10, 20, 6, 28))
+True
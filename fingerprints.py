@@ -0,0 +1,109 @@
+###############################################################################
+#
+# Purpose: Remember what was sent to OCLC for each bib between runs.
+# Date:    Mon 19 Oct 2026
+# Copyright (c) 2026 Andrew Nisbet
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+from datetime import datetime
+import sqlite3
+
+class FingerprintStore:
+    """
+    Persistent fingerprint per TCN, saved in SQLite. A fingerprint is the
+    Record's content hash (see Record.getFingerprint()) and the OCLC number
+    the bib was last successfully sent with. Comparing a new bib dump against
+    the store finds the new and changed records and the TCNs that vanished.
+    """
+    def __init__(self, fileName:str):
+        """
+        Constructor, creates the database if it doesn't exist.
+
+        Parameters:
+        - fileName of the SQLite database.
+
+        Returns:
+        - FingerprintStore object.
+        """
+        self.file_name = fileName
+        self.db = sqlite3.connect(fileName)
+        self.db.execute("CREATE TABLE IF NOT EXISTS fingerprints (tcn TEXT PRIMARY KEY, fingerprint TEXT, oclc_number TEXT, updated TEXT)")
+        self.db.commit()
+
+    def get(self, tcn:str) -> tuple:
+        """
+        Gets the stored fingerprint of a TCN.
+
+        Parameters:
+        - tcn title control number.
+
+        Returns:
+        - tuple of (fingerprint, OCLC number), or None if the TCN isn't stored.
+        """
+        return self.db.execute("SELECT fingerprint, oclc_number FROM fingerprints WHERE tcn = ?", (tcn,)).fetchone()
+
+    def load(self) -> dict:
+        """
+        Loads all the fingerprints at once for comparing against a full dump.
+
+        Parameters:
+        - None
+
+        Returns:
+        - dictionary of TCN: (fingerprint, OCLC number).
+        """
+        return {row[0]: (row[1], row[2]) for row in self.db.execute("SELECT tcn, fingerprint, oclc_number FROM fingerprints")}
+
+    def put(self, tcn:str, fingerprint:str, oclcNumber:str):
+        """
+        Saves the fingerprint of a record that OCLC now agrees with.
+
+        Parameters:
+        - tcn title control number.
+        - fingerprint content hash of the record.
+        - oclcNumber the record was confirmed with.
+
+        Returns:
+        - None
+        """
+        self.db.execute("INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?)",
+            (tcn, fingerprint, oclcNumber, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+    def remove(self, tcn:str):
+        """
+        Forgets a TCN, for example once it has vanished from the ILS.
+
+        Parameters:
+        - tcn title control number.
+
+        Returns:
+        - None
+        """
+        self.db.execute("DELETE FROM fingerprints WHERE tcn = ?", (tcn,))
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0]
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    doctest.testfile("fingerprints.tst")
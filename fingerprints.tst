@@ -0,0 +1,22 @@
+Tests for FingerprintStore
+==========================
+
+>>> from fingerprints import FingerprintStore
+>>> import os
+>>> store = FingerprintStore('test_fingerprints.db')
+>>> store.put('ocn779882439', 'abc', '779882439')
+>>> store.put('ocn782078599', 'def', '')
+>>> store.get('ocn779882439')
+('abc', '779882439')
+>>> store.get('missing') is None
+True
+>>> store.put('ocn779882439', 'ghi', '1111')
+>>> sorted(store.load().items())
+[('ocn779882439', ('ghi', '1111')), ('ocn782078599', ('def', ''))]
+>>> store.remove('ocn782078599')
+>>> store.close()
+>>> store = FingerprintStore('test_fingerprints.db')
+>>> len(store)
+1
+>>> store.close()
+>>> os.unlink('test_fingerprints.db')
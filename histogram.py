@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+###############################################################################
+#
+# Purpose: Log-bucketed latency histograms of the requests sent to OCLC.
+# Date:    Mon 19 Oct 2026
+# Copyright (c) 2026 Andrew Nisbet
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+import argparse
+import json
+import math
+import sys
+import threading
+from os.path import exists
+from checkpoint import writeAtomic
+
+VERSION='1.00.00'
+
+# Buckets per doubling of latency. Four keeps percentiles within about 19%
+# of the true value with a few dozen buckets from milliseconds to minutes.
+BUCKETS_PER_DOUBLING = 4
+# Latencies below this many milliseconds share the lowest bucket.
+MIN_MS = 0.01
+
+class LatencyHistogram:
+    """
+    Counts of latencies in buckets that grow by a constant factor, so the
+    histogram stays small however many requests are recorded, and two
+    histograms can be merged by adding their counts.
+    """
+    def __init__(self):
+        """
+        Constructor
+
+        Parameters:
+        - None
+
+        Returns:
+        - LatencyHistogram object.
+        """
+        # bucket index: count.
+        self.buckets = {}
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    @staticmethod
+    def bucketOf(ms:float) -> int:
+        return math.floor(math.log2(max(ms, MIN_MS)) * BUCKETS_PER_DOUBLING)
+
+    @staticmethod
+    def upperBound(bucket:int) -> float:
+        return 2.0 ** ((bucket + 1) / BUCKETS_PER_DOUBLING)
+
+    def record(self, ms:float):
+        """
+        Adds a latency.
+
+        Parameters:
+        - ms latency in milliseconds.
+
+        Returns:
+        - None
+        """
+        bucket = self.bucketOf(ms)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.sum_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def merge(self, other:'LatencyHistogram'):
+        """
+        Adds another histogram's counts to this one.
+
+        Parameters:
+        - other LatencyHistogram, like one saved by an earlier run.
+
+        Returns:
+        - None
+        """
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += other.count
+        self.sum_ms += other.sum_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    def percentile(self, percent:float) -> float:
+        """
+        Estimates a percentile as the upper bound of the bucket it falls in.
+
+        Parameters:
+        - percent like 50, 90 or 99.
+
+        Returns:
+        - Latency in milliseconds, never more than the largest recorded,
+          or 0.0 if nothing has been recorded.
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * percent / 100.0))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.upperBound(bucket), self.max_ms)
+        return self.max_ms
+
+    def mean(self) -> float:
+        return self.sum_ms / self.count if self.count else 0.0
+
+    def toDict(self) -> dict:
+        return {'count': self.count, 'sum_ms': self.sum_ms, 'max_ms': self.max_ms,
+            'buckets': {str(bucket): count for bucket, count in sorted(self.buckets.items())}}
+
+    @staticmethod
+    def fromDict(data:dict) -> 'LatencyHistogram':
+        histogram = LatencyHistogram()
+        histogram.buckets = {int(bucket): count for bucket, count in data.get('buckets', {}).items()}
+        histogram.count = data.get('count', 0)
+        histogram.sum_ms = data.get('sum_ms', 0.0)
+        histogram.max_ms = data.get('max_ms', 0.0)
+        return histogram
+
+class LatencyHistograms:
+    """
+    A LatencyHistogram for each endpoint. Requests may be recorded from
+    several threads, so changes are made under a lock.
+    """
+    def __init__(self):
+        """
+        Constructor
+
+        Parameters:
+        - None
+
+        Returns:
+        - LatencyHistograms object.
+        """
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def record(self, endpoint:str, ms:float):
+        """
+        Adds a latency to an endpoint's histogram.
+
+        Parameters:
+        - endpoint like 'set' or 'oauth'.
+        - ms latency in milliseconds.
+
+        Returns:
+        - None
+        """
+        with self.lock:
+            histogram = self.histograms.get(endpoint)
+            if histogram is None:
+                histogram = self.histograms[endpoint] = LatencyHistogram()
+            histogram.record(ms)
+
+    def merge(self, other:'LatencyHistograms'):
+        with self.lock:
+            for endpoint, histogram in other.histograms.items():
+                self.histograms.setdefault(endpoint, LatencyHistogram()).merge(histogram)
+
+    def clear(self):
+        with self.lock:
+            self.histograms = {}
+
+    def report(self) -> list:
+        """
+        Formats the percentiles of each endpoint as a table.
+
+        Parameters:
+        - None
+
+        Returns:
+        - list of lines, empty if nothing was recorded.
+        """
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+        if not histograms:
+            return []
+        lines = [f"{'endpoint':<10}{'requests':>10}{'mean ms':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+        for endpoint, histogram in histograms:
+            lines.append(f"{endpoint:<10}{histogram.count:>10}{histogram.mean():>10.1f}{histogram.percentile(50):>10.1f}"
+                f"{histogram.percentile(90):>10.1f}{histogram.percentile(99):>10.1f}{histogram.max_ms:>10.1f}")
+        return lines
+
+    def toDict(self) -> dict:
+        with self.lock:
+            return {endpoint: histogram.toDict() for endpoint, histogram in sorted(self.histograms.items())}
+
+    @staticmethod
+    def fromDict(data:dict) -> 'LatencyHistograms':
+        histograms = LatencyHistograms()
+        histograms.histograms = {endpoint: LatencyHistogram.fromDict(histogram) for endpoint, histogram in data.items()}
+        return histograms
+
+    @staticmethod
+    def load(fileName:str) -> 'LatencyHistograms':
+        """
+        Reads histograms saved with save().
+
+        Parameters:
+        - fileName of the JSON file.
+
+        Returns:
+        - LatencyHistograms, empty if the file doesn't exist.
+        """
+        if not exists(fileName):
+            return LatencyHistograms()
+        with open(fileName, encoding='utf-8') as f:
+            return LatencyHistograms.fromDict(json.load(f))
+
+    def save(self, fileName:str, merge:bool=True):
+        """
+        Writes the histograms to a JSON file.
+
+        Parameters:
+        - fileName of the JSON file.
+        - merge True to add the histograms already in the file, so the
+          file accumulates the latencies of every run.
+
+        Returns:
+        - None
+        """
+        histograms = LatencyHistograms.load(fileName) if merge else LatencyHistograms()
+        histograms.merge(self)
+        writeAtomic(fileName, json.dumps(histograms.toDict(), indent=2))
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog = 'histogram',
+        usage='%(prog)s [options] latency.json [latency.json ...]' ,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description='''\
+            Reports the request latency percentiles saved by oclc4.py --latency-file,
+            merging the files given.
+            ''',
+    )
+    parser.add_argument('files', nargs='+', help='JSON latency histogram files.')
+    parser.add_argument('--version', action='version', version='%(prog)s ' + VERSION)
+    args = parser.parse_args(argv)
+    histograms = LatencyHistograms()
+    for file_name in args.files:
+        histograms.merge(LatencyHistograms.load(file_name))
+    for line in histograms.report():
+        print(line)
+    return 0
+
+if __name__ == "__main__":
+    if len(sys.argv) == 1:
+        import doctest
+        doctest.testmod()
+        doctest.testfile("histogram.tst")
+    else:
+        sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,56 @@
+Tests for latency histograms
+============================
+
+>>> import os
+>>> from histogram import LatencyHistogram, LatencyHistograms
+
+Test buckets and percentiles
+----------------------------
+Buckets grow by 2**(1/4), so 100ms and 105ms share a bucket.
+>>> LatencyHistogram.bucketOf(100.0) == LatencyHistogram.bucketOf(105.0)
+True
+>>> LatencyHistogram.bucketOf(100.0) < LatencyHistogram.bucketOf(200.0)
+True
+>>> LatencyHistogram().percentile(50)
+0.0
+>>> histogram = LatencyHistogram()
+>>> for ms in [100.0] * 90 + [1000.0] * 9 + [5000.0]:
+...     histogram.record(ms)
+>>> histogram.count
+100
+>>> histogram.percentile(50) >= 100.0 and histogram.percentile(50) < 120.0
+True
+>>> histogram.percentile(99) >= 1000.0 and histogram.percentile(99) < 1200.0
+True
+
+Percentiles never exceed the slowest request.
+>>> histogram.percentile(100)
+5000.0
+>>> round(histogram.mean(), 1)
+230.0
+
+Test merging and saving
+-----------------------
+>>> other = LatencyHistogram.fromDict(histogram.toDict())
+>>> other.record(9000.0)
+>>> histogram.merge(other)
+>>> (histogram.count, histogram.max_ms)
+(201, 9000.0)
+
+Saving merges with the histograms already in the file.
+>>> latencies = LatencyHistograms()
+>>> latencies.record('set', 150.0)
+>>> latencies.record('set', 250.0)
+>>> latencies.record('oauth', 400.0)
+>>> latencies.save('test_latency.json')
+>>> latencies.save('test_latency.json')
+>>> saved = LatencyHistograms.load('test_latency.json')
+>>> {endpoint: histogram.count for endpoint, histogram in saved.histograms.items()}
+{'oauth': 2, 'set': 4}
+>>> [line.split()[0] for line in saved.report()]
+['endpoint', 'oauth', 'set']
+>>> os.unlink('test_latency.json')
+>>> LatencyHistograms().report()
+[]
+>>> LatencyHistograms.load('test_latency.json').histograms
+{}
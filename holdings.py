@@ -0,0 +1,355 @@
+###############################################################################
+#
+# Purpose: Compact index of a library's OCLC holdings.
+# Date:    Mon 19 Oct 2026
+# Copyright (c) 2026 Andrew Nisbet
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from heapq import merge
+import sqlite3
+from os.path import abspath
+from urllib.request import pathname2url
+
+# Largest number a 64-bit array entry holds.
+MAX_OCLC_INT = 2**63 - 1
+
+def toOclcInt(oclcNumber) -> int:
+    """
+    Converts an OCLC number to an integer key. Only plain ASCII digits are
+    accepted, not the signs, spaces and underscores int() allows, and the
+    number has to fit in 64 bits.
+
+    Parameters:
+    - OCLC number as a string of digits, or an integer.
+
+    Returns:
+    - Integer version of the number, or None if it isn't a number.
+    """
+    if isinstance(oclcNumber, int):
+        key = oclcNumber
+    elif isinstance(oclcNumber, str) and oclcNumber.isascii() and oclcNumber.isdigit():
+        key = int(oclcNumber)
+    else:
+        return None
+    if key < 0 or key > MAX_OCLC_INT:
+        return None
+    return key
+
+class HoldingsIndex:
+    """
+    OCLC holdings stored as a sorted, de-duplicated array of 64-bit
+    integers. A holding costs 8 bytes instead of a str object and a
+    list slot, and membership is answered by binary search, or by a
+    single merge pass for a batch of numbers with intersection().
+    Numbers added or removed one at a time are kept aside and merged
+    into the array in one pass the next time all of it is read.
+    """
+    def __init__(self, oclcNumbers=None):
+        """
+        Constructor
+
+        Parameters:
+        - Optional iterable of OCLC numbers as strings or integers.
+
+        Returns:
+        - HoldingsIndex object.
+        """
+        self.numbers = array('q')
+        # Numbers added and removed since the array was last merged.
+        self.added = set()
+        self.removed = set()
+        if oclcNumbers:
+            self.extend(oclcNumbers)
+
+    def _merge_(self):
+        # One pass over the array, rather than an insert or delete per number.
+        if not self.added and not self.removed:
+            return
+        numbers = array('q')
+        last = None
+        for key in merge(self.numbers, sorted(self.added)):
+            if key != last and key not in self.removed:
+                numbers.append(key)
+            last = key
+        self.numbers = numbers
+        self.added = set()
+        self.removed = set()
+
+    def extend(self, oclcNumbers):
+        """
+        Adds OCLC numbers to the index. Anything that isn't a number is skipped.
+
+        Parameters:
+        - Iterable of OCLC numbers as strings or integers.
+
+        Returns:
+        - None
+        """
+        new_numbers = array('q')
+        for oclc_number in oclcNumbers:
+            key = toOclcInt(oclc_number)
+            if key is not None:
+                new_numbers.append(key)
+        if not new_numbers:
+            return
+        self._merge_()
+        if self.numbers:
+            new_numbers.extend(self.numbers)
+        self.numbers = array('q', sorted(set(new_numbers)))
+
+    def add(self, oclcNumber):
+        """
+        Adds a single OCLC number to the index.
+
+        Parameters:
+        - OCLC number as a string or integer.
+
+        Returns:
+        - None
+        """
+        key = toOclcInt(oclcNumber)
+        if key is None:
+            return
+        self.removed.discard(key)
+        self.added.add(key)
+
+    def remove(self, oclcNumber):
+        """
+        Removes a single OCLC number from the index if it is there.
+
+        Parameters:
+        - OCLC number as a string or integer.
+
+        Returns:
+        - None
+        """
+        key = toOclcInt(oclcNumber)
+        if key is None:
+            return
+        self.added.discard(key)
+        self.removed.add(key)
+
+    def intersection(self, oclcNumbers) -> set:
+        """
+        Batch membership test. The query numbers are sorted once and
+        walked against the index, each search starting where the last
+        one stopped.
+
+        Parameters:
+        - Iterable of OCLC numbers as strings or integers.
+
+        Returns:
+        - Set of the given OCLC numbers, as given, that are holdings.
+        """
+        keys = {}
+        for oclc_number in oclcNumbers:
+            key = toOclcInt(oclc_number)
+            if key is not None:
+                keys.setdefault(key, []).append(oclc_number)
+        self._merge_()
+        found = set()
+        lo = 0
+        hi = len(self.numbers)
+        for key in sorted(keys):
+            lo = bisect_left(self.numbers, key, lo, hi)
+            if lo == hi:
+                break
+            if self.numbers[lo] == key:
+                found.update(keys[key])
+        return found
+
+    def __contains__(self, oclcNumber) -> bool:
+        key = toOclcInt(oclcNumber)
+        if key is None:
+            return False
+        if key in self.added:
+            return True
+        if key in self.removed:
+            return False
+        i = bisect_left(self.numbers, key)
+        return i < len(self.numbers) and self.numbers[i] == key
+
+    def __len__(self) -> int:
+        self._merge_()
+        return len(self.numbers)
+
+    def __iter__(self):
+        self._merge_()
+        return iter(self.numbers)
+
+    def __sizeof__(self) -> int:
+        self._merge_()
+        return object.__sizeof__(self) + self.numbers.__sizeof__()
+
+class HoldingsStore:
+    """
+    Local on-disk mirror of a library's OCLC holdings kept in SQLite.
+    It is seeded from a holdings report and then kept up to date with the
+    holdings set, unset and renumbered during each run, so lists can be
+    normalized against it without waiting for a new report.
+    A store opened read-only, as by the processes of a sharded run that
+    share it, ignores changes.
+    """
+    def __init__(self, fileName:str, commitEvery:int=1000, readOnly:bool=False):
+        """
+        Constructor, creates the database if it doesn't exist.
+
+        Parameters:
+        - fileName of the SQLite database.
+        - commitEvery number of changes between commits.
+        - readOnly open an existing database for reading only.
+
+        Returns:
+        - HoldingsStore object.
+        """
+        self.file_name = fileName
+        self.commit_every = commitEvery
+        self.read_only = readOnly
+        self.changes = 0
+        if readOnly:
+            self.db = sqlite3.connect(f"file:{pathname2url(abspath(fileName))}?mode=ro", uri=True)
+            return
+        self.db = sqlite3.connect(fileName)
+        self.db.execute("CREATE TABLE IF NOT EXISTS holdings (oclc_number INTEGER PRIMARY KEY, source TEXT, updated TEXT)")
+        self.db.commit()
+
+    def _now_(self) -> str:
+        return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def _changed_(self):
+        self.changes += 1
+        if self.changes >= self.commit_every:
+            self.commit()
+
+    def seed(self, oclcNumbers, source:str='report') -> int:
+        """
+        Replaces the contents of the store with the numbers from a new
+        holdings report.
+
+        Parameters:
+        - Iterable of OCLC numbers as strings or integers.
+        - source label saved with each number.
+
+        Returns:
+        - Number of holdings in the store.
+        """
+        if self.read_only:
+            return len(self)
+        now = self._now_()
+        self.db.execute("DELETE FROM holdings")
+        rows = ((key, source, now) for key in map(toOclcInt, oclcNumbers) if key is not None)
+        self.db.executemany("INSERT OR IGNORE INTO holdings VALUES (?, ?, ?)", rows)
+        self.commit()
+        return len(self)
+
+    def seedFromList(self, fileName:str) -> int:
+        """
+        Seeds the store from a file of OCLC numbers one-per-line, as
+        written by report.py's reportToList().
+
+        Parameters:
+        - fileName of the list of OCLC numbers.
+
+        Returns:
+        - Number of holdings in the store.
+        """
+        with open(fileName, 'rt') as f:
+            return self.seed(line.strip() for line in f)
+
+    def add(self, oclcNumber, source:str='set'):
+        """
+        Records a holding that was set.
+
+        Parameters:
+        - OCLC number as a string or integer.
+        - source label, like 'set'.
+
+        Returns:
+        - None
+        """
+        key = toOclcInt(oclcNumber)
+        if key is None or self.read_only:
+            return
+        self.db.execute("INSERT OR REPLACE INTO holdings VALUES (?, ?, ?)", (key, source, self._now_()))
+        self._changed_()
+
+    def remove(self, oclcNumber):
+        """
+        Removes a holding that was unset.
+
+        Parameters:
+        - OCLC number as a string or integer.
+
+        Returns:
+        - None
+        """
+        key = toOclcInt(oclcNumber)
+        if key is None or self.read_only:
+            return
+        self.db.execute("DELETE FROM holdings WHERE oclc_number = ?", (key,))
+        self._changed_()
+
+    def replace(self, oldNumber, newNumber):
+        """
+        Records that OCLC moved a holding to a new control number.
+
+        Parameters:
+        - The OCLC number that was requested.
+        - The control number OCLC set the holding on.
+
+        Returns:
+        - None
+        """
+        self.remove(oldNumber)
+        self.add(newNumber, source='updated')
+
+    def toIndex(self) -> HoldingsIndex:
+        """
+        Loads the stored holdings into a HoldingsIndex.
+
+        Parameters:
+        - None
+
+        Returns:
+        - HoldingsIndex of all the stored holdings.
+        """
+        index = HoldingsIndex()
+        index.numbers = array('q', (row[0] for row in self.db.execute("SELECT oclc_number FROM holdings ORDER BY oclc_number")))
+        return index
+
+    def commit(self):
+        self.db.commit()
+        self.changes = 0
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+    def __contains__(self, oclcNumber) -> bool:
+        key = toOclcInt(oclcNumber)
+        if key is None:
+            return False
+        return self.db.execute("SELECT 1 FROM holdings WHERE oclc_number = ?", (key,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM holdings").fetchone()[0]
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    doctest.testfile("holdings.tst")
@@ -0,0 +1,116 @@
+Tests for HoldingsIndex
+=======================
+
+>>> from holdings import HoldingsIndex, toOclcInt
+
+Test toOclcInt
+--------------
+>>> toOclcInt('1234')
+1234
+>>> toOclcInt('0000')
+0
+>>> toOclcInt('ocm1234') is None
+True
+
+Only plain digits that fit in 64 bits are numbers.
+>>> [toOclcInt(text) for text in ('1_000', ' 12 ', '-5', '+5', '\u0661\u0662', '', None)]
+[None, None, None, None, None, None, None]
+>>> toOclcInt(str(2**63 - 1)), toOclcInt(str(2**63)), toOclcInt(2**63), toOclcInt(-1)
+(9223372036854775807, None, None, None)
+
+Test building an index
+----------------------
+Numbers are de-duplicated, sorted and anything that isn't a number is skipped.
+>>> index = HoldingsIndex(['5555', '1111', '3333', '1111', 'abc'])
+>>> len(index)
+3
+>>> list(index)
+[1111, 3333, 5555]
+>>> '3333' in index
+True
+>>> '4444' in index
+False
+>>> 'abc' in index
+False
+>>> bool(HoldingsIndex())
+False
+
+Test extend
+-----------
+>>> index.extend(['4444', '1111'])
+>>> list(index)
+[1111, 3333, 4444, 5555]
+
+Test add and remove
+-------------------
+>>> index.add('2222')
+>>> index.add('2222')
+>>> index.remove('5555')
+>>> index.remove('9999')
+>>> list(index)
+[1111, 2222, 3333, 4444]
+
+Single changes are kept aside until the whole index is read, and answer
+membership tests in the meantime.
+>>> index.add('6666')
+>>> index.remove('1111')
+>>> list(index.numbers)
+[1111, 2222, 3333, 4444]
+>>> '6666' in index, '1111' in index, '2222' in index
+(True, False, True)
+>>> index.add('1111')
+>>> index.remove('6666')
+>>> index.add('0000')
+>>> len(index)
+5
+>>> list(index.numbers)
+[0, 1111, 2222, 3333, 4444]
+
+Test intersection
+-----------------
+The numbers are returned as they were given, leading zeros and all.
+>>> index = HoldingsIndex(['0000', '4444', '5555', '3333'])
+>>> sorted(index.intersection(['0000', '6666', '3333', '3333', 'xyz', '5555']))
+['0000', '3333', '5555']
+>>> HoldingsIndex().intersection(['1111'])
+set()
+
+Tests for HoldingsStore
+=======================
+
+>>> from holdings import HoldingsStore
+>>> import os
+>>> store = HoldingsStore('test_holdings.db')
+>>> store.seed(['0000', '4444', '5555', '3333', 'abc'])
+4
+>>> store.add('6666')
+>>> store.remove('4444')
+>>> store.replace('5555', '7777')
+>>> list(store.toIndex())
+[0, 3333, 6666, 7777]
+>>> '6666' in store
+True
+>>> '5555' in store
+False
+
+Seeding again replaces the contents with the new report.
+>>> store.seedFromList('test/del01.lst')
+2
+>>> store.close()
+>>> store = HoldingsStore('test_holdings.db')
+>>> list(store.toIndex())
+[177677, 12345678]
+>>> store.close()
+
+A store opened read-only, like the shards of a run share, ignores changes.
+>>> store = HoldingsStore('test_holdings.db', readOnly=True)
+>>> store.add('6666')
+>>> store.remove('177677')
+>>> store.seed(['1111'])
+2
+>>> store.close()
+>>> store = HoldingsStore('test_holdings.db')
+>>> list(store.toIndex())
+[177677, 12345678]
+>>> store.close()
+>>> os.unlink('test_holdings.db')
@@ -0,0 +1,185 @@
+###############################################################################
+#
+# Purpose: Read and normalize add records while the update is running.
+# Date:    Mon 19 Oct 2026
+# Copyright (c) 2026 Andrew Nisbet
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+import queue
+import sys
+import threading
+from os.path import exists
+from logit import logit
+
+# Records parsed ahead of the update before the reader waits.
+QUEUE_SIZE = 1000
+# Seconds the reader waits for room in the queue before checking if it should stop.
+PUT_SECONDS = 0.1
+# Marks the end of the records.
+_END = object()
+
+class Ingest:
+    """
+    Streams the add records into an update. A reader thread parses records
+    from the flat or mrk file into a bounded queue, and poll() normalizes
+    them on the calling thread against the holdings and deletes that were
+    loaded first, so the first set request can be sent as soon as the first
+    record is read. The queue bounds memory if OCLC is slower than the file.
+
+    An add cancels a delete of the same number, so the delete list is only
+    final, and can only be sent, once every record has been read.
+    """
+    def __init__(self, manager, fileName:str, recordLimit:int=-1, queueSize:int=QUEUE_SIZE):
+        """
+        Constructor
+
+        Parameters:
+        - manager RecordManager with the deletes and holdings already read.
+        - fileName of the flat, mrk or zip file of add records.
+        - recordLimit maximum records to read, -1 for all. As with
+          normalizeLists() the limit applies to the adds and deletes.
+        - queueSize maximum records parsed ahead.
+
+        Returns:
+        - Ingest object.
+        """
+        self.manager = manager
+        self.file_name = fileName
+        self.record_limit = recordLimit
+        self.records = queue.Queue(maxsize=queueSize)
+        self.stopping = threading.Event()
+        self.thread = None
+        self.error = None
+        self.done = False
+        self.count = 0
+        self.add_numbers = set()
+        self.accepted_deletes = []
+        self.delete_set = set()
+        self.delete_count = 0
+
+    def start(self):
+        """
+        Normalizes the deletes and starts reading the add records.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        if not exists(self.file_name):
+            logit(f"**error, {self.file_name} is either missing or empty.")
+            sys.exit(1)
+        self.accepted_deletes = self.manager._normalizeDeletes_(self.record_limit)
+        self.delete_set = set(self.accepted_deletes)
+        # Until every record is read only the deletes accepted so far are known.
+        self.manager.delete_numbers = self.deletes()
+        self.thread = threading.Thread(target=self._read_, name='ingest', daemon=True)
+        self.thread.start()
+
+    def _read_(self):
+        try:
+            shard = self.manager.shard
+            for record in self.manager.iterFlatOrMrkRecords(self.file_name):
+                if shard is not None and not shard.ownsRecord(record):
+                    continue
+                if not self._put_(record):
+                    return
+        except Exception as e:
+            self.error = e
+        self._put_(_END)
+
+    def _put_(self, item) -> bool:
+        while not self.stopping.is_set():
+            try:
+                self.records.put(item, timeout=PUT_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def deletes(self) -> list:
+        """
+        Returns:
+        - The accepted deletes that no add read so far has cancelled, in order.
+        """
+        return [oclc_number for oclc_number in self.accepted_deletes if oclc_number in self.delete_set]
+
+    def poll(self, timeout:float=0.0) -> list:
+        """
+        Adds the records read since the last call to the manager and
+        normalizes them.
+
+        Parameters:
+        - timeout seconds to wait for the first record, 0 to return at once.
+
+        Returns:
+        - list of the new Records, empty if none were ready.
+        """
+        new_records = []
+        if self.done:
+            return new_records
+        block = timeout > 0
+        while True:
+            try:
+                record = self.records.get(block=block, timeout=timeout if block else None)
+            except queue.Empty:
+                break
+            block = False
+            if record is _END:
+                self._finish_()
+                break
+            self.manager._addRecord_(record)
+            deletes = len(self.delete_set)
+            self.manager._normalizeAdd_(record, self.manager.oclc_holdings, self.add_numbers, self.delete_set)
+            if len(self.delete_set) != deletes:
+                # Checkpoints mustn't save a delete an add has cancelled.
+                self.manager.delete_numbers = self.deletes()
+            new_records.append(record)
+            if self.count == self.record_limit:
+                self._finish_()
+                break
+            self.count += 1
+        return new_records
+
+    def _finish_(self):
+        self.stop()
+        self.manager.delete_numbers = self.deletes()
+        self.delete_count = len(self.manager.delete_numbers)
+        self.done = True
+        if self.error is not None:
+            logit(f"**error reading {self.file_name}, only {len(self.manager.add_records)} record(s) read:\n{self.error}")
+        else:
+            logit(f"read {len(self.manager.add_records)} add record(s) from {self.file_name}")
+        self.manager._showState_()
+
+    def stop(self):
+        """
+        Stops the reader thread and waits for it.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        self.stopping.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    doctest.testfile("ingest.tst")
@@ -0,0 +1,78 @@
+Tests for streaming add records
+===============================
+
+>>> from ingest import Ingest
+>>> from oclc4 import RecordManager
+>>> from holdings import HoldingsIndex
+
+Test reading and normalizing as records arrive
+----------------------------------------------
+The deletes are normalized when the ingest starts, and each add as it is
+read. test/addlong.flat has five records: 1111, 2222, one without a number,
+3333 and 1111 again.
+>>> manager = RecordManager()
+>>> manager.delete_numbers = ['0000', '3333', '4444']
+>>> ingest = Ingest(manager, 'test/addlong.flat')
+>>> ingest.start()
+>>> manager.delete_numbers
+['4444', '3333', '0000']
+>>> records = []
+>>> while not ingest.done:
+...     records.extend(ingest.poll(timeout=1.0))
+read 5 add record(s) from test/addlong.flat
+2 delete record(s)
+2 add record(s)
+1 record(s) to check
+2 rejected record(s)
+3333: previously requested as a delete; ignoring
+1111: duplicate add request
+>>> [(r.getAction(), r.getOclcNumber()) for r in records]
+[('set', '1111'), ('set', '2222'), ('match', ''), ('ignore', '3333'), ('ignore', '1111')]
+>>> len(manager.add_records)
+5
+
+The add of 3333 cancelled its delete.
+>>> manager.delete_numbers
+['4444', '0000']
+>>> ingest.delete_count
+2
+>>> ingest.poll()
+[]
+
+Records OCLC already holds are ignored.
+>>> manager = RecordManager()
+>>> manager.oclc_holdings = HoldingsIndex(['2222'])
+>>> ingest = Ingest(manager, 'test/addlong.flat')
+>>> ingest.start()
+>>> records = []
+>>> while not ingest.done:
+...     records.extend(ingest.poll(timeout=1.0))
+read 5 add record(s) from test/addlong.flat
+0 delete record(s)
+2 add record(s)
+1 record(s) to check
+2 rejected record(s)
+2222: already a holding
+1111: duplicate add request
+>>> [r.getAction() for r in records]
+['set', 'ignore', 'match', 'set', 'ignore']
+
+Test a record limit
+-------------------
+As with normalizeLists() the limit counts from zero, and the reader stops
+once it is reached.
+>>> manager = RecordManager()
+>>> ingest = Ingest(manager, 'test/addlong.flat', recordLimit=1, queueSize=1)
+>>> ingest.start()
+>>> records = []
+>>> while not ingest.done:
+...     records.extend(ingest.poll(timeout=1.0))
+read 2 add record(s) from test/addlong.flat
+0 delete record(s)
+2 add record(s)
+0 record(s) to check
+0 rejected record(s)
+>>> [r.getOclcNumber() for r in records]
+['1111', '2222']
+>>> ingest.thread.is_alive()
+False
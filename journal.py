@@ -0,0 +1,145 @@
+###############################################################################
+#
+# Purpose: Append-only journal of the outcome of each OCLC request.
+# Date:    Mon 19 Oct 2026
+# Copyright (c) 2026 Andrew Nisbet
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+import json
+import os
+from os.path import exists
+from time import monotonic
+from datetime import datetime
+
+# Journal operations.
+SET_OP    = 'set'
+UNSET_OP  = 'unset'
+MATCH_OP  = 'match'
+NEWBIB_OP = 'newbib'
+LBD_OP    = 'lbd'
+# A record was written to the bib overlay.
+OVERLAY_OP = 'overlay'
+
+class Journal:
+    """
+    Write-ahead journal of per-record outcomes. Each outcome is appended as
+    one line of JSON and flushed straight away, so it survives the process
+    being killed, and the file is fsync-ed every 'syncEvery' entries or
+    'syncSeconds' seconds so it also survives a power loss. Replaying the
+    journal over the original input resumes where processing stopped.
+    """
+    def __init__(self, fileName:str, append:bool=False, syncEvery:int=100, syncSeconds:float=5.0):
+        """
+        Constructor, opens the journal file.
+
+        Parameters:
+        - fileName of the journal.
+        - append to an existing journal if True, and start a new one otherwise.
+        - syncEvery number of entries between fsyncs.
+        - syncSeconds maximum seconds between fsyncs.
+
+        Returns:
+        - Journal object.
+        """
+        self.file_name = fileName
+        self.sync_every = syncEvery
+        self.sync_seconds = syncSeconds
+        self.unsynced = 0
+        self.last_sync = monotonic()
+        self.fp = open(fileName, mode='at' if append else 'wt', encoding='utf-8')
+
+    def append(self, op:str, **fields):
+        """
+        Appends an outcome to the journal.
+
+        Parameters:
+        - op the operation like 'set', 'unset', 'match', 'newbib', or 'lbd'.
+        - fields of the outcome, like tcn, the requested OCLC number and
+          the resulting action and OCLC number.
+
+        Returns:
+        - None
+        """
+        entry = {'op': op, 'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+        entry.update(fields)
+        self.fp.write(json.dumps(entry, separators=(',', ':')) + '\n')
+        self.fp.flush()
+        self.unsynced += 1
+        if self.unsynced >= self.sync_every or monotonic() - self.last_sync >= self.sync_seconds:
+            self.sync()
+
+    def sync(self):
+        """
+        Forces the journal to disk.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        self.fp.flush()
+        os.fsync(self.fp.fileno())
+        self.unsynced = 0
+        self.last_sync = monotonic()
+
+    def fsync(self):
+        """
+        Forces the entries already flushed by append() to disk, without
+        touching the file object, so the checkpoint thread can call it
+        while entries are being appended.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        try:
+            os.fsync(self.fp.fileno())
+        except ValueError:
+            # Closed, and so synced, by close().
+            pass
+
+    def close(self):
+        if self.fp.closed:
+            return
+        self.sync()
+        self.fp.close()
+
+def readJournal(fileName:str):
+    """
+    Reads the entries of a journal in the order they were written. A
+    partly written last line, from a crash mid-write, is skipped.
+
+    Parameters:
+    - fileName of the journal.
+
+    Returns:
+    - Generator of journal entry dictionaries.
+    """
+    if not exists(fileName):
+        return
+    with open(fileName, mode='rt', encoding='utf-8') as fp:
+        for line in fp:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    doctest.testfile("journal.tst")
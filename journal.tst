@@ -0,0 +1,48 @@
+Tests for Journal
+=================
+
+>>> import os
+>>> from journal import Journal, readJournal, SET_OP, UNSET_OP
+
+Test appending outcomes
+-----------------------
+>>> journal = Journal('test_journal.jsonl')
+>>> journal.append(SET_OP, tcn='epl001', requested='1111', action='done', oclcNumber='1111')
+>>> journal.append(UNSET_OP, oclcNumber='2222', action='done')
+>>> journal.close()
+>>> entries = list(readJournal('test_journal.jsonl'))
+>>> [(e['op'], e.get('tcn'), e['oclcNumber']) for e in entries]
+[('set', 'epl001', '1111'), ('unset', None, '2222')]
+>>> 'time' in entries[0]
+True
+
+Closing twice is harmless, and so is an fsync from the checkpoint thread
+after the journal is closed.
+>>> journal.close()
+>>> journal.fsync()
+
+Test appending to an existing journal
+-------------------------------------
+>>> journal = Journal('test_journal.jsonl', append=True)
+>>> journal.append(UNSET_OP, oclcNumber='3333', action='failed')
+>>> journal.close()
+>>> [e['oclcNumber'] for e in readJournal('test_journal.jsonl')]
+['1111', '2222', '3333']
+
+A new journal starts empty.
+>>> journal = Journal('test_journal.jsonl')
+>>> journal.close()
+>>> list(readJournal('test_journal.jsonl'))
+[]
+
+Test a partly written last line is skipped
+------------------------------------------
+>>> with open('test_journal.jsonl', 'w') as f:
+...     _ = f.write('{"op":"unset","oclcNumber":"1111"}\n{"op":"uns')
+>>> [e['oclcNumber'] for e in readJournal('test_journal.jsonl')]
+['1111']
+>>> os.unlink('test_journal.jsonl')
+
+A missing journal has no entries.
+>>> list(readJournal('test_journal.jsonl'))
+[]
@@ -0,0 +1,120 @@
+###############################################################################
+#
+# Purpose: Ledger of requests OCLC has confirmed, so they aren't sent twice.
+# Date:    Mon 19 Oct 2026
+# Copyright (c) 2026 Andrew Nisbet
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+from datetime import datetime
+import sqlite3
+
+class Ledger:
+    """
+    Persistent record of the set, unset and LBD delete requests that OCLC
+    confirmed, kept in SQLite. Each stage looks a number up before sending
+    it, so recovering an interrupted run only sends the requests that are
+    actually outstanding. A set can move a holding to a new control number,
+    so the number OCLC answered with is saved alongside the one requested.
+    """
+    def __init__(self, fileName:str, commitEvery:int=1):
+        """
+        Constructor, creates the database if it doesn't exist.
+
+        Parameters:
+        - fileName of the SQLite database.
+        - commitEvery number of confirmations between commits.
+
+        Returns:
+        - Ledger object.
+        """
+        self.file_name = fileName
+        self.commit_every = commitEvery
+        self.changes = 0
+        self.db = sqlite3.connect(fileName)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS confirmed (op TEXT, oclc_number TEXT, result TEXT, confirmed TEXT, PRIMARY KEY (op, oclc_number))")
+        self.db.commit()
+
+    def confirm(self, op:str, oclcNumber:str, result:str=None):
+        """
+        Records a request OCLC confirmed.
+
+        Parameters:
+        - op the request like 'set', 'unset', or 'lbd'.
+        - oclcNumber that was sent.
+        - result the OCLC number the request took effect on, if different.
+
+        Returns:
+        - None
+        """
+        self.db.execute("INSERT OR REPLACE INTO confirmed VALUES (?, ?, ?, ?)",
+            (op, oclcNumber, result if result else oclcNumber, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        self.changes += 1
+        if self.changes >= self.commit_every:
+            self.commit()
+
+    def lookup(self, op:str, oclcNumber:str) -> str:
+        """
+        Looks up a request before it is sent.
+
+        Parameters:
+        - op the request like 'set', 'unset', or 'lbd'.
+        - oclcNumber to be sent.
+
+        Returns:
+        - The OCLC number the confirmed request took effect on, or None if
+          the request hasn't been confirmed.
+        """
+        row = self.db.execute("SELECT result FROM confirmed WHERE op = ? AND oclc_number = ?", (op, oclcNumber)).fetchone()
+        return row[0] if row else None
+
+    def counts(self) -> dict:
+        """
+        Counts the confirmed requests.
+
+        Parameters:
+        - None
+
+        Returns:
+        - dictionary of op: count.
+        """
+        return {row[0]: row[1] for row in self.db.execute("SELECT op, COUNT(*) FROM confirmed GROUP BY op")}
+
+    def clear(self):
+        """
+        Forgets all confirmations, as at the start of a new update.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        self.db.execute("DELETE FROM confirmed")
+        self.commit()
+
+    def commit(self):
+        self.db.commit()
+        self.changes = 0
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    doctest.testfile("ledger.tst")
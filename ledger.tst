@@ -0,0 +1,36 @@
+Tests for Ledger
+================
+
+>>> import os
+>>> from ledger import Ledger
+
+Test confirming requests
+------------------------
+>>> ledger = Ledger('test_ledger.db')
+>>> ledger.lookup('set', '1111') is None
+True
+>>> ledger.confirm('set', '1111')
+>>> ledger.confirm('set', '2222', '2220')
+>>> ledger.confirm('unset', '3333')
+>>> ledger.lookup('set', '1111')
+'1111'
+>>> ledger.lookup('set', '2222')
+'2220'
+
+Confirmations are kept per request type.
+>>> ledger.lookup('unset', '1111') is None
+True
+>>> ledger.close()
+
+Test the ledger persists
+------------------------
+>>> ledger = Ledger('test_ledger.db')
+>>> sorted(ledger.counts().items())
+[('set', 2), ('unset', 1)]
+>>> ledger.clear()
+>>> ledger.counts()
+{}
+>>> ledger.close()
+>>> for f in os.listdir('.'):
+...     if f.startswith('test_ledger.db'):
+...         os.unlink(f)
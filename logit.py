@@ -27,40 +27,148 @@
 #
 ###############################################################################
 
+import atexit
+import queue
 import sys
+import threading
 from datetime import datetime
+from time import monotonic
 
-def logit(message, level:str='info', timestamp:bool=False, logFilePrefix:str='./oclc4_'):
+# Seconds between flushes of the log files.
+FLUSH_SECONDS = 1.0
+
+class LogWriter(threading.Thread):
+    """ 
+    Background writer for the log files. Messages are queued by logit()
+    and written in batches to files that are kept open, and flushed every
+    FLUSH_SECONDS, when asked with flush(), and at exit. The file name 
+    includes the date of the message, so logs rotate at midnight.
+    """
+    def __init__(self):
+        super().__init__(name='logit', daemon=True)
+        self.messages = queue.Queue()
+        # Open files by prefix, and the name of each.
+        self.files = {}
+
+    def _write_(self, logFilePrefix:str, fileName:str, lines:str):
+        (name, fp) = self.files.get(logFilePrefix, (None, None))
+        if name != fileName:
+            if fp is not None:
+                fp.close()
+            fp = open(fileName, 'a')
+            self.files[logFilePrefix] = (fileName, fp)
+        fp.write(lines)
+
+    def _flush_(self):
+        for (name, fp) in self.files.values():
+            fp.flush()
+
+    def run(self):
+        last_flush = monotonic()
+        while True:
+            try:
+                item = self.messages.get(timeout=FLUSH_SECONDS)
+            except queue.Empty:
+                item = None
+            # Write everything that is waiting in one batch.
+            while item is not None:
+                if isinstance(item, threading.Event):
+                    self._flush_()
+                    last_flush = monotonic()
+                    item.set()
+                else:
+                    try:
+                        self._write_(*item)
+                    except OSError as e:
+                        print(f"*error, unable to write log {item[1]}: {e}", file=sys.stderr)
+                try:
+                    item = self.messages.get_nowait()
+                except queue.Empty:
+                    item = None
+            if monotonic() - last_flush >= FLUSH_SECONDS:
+                self._flush_()
+                last_flush = monotonic()
+
+    def flush(self):
+        """ 
+        Waits until everything logged so far is written to the log files.
+        """
+        done = threading.Event()
+        self.messages.put(done)
+        done.wait()
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def _getWriter_() -> LogWriter:
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = LogWriter()
+            _writer.start()
+        return _writer
+
+def flushLogs():
+    """ 
+    Writes any queued log messages to their files.
+
+    Parameters:
+    - None
+
+    Return:
+    - None
+    """
+    if _writer is not None and _writer.is_alive():
+        _writer.flush()
+
+atexit.register(flushLogs)
+
+# Log file prefix used when logit() isn't given one.
+_log_file_prefix = './oclc4_'
+
+def setLogFilePrefix(logFilePrefix:str):
+    """ 
+    Changes the default log file prefix, like './oclc4_shard1of4_' so each
+    process of a sharded run writes its own log.
+
+    Parameters:
+    - logFilePrefix path and start of the log file names.
+
+    Return:
+    - None
+    """
+    global _log_file_prefix
+    _log_file_prefix = logFilePrefix
+
+def logit(message, level:str='info', timestamp:bool=False, logFilePrefix:str=None):
     """ 
     Wrapper for the logger. Added after the class was written
-    and to avoid changing tests. 
+    and to avoid changing tests. Messages are printed straight away
+    and written to the log file by a background LogWriter.
     
     Parameters:
     - message:list message(s) to either log or print. 
     - level of messaging. If 'error' is used the message is prefixed with '*error'.
     - timestamp:bool if True add a timestamp to the output.
+    - logFilePrefix optional log file prefix, see setLogFilePrefix().
 
     Return:
     - None
     """
+    if logFilePrefix is None:
+        logFilePrefix = _log_file_prefix
+    now = datetime.now()
     time_str = ''
     if timestamp:
-        time_str = f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
-    log_file = f"{logFilePrefix}{datetime.now().strftime('%Y-%m-%d')}.log"
+        time_str = f"[{now.strftime('%Y-%m-%d %H:%M:%S')}] "
+    log_file = f"{logFilePrefix}{now.strftime('%Y-%m-%d')}.log"
 
     if isinstance(message, str):
         message = [message]
-    for msg in message:
-        if level == 'error':
-            print(f"{time_str}*error, {msg}")
-        else:
-            print(f"{time_str}{msg}")
-    with open(f"{log_file}", 'a') as log:
-        for msg in message:
-            if level == 'error':
-                print(f"{time_str}*error, {msg}", file=log)
-            else:
-                print(f"{time_str}{msg}", file=log)
+    prefix = f"{time_str}*error, " if level == 'error' else time_str
+    lines = ''.join(f"{prefix}{msg}\n" for msg in message)
+    sys.stdout.write(lines)
+    _getWriter_().messages.put((logFilePrefix, log_file, lines))
 
 if __name__ == "__main__":
     import doctest
@@ -18,3 +18,35 @@ Hello World!
 
 >>> logit("Error World!", level='error', logFilePrefix='./logit_')
 *error, Error World!
+
+Test the log file
+-----------------
+Messages are written to the log file in the background. flushLogs()
+waits until they are all written.
+>>> from logit import flushLogs
+>>> from datetime import datetime
+>>> flushLogs()
+>>> log_file = f"./logit_{datetime.now().strftime('%Y-%m-%d')}.log"
+>>> open(log_file).read().splitlines()[-3:]
+['Hello World!', 'Hello World!', '*error, Error World!']
+>>> logit(["one", "two"], logFilePrefix='./logit_')
+one
+two
+>>> flushLogs()
+>>> open(log_file).read().splitlines()[-2:]
+['one', 'two']
+>>> import os
+>>> os.unlink(log_file)
+
+Test changing the default log file
+----------------------------------
+>>> from logit import setLogFilePrefix
+>>> setLogFilePrefix('./logit_shard1of2_')
+>>> logit("Shard one")
+Shard one
+>>> flushLogs()
+>>> shard_log = f"./logit_shard1of2_{datetime.now().strftime('%Y-%m-%d')}.log"
+>>> open(shard_log).read().splitlines()
+['Shard one']
+>>> os.unlink(shard_log)
+>>> setLogFilePrefix('./oclc4_')
@@ -0,0 +1,218 @@
+###############################################################################
+#
+# Purpose: Prometheus textfile metrics of an update run.
+# Date:    Mon 19 Oct 2026
+# Copyright (c) 2026 Andrew Nisbet
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+import threading
+from time import time
+from checkpoint import writeAtomic
+from logit import logit
+from record import ACTIONS
+import telemetry
+
+class RequestMetrics:
+    """
+    Totals of the requests sent to each OCLC endpoint, fed by the request
+    events from telemetry.py. Events arrive on the request thread and are
+    read by the exporter thread, so updates are made under a lock.
+    """
+    def __init__(self):
+        """
+        Constructor
+
+        Parameters:
+        - None
+
+        Returns:
+        - RequestMetrics object.
+        """
+        self.lock = threading.Lock()
+        # endpoint: [count, latency sum in seconds, max latency in seconds].
+        self.latency = {}
+        # (endpoint, status): count.
+        self.requests = {}
+        self.last_request = 0.0
+
+    def observe(self, event:dict):
+        """
+        Adds a request event. Used as a telemetry observer.
+
+        Parameters:
+        - event dictionary with at least the endpoint, status and latency_ms.
+
+        Returns:
+        - None
+        """
+        endpoint = event.get('endpoint', '')
+        seconds = event.get('latency_ms', 0.0) / 1000.0
+        status = event.get('status')
+        status = str(status) if status is not None else event.get('error', 'none')
+        with self.lock:
+            totals = self.latency.setdefault(endpoint, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds)
+            key = (endpoint, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.last_request = time()
+
+    def snapshot(self) -> tuple:
+        """
+        Copies the totals.
+
+        Parameters:
+        - None
+
+        Returns:
+        - tuple of (latency dictionary, requests dictionary, last request time).
+        """
+        with self.lock:
+            return ({endpoint: totals[:] for endpoint, totals in self.latency.items()}, dict(self.requests), self.last_request)
+
+def _labels_(**labels) -> str:
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels.items()) + '}'
+
+def formatMetrics(manager, requestMetrics:RequestMetrics=None) -> str:
+    """
+    Formats the state of a RecordManager in the Prometheus text format.
+
+    Parameters:
+    - manager RecordManager to report on.
+    - requestMetrics optional request totals to include.
+
+    Returns:
+    - String of metrics.
+    """
+    lines = []
+    def metric(name:str, kind:str, help:str, samples:list):
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (labels, value) in samples:
+            lines.append(f"{name}{labels} {value}")
+
+    index = manager.action_index
+    metric('oclc_records', 'gauge', 'Add records by action.',
+        [(_labels_(action=action), index.count(action)) for action in ACTIONS])
+    metric('oclc_errors_total', 'counter', 'Errors by stage.',
+        [(_labels_(stage=stage), count) for stage, count in dict(manager.error_count).items()])
+    queues = dict(manager.queues)
+    if 'unset' not in queues:
+        pending_deletes = len(manager.delete_numbers)
+    else:
+        pending_deletes = queues['unset'].pendingCount()
+    metric('oclc_deletes_pending', 'gauge', 'OCLC numbers waiting to be unset.', [('', pending_deletes)])
+    metric('oclc_queue_depth', 'gauge', 'Items waiting or in flight in each stage queue.',
+        [(_labels_(queue=name), queue.pendingCount()) for name, queue in queues.items()])
+    metric('oclc_requests_in_flight', 'gauge', 'Requests sent and not yet answered in each stage queue.',
+        [(_labels_(queue=name), len(queue.in_flight)) for name, queue in queues.items()])
+    if requestMetrics is not None:
+        (latency, requests, last_request) = requestMetrics.snapshot()
+        metric('oclc_requests_total', 'counter', 'Requests sent to OCLC by endpoint and HTTP status.',
+            [(_labels_(endpoint=endpoint, status=status), count) for (endpoint, status), count in sorted(requests.items())])
+        lines.append("# HELP oclc_request_latency_seconds Time waiting for OCLC to answer.")
+        lines.append("# TYPE oclc_request_latency_seconds summary")
+        for endpoint, (count, total, longest) in sorted(latency.items()):
+            lines.append(f"oclc_request_latency_seconds_sum{_labels_(endpoint=endpoint)} {total:.6f}")
+            lines.append(f"oclc_request_latency_seconds_count{_labels_(endpoint=endpoint)} {count}")
+        metric('oclc_request_latency_max_seconds', 'gauge', 'Longest time waiting for OCLC to answer.',
+            [(_labels_(endpoint=endpoint), f"{longest:.6f}") for endpoint, (count, total, longest) in sorted(latency.items())])
+        metric('oclc_last_request_timestamp_seconds', 'gauge', 'Time the last request was answered, to alert on stalls.',
+            [('', f"{last_request:.3f}")])
+    return '\n'.join(lines) + '\n'
+
+class MetricsExporter:
+    """
+    Writes a RecordManager's metrics to a file for node_exporter's
+    textfile collector every 'everySeconds' seconds from a background
+    thread. The file is replaced atomically so it is never read half
+    written. The exporter observes requests through telemetry.py.
+    """
+    def __init__(self, manager, fileName:str, everySeconds:float=15.0):
+        """
+        Constructor
+
+        Parameters:
+        - manager RecordManager to report on.
+        - fileName of the metrics file, which must end in '.prom' for
+          the textfile collector.
+        - everySeconds seconds between writes.
+
+        Returns:
+        - MetricsExporter object.
+        """
+        self.manager = manager
+        self.file_name = fileName
+        self.every_seconds = everySeconds
+        self.request_metrics = RequestMetrics()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def write(self):
+        """
+        Writes the metrics file now.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        try:
+            writeAtomic(self.file_name, formatMetrics(self.manager, self.request_metrics))
+        except Exception as e:
+            logit(f"unable to write metrics to {self.file_name}: {e}", level='error')
+
+    def _run_(self):
+        while not self.stopping.wait(self.every_seconds):
+            self.write()
+
+    def start(self):
+        """
+        Starts observing requests and writing the metrics file.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        telemetry.addObserver(self.request_metrics.observe)
+        self.write()
+        self.thread = threading.Thread(target=self._run_, name='metrics', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops the exporter after writing the final metrics.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        telemetry.removeObserver(self.request_metrics.observe)
+        self.write()
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    doctest.testfile("metrics.tst")
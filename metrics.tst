@@ -0,0 +1,64 @@
+Tests for Prometheus metrics
+============================
+
+>>> import os
+>>> from metrics import RequestMetrics, MetricsExporter, formatMetrics
+>>> from oclc4 import RecordManager
+>>> from record import Record
+>>> from workqueue import WorkQueue
+>>> import telemetry
+
+Test formatting a run's state
+-----------------------------
+>>> manager = RecordManager()
+>>> manager.add_records = [Record([], tcn="epl01", oclcNumber="1111"), Record([], tcn="epl02", oclcNumber="2222")]
+>>> manager.delete_numbers = ['3333', '4444', '5555']
+>>> manager.error_count['set'] = 1
+>>> text = formatMetrics(manager)
+>>> [line for line in text.split('\n') if line.startswith('oclc_records{action="set"}')]
+['oclc_records{action="set"} 2']
+>>> 'oclc_errors_total{stage="set"} 1' in text
+True
+>>> 'oclc_deletes_pending 3' in text
+True
+
+The unset queue reports the numbers still pending, and requests in flight.
+>>> queue = WorkQueue(['3333', '4444', '5555'], name='unset')
+>>> manager.queues[queue.name] = queue
+>>> (position, number) = queue.next()
+>>> text = formatMetrics(manager)
+>>> 'oclc_queue_depth{queue="unset"} 3' in text
+True
+>>> 'oclc_requests_in_flight{queue="unset"} 1' in text
+True
+>>> queue.done(position)
+>>> 'oclc_deletes_pending 2' in formatMetrics(manager)
+True
+
+Test request metrics
+--------------------
+>>> requests = RequestMetrics()
+>>> requests.observe({'endpoint': 'set', 'status': 200, 'latency_ms': 250.0})
+>>> requests.observe({'endpoint': 'set', 'status': 200, 'latency_ms': 750.0})
+>>> requests.observe({'endpoint': 'set', 'status': None, 'error': 'ConnectionError', 'latency_ms': 1000.0})
+>>> text = formatMetrics(manager, requests)
+>>> [line for line in text.split('\n') if line.startswith(('oclc_requests_total', 'oclc_request_latency'))]
+['oclc_requests_total{endpoint="set",status="200"} 2', 'oclc_requests_total{endpoint="set",status="ConnectionError"} 1', 'oclc_request_latency_seconds_sum{endpoint="set"} 2.000000', 'oclc_request_latency_seconds_count{endpoint="set"} 3', 'oclc_request_latency_max_seconds{endpoint="set"} 1.000000']
+
+Test the exporter
+-----------------
+The file is written on start and stop, and requests are observed through
+telemetry in between.
+>>> exporter = MetricsExporter(manager, 'test_metrics.prom', everySeconds=60)
+>>> exporter.start()
+>>> os.path.exists('test_metrics.prom')
+True
+>>> telemetry.isRecording()
+True
+>>> telemetry.recordRequest({'endpoint': 'unset', 'status': 200, 'latency_ms': 100.0})
+>>> exporter.stop()
+>>> telemetry.isRecording()
+False
+>>> 'oclc_request_latency_seconds_count{endpoint="unset"} 1' in open('test_metrics.prom').read()
+True
+>>> os.unlink('test_metrics.prom')
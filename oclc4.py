@@ -19,24 +19,55 @@
 #
 ###############################################################################
 from pathlib import Path # For place to unzip compressed flat file.
-from os.path import exists, getsize, splitext
+from os.path import exists, getsize, isdir, splitext
 import zipfile
+from array import array
 import argparse
+import atexit
 import sys
-from logit import logit
-from ws2 import SetWebService, UnsetWebService, MatchWebService, DeleteWebService, AddBibWebService
+from logit import logit, setLogFilePrefix
+from telemetry import startTelemetry
+from metrics import MetricsExporter
+from timing import StageTimer
+from profiling import Profiler
+from progress import Progress
+from pipeline import UpdatePipeline
+from ingest import Ingest
+from shard import parseShard, overlayFileName, errorReportName
+from scheduler import WorkScheduler, parseSchedule
+from daemon import Daemon
+from deadline import Deadline, parseDeadline, parseRuntime, DRAIN_SECONDS
+from sampling import getSampler, startSampling
+from ws2 import WebService, SetWebService, UnsetWebService, MatchWebService, DeleteWebService, AddBibWebService
 import json
-from record import Record, SET, MATCH, UPDATED 
+from record import Record, ActionIndex, SET, MATCH, UPDATED, COMPLETED, IGNORE, FAILED
 import re
-from datetime import datetime
+from datetime import datetime, timedelta
 import xml.etree.ElementTree as ET
+from collections import Counter
+from holdings import HoldingsIndex, HoldingsStore, toOclcInt
+from fingerprints import FingerprintStore
+from workqueue import WorkQueue
+from statestore import StateStore, OUTSTANDING
+from checkpoint import Checkpointer, writeAtomic, openText
+from ledger import Ledger
+from journal import Journal, readJournal, SET_OP, UNSET_OP, MATCH_OP, NEWBIB_OP, LBD_OP, OVERLAY_OP
 
 # Output dated overlay file name. 
 VERSION='1.03.00' # Adds new Bibs and sets them as holdings.
+# Stages profiled by each --profile phase, None profiles the whole run.
+PROFILE_PHASES = {
+    'all': None,
+    'read': ['read adds', 'read deletes', 'read report', 'read holdings', 'restore', 'delta'],
+    'normalize': ['normalize'],
+    'update': ['snapshot', 'unset', 'set', 'match', 'set updated', 'pipeline', 'slim flat', 'save'],
+}
+# Requests in flight with --stream or --schedule if --pipeline isn't given.
+PIPELINE_WORKERS = 4
 
 
 class RecordManager:
-    def __init__(self, ignoreTags:dict={}, encoding:str='utf-8', debug:bool=False, configFile:str='prod.json'):
+    def __init__(self, ignoreTags:dict={}, encoding:str='utf-8', debug:bool=False, configFile:str='prod.json', holdingsDb:str=None, fingerprintDb:str=None, stateDb:str=None, compressCheckpoints:bool=False, ledgerDb:str=None, holdingsReadOnly:bool=False):
         """ 
         Constructor for RecordManagers using ingoreTags and encoding options.
 
@@ -44,17 +75,63 @@ class RecordManager:
         - ignore tags dictionary that will invalidate a bib record for selection
           based on whether the tag and tag content match.
         - encoding of any files read or written to.
+        - Optional SQLite file of the local holdings store. See holdings.py.
+        - Optional SQLite file of record fingerprints from previous runs. See fingerprints.py.
+        - Optional SQLite file to save the run state in. See statestore.py.
+        - compressCheckpoints gzip the adds checkpoint if True.
+        - Optional SQLite file of requests OCLC confirmed. See ledger.py.
+        - holdingsReadOnly only read the holdings store, as shards sharing it do.
 
         Return:
         - None
         """
         self.debug          = debug
-        # adds we read from flat or mrk file...
+        # adds we read from flat or mrk file, also indexed by action.
         self.add_records    = []
         # deletes vetted for duplicates and missing from OCLC holdings list.
         self.delete_numbers = []
         # Stores the OCLC numbers from OCLC's holdings report.
-        self.oclc_holdings  = []
+        self.oclc_holdings  = HoldingsIndex()
+        # Local mirror of OCLC holdings updated as holdings are set and unset.
+        self.holdings_store = HoldingsStore(holdingsDb, readOnly=holdingsReadOnly) if holdingsDb else None
+        # Fingerprints of records OCLC agreed with in previous runs, and
+        # TCN: OCLC number of any that have since vanished from the ILS.
+        self.fingerprint_store = FingerprintStore(fingerprintDb) if fingerprintDb else None
+        self.vanished = {}
+        # OCLC numbers whose holdings were removed in this run.
+        self.completed_unsets = set()
+        # Write-ahead journal of request outcomes, see openJournal().
+        self.journal = None
+        # SQLite run state used instead of the JSON checkpoint files.
+        self.state_store = StateStore(stateDb) if stateDb else None
+        self.state_saved = False
+        # Requests OCLC has confirmed, checked before sending a request.
+        self.ledger = Ledger(ledgerDb) if ledgerDb else None
+        # Background checkpoints, see startCheckpoints().
+        self.checkpointer = None
+        self.checkpoint_kept = False
+        # The add records as checkpoint dictionaries, by their index number,
+        # patched on the checkpoint thread, and the records that changed
+        # since the last snapshot. See _checkpointSnapshot_().
+        self.checkpoint_adds = {}
+        self.checkpoint_changed = {}
+        self.unset_queue = None
+        # The work queue of each stage by name, for reporting progress.
+        self.queues = {}
+        # Wall, CPU and network time of each stage of the run.
+        self.timer = StageTimer()
+        # Number of adds and deletes when the update started, for throughput.
+        self.run_record_count = 0
+        # Seconds between progress lines of each stage, 0 for a line per record.
+        self.progress_seconds = 0.0
+        self.progress = None
+        # Requests in flight with the pipelined update, 0 to run the stages one after another.
+        self.pipeline_workers = 0
+        # WorkScheduler of the pipelined update, None for the default weights.
+        self.scheduler = None
+        # Deadline after which no new requests are sent, see pastDeadline().
+        self.deadline = None
+        self.deadline_reached = False
         # Results dictionary key:TCN -> value:webService.response.
         self.errors         = {}
         # Count of errors for each type of request type.
@@ -72,9 +149,41 @@ class RecordManager:
         self.rejected = {}
         self.encoding = encoding
         self.backup_prefix = 'oclc_update_'
+        # The Shard of a run split across processes, see selectShard().
+        self.shard = None
+        # Shards read the holdings store but don't reseed it from a report.
+        self.seed_holdings = True
+        self.compress_checkpoints = compressCheckpoints
         with open(configFile) as f:
             self.configs = json.load(f)
 
+    @property
+    def add_records(self) -> list:
+        """ 
+        The add records. Assigning a new list re-indexes the records by action.
+        """
+        return self._add_records
+
+    @add_records.setter
+    def add_records(self, records:list):
+        self._add_records = records
+        self.action_index = ActionIndex(records)
+
+    def _addRecord_(self, record:Record):
+        """ 
+        Appends a record to the add records and indexes it by its action.
+
+        Parameters:
+        - Record object.
+
+        Return:
+        - None
+        """
+        self._add_records.append(record)
+        self.action_index.add(record)
+        if self.checkpointer is not None and self.state_store is None:
+            self.checkpoint_changed[record.index_seq] = record
+
     def _test_file_(self, fileName:str) -> list:
         """ 
         Helper function that tests if the file has content and returns True if it does and False 
@@ -153,33 +262,48 @@ class RecordManager:
         if not fileName:
             logit(f"no flat or mrk records to read.")
         if exists(fileName):
-            # Unzip file if necessary.
-            flat_file_path = self.unzipFileIfNecessary(fileName)
-            # If the input file name was a *.zip, it should be changed to *.flat
-            with open(flat_file_path, encoding='utf-8', mode='rt') as flat_file:
-                lines = []
-                my_type = ''
-                for line in flat_file:
-                    if '*** DOCUMENT BOUNDARY ***' in line or '=LDR ' in line:
-                        # A new boundary means a new record so output any existing.
-                        if lines:
-                            # Remember all mrk or flat files are add or set holding records when reading from file.
-                            record = Record(data=lines, action='set', rejectTags=self.ignore_tags, encoding=self.encoding)
-                            if self.debug:
-                                logit(f"{record}")
-                            self.add_records.append(record)
-                            lines = []
-                    lines.append(line.rstrip())
-            flat_file.close()
-            # Output the last record since there are no more doc boundaries to trigger that.
-            if lines:
-                record = Record(data=lines, action='set', rejectTags=self.ignore_tags, encoding=self.encoding)
-                if self.debug:
-                    logit(f"{record}")
-                self.add_records.append(record)
+            for record in self.iterFlatOrMrkRecords(fileName):
+                self._addRecord_(record)
         else:
             logit(f"**error, {fileName} is either missing or empty.")
             sys.exit(1)
+
+    def iterFlatOrMrkRecords(self, fileName:str):
+        """ 
+        Reads flat or mrk records from file one at a time, unzipping the
+        file first if necessary. The records are not added to the manager.
+
+        Parameters:
+        - fileName of the flat or mrk file, which must exist.
+
+        Return:
+        - Generator of bib Records with the action 'set'.
+        """
+        # Unzip file if necessary.
+        flat_file_path = self.unzipFileIfNecessary(fileName)
+        # If the input file name was a *.zip, it should be changed to *.flat
+        sampler = getSampler()
+        with open(flat_file_path, encoding='utf-8', mode='rt') as flat_file:
+            lines = []
+            for line in flat_file:
+                if '*** DOCUMENT BOUNDARY ***' in line or '=LDR ' in line:
+                    # A new boundary means a new record so output any existing.
+                    if lines:
+                        yield self._newRecord_(lines, sampler)
+                        lines = []
+                lines.append(line.rstrip())
+        # Output the last record since there are no more doc boundaries to trigger that.
+        if lines:
+            yield self._newRecord_(lines, sampler)
+
+    def _newRecord_(self, lines:list, sampler) -> Record:
+        # Remember all mrk or flat files are add or set holding records when reading from file.
+        record = Record(data=lines, action='set', rejectTags=self.ignore_tags, encoding=self.encoding)
+        if self.debug:
+            logit(f"{record}")
+        elif sampler is not None and sampler.sample():
+            logit(f"DEBUG: {sampler.truncate(record)}")
+        return record
  
     def readDeleteList(self, fileName:str):
         """ 
@@ -224,10 +348,12 @@ class RecordManager:
         (is_valid, path, ext) = self._test_file_(fileName)
         if not is_valid:
             logit(f"The holding report {fileName} is broken.")
-            self.oclc_holdings = []
+            self.oclc_holdings = HoldingsIndex()
             return
         if ext and (ext.lower() == '.csv' or ext.lower() == '.tsv'):
-            numbers = []
+            # Numbers are collected as 64-bit integers and indexed once the file is read.
+            numbers = array('q')
+            first_numbers = []
             num_matcher  = re.compile(r'"\d+"')
             with open(fileName, encoding=self.encoding, mode='r') as report_file:
                 for line in report_file:
@@ -235,14 +361,141 @@ class RecordManager:
                     if num_match:
                         # Trim off the double-quotes
                         number = num_match[0][1:-1]
-                        self.oclc_holdings.append(f"{number}")
+                        key = toOclcInt(number)
+                        if key is None:
+                            continue
+                        numbers.append(key)
+                        if len(first_numbers) < 4:
+                            first_numbers.append(number)
             report_file.close()
+            self.oclc_holdings.extend(numbers)
             if self.debug:
-                logit(f"loaded {len(self.oclc_holdings)} delete records: {self.oclc_holdings[0:4]}...")
+                logit(f"loaded {len(numbers)} delete records: {first_numbers}...")
+            # A fresh report is the authority on what OCLC holds.
+            if self.holdings_store is not None and self.seed_holdings:
+                count = self.holdings_store.seed(self.oclc_holdings)
+                logit(f"seeded {self.holdings_store.file_name} with {count} holdings")
         else:
             logit(f"The holding report is missing, empty or not the correct format. Expected a .csv (or .tsv) file.")
-            self.oclc_holdings = []
+            self.oclc_holdings = HoldingsIndex()
     
+    def readHoldingsStore(self):
+        """ 
+        Loads the holdings from the local holdings store instead of a
+        holdings report. The store is seeded from a report and kept up to
+        date with the holdings set and unset in each run.
+
+        Parameters:
+        - None
+
+        Return:
+        - None but sets the internal oclc holdings list.
+        """
+        if self.holdings_store is None:
+            logit(f"no holdings store to read.")
+            return
+        self.oclc_holdings = self.holdings_store.toIndex()
+        logit(f"loaded {len(self.oclc_holdings)} holdings from {self.holdings_store.file_name}")
+
+    def selectDelta(self):
+        """ 
+        Compares the add records to the fingerprints saved by previous runs
+        and keeps only records that are new or have changed. TCNs that were
+        sent before but are no longer in the adds are considered removed
+        from the ILS, and their OCLC numbers are added to the delete list.
+        Call after reading both the adds and deletes.
+
+        Parameters:
+        - None
+
+        Return:
+        - None
+        """
+        if self.fingerprint_store is None:
+            logit(f"no fingerprint store to compare against.")
+            return
+        stored = self.fingerprint_store.load()
+        seen_tcns = set()
+        changed_records = []
+        for record in self.add_records:
+            tcn = record.getTitleControlNumber()
+            seen_tcns.add(tcn)
+            if stored.get(tcn) != (record.getFingerprint(), record.getOclcNumber()):
+                changed_records.append(record)
+        for (tcn, (fingerprint, oclc_number)) in stored.items():
+            if tcn not in seen_tcns:
+                self.vanished[tcn] = oclc_number
+                if oclc_number:
+                    self.delete_numbers.append(oclc_number)
+        logit(f"delta: {len(changed_records)} new or changed, {len(self.add_records) - len(changed_records)} unchanged, {len(self.vanished)} vanished record(s)")
+        self.add_records = changed_records
+
+    def selectShard(self):
+        """ 
+        Keeps only the adds and deletes that belong to this run's shard.
+        Call after reading the adds and deletes and before normalizing.
+
+        Parameters:
+        - None
+
+        Return:
+        - None
+        """
+        if self.shard is None:
+            return
+        adds = len(self.add_records)
+        deletes = len(self.delete_numbers)
+        self.add_records = [record for record in self.add_records if self.shard.ownsRecord(record)]
+        self.delete_numbers = [oclc_number for oclc_number in self.delete_numbers if self.shard.owns(oclc_number)]
+        logit(f"shard {self.shard}: {len(self.add_records)} of {adds} add(s) and {len(self.delete_numbers)} of {deletes} delete(s)")
+
+    def saveErrorReport(self, fileName:str):
+        """ 
+        Writes the errors, error counts and rejected numbers of the run to
+        a JSON file, so the reports of a sharded run can be merged.
+
+        Parameters:
+        - fileName of the JSON report.
+
+        Return:
+        - None
+        """
+        report = {'error_count': self.error_count, 'errors': self.errors, 'rejected': self.rejected}
+        writeAtomic(fileName, json.dumps(report, indent=2, default=str))
+
+    def saveFingerprints(self):
+        """ 
+        Saves the fingerprints of records OCLC now agrees with, that is,
+        records that were set or didn't need to be sent, and forgets the
+        TCNs that vanished once their holdings are removed. Records that
+        failed or are still waiting, including updated records that still
+        need to be set again, are not saved, and vanished TCNs whose unset
+        wasn't sent or didn't succeed are kept, so the next delta run sends
+        them again.
+
+        Parameters:
+        - None
+
+        Return:
+        - None
+        """
+        if self.fingerprint_store is None:
+            return
+        count = 0
+        for record in self.action_index.records(COMPLETED, IGNORE):
+            tcn = record.getTitleControlNumber()
+            if tcn:
+                self.fingerprint_store.put(tcn, record.getFingerprint(), record.getOclcNumber())
+                count += 1
+        removed = 0
+        for (tcn, oclc_number) in self.vanished.items():
+            if not oclc_number or oclc_number in self.completed_unsets:
+                self.fingerprint_store.remove(tcn)
+                removed += 1
+        self.fingerprint_store.commit()
+        logit(f"saved {count} fingerprint(s), removed {removed} to {self.fingerprint_store.file_name}")
+        self.vanished = {}
+
     def getRecordCount(self, action:str) -> int:
         """ 
         Helper method to return the count of records with a given status. 
@@ -256,11 +509,20 @@ class RecordManager:
         Return:
         - integer count of records matching the action parameter.
         """
-        count = 0
-        for record in self.add_records:
-            if record.getAction() == action:
-                count += 1
-        return count
+        return self.action_index.count(action)
+
+    def getRemainingCount(self) -> int:
+        """ 
+        Counts the work left, the deletes still pending and the adds that
+        still need a set, match or second set.
+
+        Parameters:
+        - None
+
+        Return:
+        - Number of OCLC numbers and records left.
+        """
+        return len(self.delete_numbers) + sum(self.getRecordCount(action) for action in OUTSTANDING)
 
     def _getOclcNumList_(self) -> list:
         """ 
@@ -272,11 +534,7 @@ class RecordManager:
         Return:
         - list of OCLC (integer) numbers to be set as holdings.
         """
-        ret_list = []
-        for record in self.add_records:
-            if record.getAction() == SET:
-                ret_list.append(record.getOclcNumber())
-        return ret_list
+        return [record.getOclcNumber() for record in self.action_index.records(SET)]
 
     # Shows status of RecordManager.
     def _showState_(self):
@@ -298,9 +556,8 @@ class RecordManager:
             logit(f"{self._getOclcNumList_()}")
         logit(f"{self.getRecordCount(MATCH)} record(s) to check")
         if self.debug:
-            for record in self.add_records:
-                if record.getAction() == MATCH:
-                    logit(f"{record}")
+            for record in self.action_index.records(MATCH):
+                logit(f"{record}")
         logit(f"{len(self.rejected)} rejected record(s)")
         for (oclc_num, reject_reason) in self.rejected.items():
             logit(f"{oclc_num}: {reject_reason}")
@@ -334,14 +591,55 @@ class RecordManager:
         Return:
         - None
         """
+        limit = recordLimit
+        my_dels = self._normalizeDeletes_(recordLimit)
+        # The add numbers are sorted once and walked against the sorted
+        # holdings index in a single batch, see HoldingsIndex.intersection().
+        # The result, and the sets of add and delete numbers, answer each
+        # record's membership tests.
+        holdings = self.oclc_holdings.intersection(record.getOclcNumber() for record in self.add_records)
+        # For the adds list expect records, those will have tcns and maybe oclc numbers.
+        # Keep track of the numbers we've already seen.
+        add_numbers = set()
+        delete_set = set(my_dels)
+        count = 0
+        for record in self.add_records:
+            self._normalizeAdd_(record, holdings, add_numbers, delete_set)
+            if count == limit:
+                break
+            else:
+                count += 1
+        # Keep the surviving deletes in the order they were accepted.
+        self.delete_numbers = [oclc_num for oclc_num in my_dels if oclc_num in delete_set]
+            
+        # Once done report results.
+        self._showState_()
+
+    def _normalizeDeletes_(self, recordLimit:int=-1) -> list:
+        """ 
+        Removes the delete numbers that OCLC doesn't hold and duplicate
+        delete requests. See normalizeLists().
+
+        Parameters:
+        - recordLimit integer max number of deletes to keep, -1 for all.
+
+        Return:
+        - list of the accepted delete numbers, which also empties the delete list.
+        """
         my_dels = []
         limit = recordLimit
         count = 0
+        # The holdings index is checked once for every delete number in a
+        # single batch, and the countdown of unvisited delete numbers answers
+        # 'is it still further down the delete list'.
+        holdings = self.oclc_holdings.intersection(self.delete_numbers)
+        pending_deletes = Counter(self.delete_numbers)
         while self.delete_numbers:
             oclc_num = self.delete_numbers.pop()
-            if self.oclc_holdings and oclc_num not in self.oclc_holdings:
+            pending_deletes[oclc_num] -= 1
+            if self.oclc_holdings and oclc_num not in holdings:
                 self.rejected[oclc_num] = "OCLC has no such holding to delete"
-            elif oclc_num in self.delete_numbers:
+            elif pending_deletes[oclc_num] > 0:
                 self.rejected[oclc_num] = "duplicate delete request; ignoring"
             else:
                 my_dels.append(oclc_num)
@@ -349,42 +647,43 @@ class RecordManager:
                     break
                 else:
                     count += 1
-        self.delete_numbers = my_dels[:]
+        return my_dels
 
-        # For the adds list expect records, those will have tcns and maybe oclc numbers.
-        # Keep track of the numbers we've already seen.
-        add_numbers = []
-        count = 0
-        for record in self.add_records:
-            oclc_num = record.getOclcNumber()
-            if oclc_num:
-                # Order matters those already added have made it through this elif ladder.
-                if oclc_num in add_numbers:
-                    self.rejected[oclc_num] = "duplicate add request"
-                    record.setIgnore()
-                # If requested to add but previously passed the 'delete' test
-                elif oclc_num in self.delete_numbers:
-                    self.rejected[oclc_num] = "previously requested as a delete; ignoring"
-                    record.setIgnore()
-                    # and remove from the master_deletes too!
-                    self.delete_numbers.remove(oclc_num)
-                # Lastly if it is already a holding don't add again.
-                elif oclc_num in self.oclc_holdings:
-                    self.rejected[oclc_num] = "already a holding"
-                    record.setIgnore()
-                else:
-                    add_numbers.append(oclc_num)
-                    record.setAdd()
-            else:
-                # No OCLC number in record so we'll have to look it up.
-                record.setLookupMatch()
-            if count == limit:
-                break
+    def _normalizeAdd_(self, record:Record, holdings, addNumbers:set, deleteSet:set):
+        """ 
+        Decides if an add record is set, matched or ignored. See normalizeLists().
+
+        Parameters:
+        - record to normalize.
+        - holdings set or HoldingsIndex of the add numbers OCLC already holds.
+        - addNumbers OCLC numbers of the adds accepted so far, updated.
+        - deleteSet accepted delete numbers, an add cancels its delete.
+
+        Return:
+        - None
+        """
+        oclc_num = record.getOclcNumber()
+        if oclc_num:
+            # Order matters those already added have made it through this elif ladder.
+            if oclc_num in addNumbers:
+                self.rejected[oclc_num] = "duplicate add request"
+                record.setIgnore()
+            # If requested to add but previously passed the 'delete' test
+            elif oclc_num in deleteSet:
+                self.rejected[oclc_num] = "previously requested as a delete; ignoring"
+                record.setIgnore()
+                # and remove from the master_deletes too!
+                deleteSet.discard(oclc_num)
+            # Lastly if it is already a holding don't add again.
+            elif oclc_num in holdings:
+                self.rejected[oclc_num] = "already a holding"
+                record.setIgnore()
             else:
-                count += 1
-            
-        # Once done report results.
-        self._showState_()
+                addNumbers.add(oclc_num)
+                record.setAdd()
+        else:
+            # No OCLC number in record so we'll have to look it up.
+            record.setLookupMatch()
 
     def _dumpJson_(self, fileName:str, data:list):
         """ 
@@ -397,9 +696,7 @@ class RecordManager:
         Return:
         - None
         """
-        with open(fileName, 'wt') as fp:
-            json.dump(data, fp)
-        fp.close()
+        writeAtomic(fileName, json.dumps(data))
 
     def _loadJson_(self, fileName:str) -> list:
         """ 
@@ -423,6 +720,13 @@ class RecordManager:
         Used to restore interrupted operations due to close 
         signal from software or keyboard interrupt like <ctrl-c>. 
         It writes the existing state of update to backup files.
+
+        The adds checkpoint is read a line at a time, so its text is never
+        held whole, but the restored Records are kept in a list like those
+        read from a flat file. The update visits them more than once: a
+        matched or renumbered record goes back to be set again, and the
+        action index, checkpoints, saveState(), the slim flat and the
+        fingerprints all need every record, not just the ones still to send.
         
         Parameters:
         - None
@@ -430,20 +734,16 @@ class RecordManager:
         Return:
         - True if state was restored successfully and False otherwise.
         """
-        a_names = f"{self.backup_prefix}adds.json"
+        if self.state_store is not None:
+            return self._restoreStateStore_()
+        a_names = self._findAddsCheckpoint_()
         d_names = f"{self.backup_prefix}deletes.json"
         if self.debug:
             logit(f"restoring records' state from previous process...")
         logit(f"reading {a_names}")
         try:
-            if self._test_file_(d_names)[0] == True:
-                with open(a_names, 'r') as jf:
-                    j_lines = jf.readlines() 
-                jf.close()
-                my_jstr = ''
-                for line in j_lines:
-                    my_jstr += line.rstrip()
-                self.add_records = self._loadRecords_(my_jstr)
+            if self._test_file_(a_names)[0] == True:
+                self.add_records = list(self._iterRecords_(a_names))
                 logit(f"adds state restored successfully from {a_names} ")
                 self._removeCheckpoint_(a_names)
         except FileNotFoundError:
@@ -463,6 +763,88 @@ class RecordManager:
             logit(f"done.")
         return True
     
+    def _addsCheckpointName_(self) -> str:
+        """ 
+        Name of the adds checkpoint file written by saveState().
+        """
+        if self.compress_checkpoints:
+            return f"{self.backup_prefix}adds.jsonl.gz"
+        return f"{self.backup_prefix}adds.jsonl"
+
+    def _findAddsCheckpoint_(self) -> str:
+        """ 
+        Finds the adds checkpoint to restore. Compressed or not, and the
+        JSON array written by older versions, are all accepted.
+
+        Parameters:
+        - None
+
+        Return:
+        - Name of the checkpoint file, or the default name if there isn't one.
+        """
+        for file_name in (f"{self.backup_prefix}adds.jsonl.gz", f"{self.backup_prefix}adds.jsonl", f"{self.backup_prefix}adds.json"):
+            if exists(file_name):
+                return file_name
+        return self._addsCheckpointName_()
+
+    def _iterRecords_(self, fileName:str):
+        """ 
+        Reads the Records back from an adds checkpoint one line at a time, 
+        so the text of the file is never in memory all at once.
+
+        Parameters:
+        - fileName of the checkpoint, '.jsonl', '.jsonl.gz', or '.json'.
+
+        Return:
+        - Generator of Records.
+        """
+        with openText(fileName) as fp:
+            if fileName.endswith('.json'):
+                yield from self._loadRecords_(fp.read())
+                return
+            for line in fp:
+                if line.strip():
+                    yield Record._fromDict_(json.loads(line))
+
+    def _restoreStateStore_(self) -> bool:
+        """ 
+        Restores the add records and the deletes that are still pending
+        from the state database.
+
+        Parameters:
+        - None
+
+        Return:
+        - True if state was restored and False if the database is empty.
+        """
+        db_name = self.state_store.file_name
+        if not self.state_store.hasRecords():
+            logit(f"{db_name} missing or empty.")
+            return False
+        self.add_records = self.state_store.loadRecords()
+        logit(f"adds state restored successfully from {db_name} ")
+        self.delete_numbers = self.state_store.loadDeletes()
+        logit(f"deletes state restored successfully from {db_name} ")
+        self.state_saved = True
+        return True
+
+    def _snapshotState_(self):
+        """ 
+        Writes the add records and delete list to the state database once
+        per run. After that each outcome updates its own row.
+
+        Parameters:
+        - None
+
+        Return:
+        - None
+        """
+        if self.state_store is None or self.state_saved:
+            return
+        self.state_store.saveRecords(self.add_records)
+        self.state_store.saveDeletes(self.delete_numbers)
+        self.state_saved = True
+
     def _removeCheckpoint_(self, fileName) -> bool:
         """
         Removes a given file with error correction.
@@ -527,49 +909,299 @@ class RecordManager:
         - None
         """
         logit(f"saving records' state to backup", timestamp=True)
-        a_name = f"{self.backup_prefix}adds.json"
-        with open(a_name, 'w') as jf:
-            jf.write(self._dumpRecords_(self.add_records))
-        logit(f"adds state saved to {a_name}", timestamp=True)
-        d_name = f"{self.backup_prefix}deletes.json"
-        self._dumpJson_(d_name, self.delete_numbers)
-        logit(f"deletes state saved to {d_name}", timestamp=True)
+        if self.checkpointer is not None:
+            self.checkpointer.wait()
+        self.checkpoint_kept = True
+        if self.state_store is not None:
+            self._snapshotState_()
+            self.state_store.saveErrors(self.error_count)
+            self.state_store.commit()
+            logit(f"state saved to {self.state_store.file_name}", timestamp=True)
+        else:
+            a_name = self._addsCheckpointName_()
+            writeAtomic(a_name, self._dumpRecords_(self.add_records))
+            logit(f"adds state saved to {a_name}", timestamp=True)
+            d_name = f"{self.backup_prefix}deletes.json"
+            self._dumpJson_(d_name, self.delete_numbers)
+            logit(f"deletes state saved to {d_name}", timestamp=True)
+        if self.holdings_store is not None:
+            self.holdings_store.commit()
+        if self.journal is not None:
+            self.journal.sync()
         logit(f"done.", timestamp=True)
 
-    def _dumpRecords_(self, record):
+    def _dumpRecords_(self, records:list):
         """ 
-        Dumps a list of records to JSON ready for writing to file.
+        Dumps records to JSON lines, one compact record per line, ready 
+        for writing to file.
 
         Parameters:
-        - custom object in this case a bib record.
+        - records list of Records, or of their dictionaries.
 
         Return:
-        - String version of JSON-fied custom object.
+        - Generator of JSON lines.
         """
-        # Use a custom function to convert Customer objects to dictionaries
-        def __convertToDict__(r):
-            """ 
-            Converts custom object to JSON.
-
-            Parameters:
-            - r custom object.
-
-            Return:
-            - r as JSON object.
-            """
+        for r in records:
             if isinstance(r, Record):
-                return r._toDict_()
-            return r.__dict__
-        # Use the custom function in json.dumps
-        return json.dumps(record, default=__convertToDict__, indent=2)
+                r = r._toDict_()
+            yield json.dumps(r, separators=(',', ':')) + '\n'
  
+    def startCheckpoints(self, everyRecords:int=1000, everySeconds:float=300.0):
+        """ 
+        Saves checkpoints while the update runs, every N outcomes or T seconds,
+        so an interrupted run can be recovered without losing its progress.
+        Checkpoints are written in the background to the same files as
+        saveState().
+
+        Parameters:
+        - everyRecords number of outcomes between checkpoints, 0 for no limit.
+        - everySeconds seconds between checkpoints, 0 for no limit.
+
+        Return:
+        - None
+        """
+        if everyRecords <= 0 and everySeconds <= 0:
+            self.checkpointer = None
+            return
+        if self.state_store is None:
+            self.checkpoint_adds = {record.index_seq: record._toDict_() for record in self.add_records}
+        self.checkpoint_changed = {}
+        self.checkpointer = Checkpointer(snapshot=self._checkpointSnapshot_, write=self._writeCheckpoint_, 
+            everyRecords=everyRecords, everySeconds=everySeconds)
+
+    def _checkpointSnapshot_(self):
+        """ 
+        Copies the state for a checkpoint. The dictionaries of all the add
+        records are made once, by startCheckpoints(), so a snapshot only
+        copies the records that had an outcome or were added since the last
+        one, and the checkpoint thread patches them in. During the unset
+        stage the deletes come from the queue. Writing the adds and fsyncing
+        the journal are left to the checkpoint thread, so the cost to the
+        request loop is the changed records and the outstanding deletes.
+
+        Parameters:
+        - None
+
+        Return:
+        - tuple of (list of (index number, record dictionary) of the changed
+          records, list of OCLC numbers), or None if the state database is
+          used instead.
+        """
+        if self.state_store is not None:
+            if self.journal is not None:
+                self.journal.sync()
+            # The database is already up to date, it just needs committing.
+            self.state_store.commit()
+            return None
+        changed = [(seq, record._toDict_()) for (seq, record) in self.checkpoint_changed.items()]
+        self.checkpoint_changed = {}
+        deletes = self.unset_queue.remaining() if self.unset_queue is not None else self.delete_numbers[:]
+        return (changed, deletes)
+
+    def _writeCheckpoint_(self, state:tuple):
+        """ 
+        Writes a checkpoint snapshot. Runs on the checkpoint thread, which
+        is the only one to touch the record dictionaries after
+        startCheckpoints().
+
+        Parameters:
+        - state tuple of (list of (index number, record dictionary) of the
+          changed records, list of OCLC numbers).
+
+        Return:
+        - None
+        """
+        (changed, deletes) = state
+        # The outcomes in the checkpoint are on disk in the journal first.
+        if self.journal is not None:
+            self.journal.fsync()
+        self.checkpoint_adds.update(changed)
+        writeAtomic(self._addsCheckpointName_(), self._dumpRecords_(self.checkpoint_adds.values()))
+        writeAtomic(f"{self.backup_prefix}deletes.json", json.dumps(deletes))
+        logit(f"checkpoint of {len(self.checkpoint_adds)} adds and {len(deletes)} deletes saved", timestamp=True)
+
+    def _stopCheckpoints_(self):
+        """ 
+        Waits for the last checkpoint, and removes the checkpoint files if
+        the run finished without needing to save its state.
+
+        Parameters:
+        - None
+
+        Return:
+        - None
+        """
+        if self.checkpointer is None:
+            return
+        self.checkpointer.wait()
+        if self.checkpointer.written and not self.checkpoint_kept and self.state_store is None:
+            for file_name in (self._addsCheckpointName_(), f"{self.backup_prefix}deletes.json"):
+                if exists(file_name):
+                    self._removeCheckpoint_(file_name)
+        self.checkpointer = None
+        self.checkpoint_adds = {}
+        self.checkpoint_changed = {}
+
+    def openJournal(self, fileName:str, append:bool=False):
+        """ 
+        Starts journaling the outcome of every set, unset, match, new bib, and
+        LBD delete request. See journal.py.
+
+        Parameters:
+        - fileName of the journal.
+        - append to the existing journal, as when recovering, or start a new one.
+
+        Return:
+        - None
+        """
+        self.journal = Journal(fileName, append=append)
+
+    def closeJournal(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def closeStores(self):
+        """ 
+        Commits and closes the holdings, fingerprint, state and ledger
+        databases, for a manager that won't be used again.
+
+        Parameters:
+        - None
+
+        Return:
+        - None
+        """
+        for store in (self.holdings_store, self.fingerprint_store, self.state_store, self.ledger):
+            if store is not None:
+                store.close()
+        self.holdings_store = None
+        self.fingerprint_store = None
+        self.state_store = None
+        self.ledger = None
+
+    def _journal_(self, op:str, **fields):
+        if self.journal is not None:
+            self.journal.append(op, **fields)
+
+    def _deleteOutcome_(self, oclcNumber:str, action:str):
+        """ 
+        Journals and saves the outcome of an unset request.
+
+        Parameters:
+        - oclcNumber that was unset.
+        - action like 'done' or 'failed'.
+
+        Return:
+        - None
+        """
+        if action == COMPLETED:
+            self.completed_unsets.add(oclcNumber)
+        if self.state_store is not None:
+            self.state_store.updateDelete(oclcNumber, action)
+        self._journal_(UNSET_OP, oclcNumber=oclcNumber, action=action)
+        if self.checkpointer is not None:
+            self.checkpointer.tick()
+
+    def _recordOutcome_(self, op:str, record:Record, requestedNumber:str, fromAction:str, action:str=None):
+        """ 
+        Journals and saves the outcome of a request for a record.
+
+        Parameters:
+        - op the journal operation like 'set' or 'match'.
+        - record after the response was applied.
+        - requestedNumber the OCLC number the record had before the request.
+        - fromAction the action the record had before the request.
+        - action to record if not the record's current action.
+
+        Return:
+        - None
+        """
+        if self.state_store is not None:
+            self.state_store.updateRecord(record)
+        elif self.checkpointer is not None:
+            self.checkpoint_changed[record.index_seq] = record
+        if self.journal is not None:
+            self.journal.append(op, tcn=record.getTitleControlNumber(), requested=requestedNumber,
+                fromAction=fromAction, action=action if action else record.getAction(),
+                oclcNumber=record.getOclcNumber(), previousNumber=record.prev_oclc_number)
+        if self.checkpointer is not None:
+            self.checkpointer.tick()
+
+    def _overlayWritten_(self, record:Record):
+        """ 
+        Marks a record as written to the bib overlay with its current OCLC
+        number, and saves the mark with the record's state and in the
+        journal so a recovered run doesn't write it again.
+
+        Parameters:
+        - record that was written.
+
+        Return:
+        - None
+        """
+        record.overlay_number = record.getOclcNumber()
+        if self.state_store is not None:
+            self.state_store.updateRecord(record)
+        elif self.checkpointer is not None:
+            self.checkpoint_changed[record.index_seq] = record
+        self._journal_(OVERLAY_OP, tcn=record.getTitleControlNumber(), oclcNumber=record.getOclcNumber())
+
+    def replayJournal(self, fileName:str) -> int:
+        """ 
+        Re-applies the outcomes saved in a journal to the current add records
+        and delete list so processing resumes where it stopped. Records are 
+        found by TCN, the OCLC number they were sent with, and the action 
+        they had at the time, so outcomes already reflected in a checkpoint
+        are skipped.
+
+        Parameters:
+        - fileName of the journal.
+
+        Return:
+        - Number of outcomes replayed.
+        """
+        by_key = {}
+        for record in self.add_records:
+            by_key.setdefault((record.getTitleControlNumber(), record.getOclcNumber()), []).append(record)
+        replayed = 0
+        unset_numbers = set()
+        for entry in readJournal(fileName):
+            op = entry.get('op')
+            if op == UNSET_OP:
+                unset_numbers.add(entry.get('oclcNumber'))
+                replayed += 1
+                continue
+            tcn = entry.get('tcn')
+            if op == OVERLAY_OP:
+                for record in by_key.get((tcn, entry.get('oclcNumber')), []):
+                    record.overlay_number = entry.get('oclcNumber')
+                continue
+            # LBD deletes are part of an unset which is journaled after it.
+            if op not in (SET_OP, MATCH_OP, NEWBIB_OP):
+                continue
+            candidates = by_key.get((tcn, entry.get('requested')), [])
+            for record in candidates:
+                if record.getAction() == entry.get('fromAction'):
+                    candidates.remove(record)
+                    record.oclc_number = entry.get('oclcNumber')
+                    record.prev_oclc_number = entry.get('previousNumber')
+                    record._setAction_(entry.get('action'))
+                    by_key.setdefault((tcn, record.getOclcNumber()), []).append(record)
+                    replayed += 1
+                    break
+        if unset_numbers:
+            self.delete_numbers = [oclc_number for oclc_number in self.delete_numbers if oclc_number not in unset_numbers]
+        logit(f"replayed {replayed} outcome(s) from {fileName}")
+        return replayed
+
     ###### Record Management methods ######
     def addBibRecord(self, configs:str='prod.json', records:list=[],  recordLimit:int=-1) -> str:
         ws = AddBibWebService(configFile=configs, debug=self.debug)
         for record in records:
             # get the record and add it as a bib.
             try:
-                xmlResponse = ws.sendRequest(xmlBibRecord=record.asXml(useMinFields=False, ignoreControlNumber=True))
+                xmlResponse = ws.sendRequest(xmlBibRecord=record.asXml(useMinFields=False, ignoreControlNumber=True), tcn=record.getTitleControlNumber())
                 # This could throw an IndexError if none no OCLC number returned.
                 returnedNumberList = self.extract_oclc_numbers(xmlResponse)
                 if len(returnedNumberList) > 0:
@@ -600,6 +1232,33 @@ class RecordManager:
 
 
 
+    def _startProgress_(self, name:str, total:int):
+        """ 
+        Starts logging the progress of a stage every progress_seconds, in
+        place of a line per record. Errors are the stage's error count.
+
+        Parameters:
+        - name of the stage and its error_count key.
+        - total number of items the stage will process.
+
+        Return:
+        - None
+        """
+        if self.progress_seconds > 0:
+            self.progress = Progress(name, total, everySeconds=self.progress_seconds, errors=lambda: self.error_count.get(name, 0))
+
+    def _finishProgress_(self):
+        if self.progress is not None:
+            self.progress.finish()
+            self.progress = None
+
+    def _logRecord_(self, message:str):
+        """ 
+        Logs a line about a single record, unless progress lines are on.
+        """
+        if self.progress is None:
+            logit(message)
+
     def setHoldings(self, configs:str='prod.json', records:list=[],  recordLimit:int=-1) -> bool:
         """ 
         Sets holdings based on the add list. If a record receives and updated 
@@ -637,61 +1296,145 @@ class RecordManager:
         - True if there were no critical web service errors and False otherwise. A critical web service error requires saving a check point of work done.
         """
         records_processed = 0
-        error_count       = 0
         if records:
             if recordLimit >= 0:
                 self.add_records = records[:recordLimit]
                 logit(f"Limit set to {recordLimit}. Total set records: {len(self.add_records)}")
             else:
                 self.add_records = records[:]
-        records_processed = 0
         ws = SetWebService(configFile=configs, debug=self.debug)
-        for record in self.add_records:
-            # Records can be SET or UPDATED
-            if not (record.getAction() == SET or record.getAction() == UPDATED or record.getAction() == MATCH):
-                self.add_records.pop(0)
-                continue
-            oclc_number = record.getOclcNumber()
-            if oclc_number:
+        # Records can be SET or UPDATED
+        queue = WorkQueue(self.action_index.records(SET, UPDATED, MATCH), name='set')
+        self.queues[queue.name] = queue
+        self._startProgress_('set', queue.pendingCount())
+        try:
+            while queue.hasNext():
+                if recordLimit >= 0 and records_processed >= recordLimit:
+                    logit(f"setHoldings found {self.error_count['set']} errors in {records_processed} (limited)")
+                    return True
+                if self.pastDeadline():
+                    return True
+                (position, record) = queue.next()
+                if self.progress is not None:
+                    self.progress.tick()
+                if not record.getOclcNumber():
+                    queue.done(position)
+                    continue
+                records_processed += 1
                 try:
-                    response = ws.sendRequest(oclcNumber=oclc_number)
+                    if not self._setHolding_(ws, record):
+                        # Don't set the record to any status, this failure is a web-services problem.
+                        return True
                 except Exception as e:
                     logit(f"The setHoldings web service reported an error. Saving state because:\n{e}")
                     self.error_count['set'] += 1
                     return False
-                if recordLimit >= 0 and records_processed >= recordLimit:
-                    logit(f"setHoldings found {error_count} errors in {records_processed} (limited)")
-                    return True
-                records_processed += 1
-                if ws.status_code != 200:
-                    logit(f"Server error status: {ws.status_code} on TCN {record.getTitleControlNumber()}")
-                    self.error_count['set'] += 1
-                    # Don't set the record to any status, this failure is a web-services problem.
-                    return True
-                # OCLC couldn't find the OCLC number sent do do a lookup of the record.
-                if not response.get('controlNumber'):
-                    if record.getAction() == SET:
-                        record.setLookupMatch()
-                    elif record.getAction() == UPDATED:
-                        record.setFailed()
-                # The control number sent has been updated by OCLC.
-                elif response.get('requestedControlNumber') != response.get('controlNumber'):
-                    record.updateOclcNumber(response.get('controlNumber'))
-                    # These records will be output to slim flat file for bib overlay.
-                    record.setUpdated()
-                # Some other error which requires staff to take a look at.
-                elif not response.get('success'):
-                    tcn = record.getTitleControlNumber()
-                    self.errors[tcn] = response
-                    self.error_count['set'] += 1
-                    logit(f"{tcn} -> {response}")
-                    record.setFailed()
-                else: # Done with this record.
-                    record.setCompleted()
-                    logit(f"{oclc_number} holding set")
+                queue.done(position)
+        finally:
+            self._finishProgress_()
         logit(f"setHoldings found {self.error_count['set']} errors")
         return True
 
+    def _setHolding_(self, ws:SetWebService, record:Record) -> bool:
+        """ 
+        Sends a single set holding request and updates the record with the 
+        result. See setHoldings() for the responses.
+
+        Parameters:
+        - ws the SetWebService to send the request with.
+        - record to set as a holding.
+
+        Return:
+        - True if OCLC answered and the record was updated, and False if the 
+          server returned an error status, in which case the record is unchanged.
+          Exceptions from the web service are passed to the caller.
+        """
+        if self._confirmedSet_(record):
+            return True
+        oclc_number = record.getOclcNumber()
+        from_action = record.getAction()
+        response = ws.sendRequest(oclcNumber=oclc_number)
+        return self._applySetResponse_(ws.status_code, response, record, oclc_number, from_action)
+
+    def _confirmedSet_(self, record:Record) -> bool:
+        """ 
+        Applies the outcome of a set request the ledger shows OCLC already
+        confirmed, in place of sending it again.
+
+        Parameters:
+        - record to set as a holding.
+
+        Return:
+        - True if the set was confirmed and the record updated, and False if
+          the request still needs to be sent.
+        """
+        if self.ledger is None:
+            return False
+        oclc_number = record.getOclcNumber()
+        control_number = self.ledger.lookup(SET_OP, oclc_number)
+        if control_number is None:
+            return False
+        from_action = record.getAction()
+        self._logRecord_(f"{oclc_number} holding already set")
+        if control_number != oclc_number:
+            record.updateOclcNumber(control_number)
+            record.setUpdated()
+        else:
+            record.setCompleted()
+        self._recordOutcome_(SET_OP, record, oclc_number, from_action)
+        return True
+
+    def _applySetResponse_(self, status:int, response:dict, record:Record, oclcNumber:str, fromAction:str) -> bool:
+        """ 
+        Updates a record with the response to a set holding request.
+
+        Parameters:
+        - status of the web service after the request.
+        - response from OCLC.
+        - record that was sent.
+        - oclcNumber that was sent.
+        - fromAction the action the record had when the request was sent.
+
+        Return:
+        - True if the record was updated, and False if the server returned 
+          an error status, in which case the record is unchanged.
+        """
+        if status != 200:
+            logit(f"Server error status: {status} on TCN {record.getTitleControlNumber()}")
+            self.error_count['set'] += 1
+            return False
+        # OCLC couldn't find the OCLC number sent do do a lookup of the record.
+        if not response.get('controlNumber'):
+            if record.getAction() == SET:
+                record.setLookupMatch()
+            elif record.getAction() == UPDATED:
+                record.setFailed()
+        # The control number sent has been updated by OCLC.
+        elif response.get('requestedControlNumber') != response.get('controlNumber'):
+            if self.holdings_store is not None:
+                self.holdings_store.replace(response.get('requestedControlNumber'), response.get('controlNumber'))
+            if self.ledger is not None:
+                self.ledger.confirm(SET_OP, oclcNumber, response.get('controlNumber'))
+            record.updateOclcNumber(response.get('controlNumber'))
+            # These records will be output to slim flat file for bib overlay.
+            record.setUpdated()
+        # Some other error which requires staff to take a look at.
+        elif not response.get('success'):
+            tcn = record.getTitleControlNumber()
+            self.errors[tcn] = response
+            self.error_count['set'] += 1
+            logit(f"{tcn} -> {response}")
+            record.setFailed()
+        else: # Done with this record.
+            record.setCompleted()
+            if self.holdings_store is not None:
+                self.holdings_store.add(oclcNumber)
+            if self.ledger is not None:
+                self.ledger.confirm(SET_OP, oclcNumber)
+            self._logRecord_(f"{oclcNumber} holding set")
+        self._recordOutcome_(SET_OP, record, oclcNumber, fromAction)
+        return True
+
     def unsetHoldings(self, configs:str='prod.json', oclcNumbers:list=[], deleteLBD:bool=True, recordLimit:int=-1) -> bool:
         """ 
         Deletes holdings from OCLC's database.
@@ -721,47 +1464,114 @@ class RecordManager:
         - True if there were no critical web service errors and False otherwise. A critical web service error requires saving a check point of work done.
         """
         records_processed = 0
-        error_count       = 0
         if oclcNumbers:
             if recordLimit >= 0:
                 self.delete_numbers = oclcNumbers[:recordLimit]
                 logit(f"Limit of {recordLimit} selected. Total unset transactions: {len(self.delete_numbers)}")
             else:
                 self.delete_numbers = oclcNumbers[:]
-        records_processed = 0
         ws = UnsetWebService(configFile=configs, debug=self.debug)
-        for oclc_number in self.delete_numbers:
-            if not oclc_number:
-                self.delete_numbers.pop(0)
-                continue
-            if recordLimit >= 0 and records_processed >= recordLimit:
-                logit(f"unsetHoldings found {error_count} errors in {records_processed} (limited)")
-                return True
-            records_processed += 1
-            try:
-                response = ws.sendRequest(oclcNumber=oclc_number)
-            except Exception as e:
-                logit(f"The unsetHoldings web service reported an error. Saving state because:\n{e}")
-                return False
-            if ws.status_code != 200:
-                logit(f"Server error status: {ws.status_code} on OCLC number {oclc_number}")
-                self.error_count['unset'] += 1
-                return True
-            # OCLC couldn't find the OCLC number sent do do a lookup of the record.
-            if not response.get('controlNumber'):
-                self.error_count['unset'] += 1
-                logit(f"{oclc_number} not a listed holding")
-            # Some other error which requires staff to take a look at.
-            elif not response.get('success') and 'delete attached LBD' in response.get('message'):
-                logit(f"OCLC suggests removing LBD {oclc_number} (if you own it)")
-                if deleteLBD:
+        queue = WorkQueue(self.delete_numbers, name='unset')
+        # Checkpoints save the outstanding numbers from the queue.
+        self.unset_queue = queue
+        self.queues[queue.name] = queue
+        self._startProgress_('unset', queue.pendingCount())
+        try:
+            while queue.hasNext():
+                if recordLimit >= 0 and records_processed >= recordLimit:
+                    logit(f"unsetHoldings found {self.error_count['unset']} errors in {records_processed} (limited)")
+                    return True
+                if self.pastDeadline():
+                    return True
+                (position, oclc_number) = queue.next()
+                if self.progress is not None:
+                    self.progress.tick()
+                if not oclc_number:
+                    queue.done(position)
+                    continue
+                if self._confirmedUnset_(oclc_number):
+                    queue.done(position)
+                    continue
+                records_processed += 1
+                try:
+                    response = ws.sendRequest(oclcNumber=oclc_number)
+                except Exception as e:
+                    logit(f"The unsetHoldings web service reported an error. Saving state because:\n{e}")
+                    return False
+                outcome = self._applyUnsetResponse_(ws.status_code, response, oclc_number)
+                if outcome is None:
+                    return True
+                if outcome == COMPLETED:
+                    queue.done(position)
+                else:
+                    queue.fail(position)
+                if outcome == LBD_OP and deleteLBD and not self._confirmedLbd_(oclc_number):
                     self.error_count['unset'] += self.deleteLocalBibData(configFile=configs, oclcNumber=oclc_number)
-            else: # Done with this record.
-                logit(f"removed holding with OCLC number {oclc_number}")
-            self.delete_numbers.remove(oclc_number)
+        finally:
+            # Whatever happens, only the outstanding numbers are left to delete.
+            self.delete_numbers = queue.remaining()
+            self._finishProgress_()
+            self.unset_queue = None
         logit(f"unsetHoldings found {self.error_count['unset']} errors")
         return True
 
+    def _confirmedUnset_(self, oclcNumber:str) -> bool:
+        """ 
+        Tests if the ledger shows OCLC already removed a holding, and if so
+        saves the outcome in place of sending the request again.
+
+        Parameters:
+        - oclcNumber to unset.
+
+        Return:
+        - True if the unset was confirmed, and False if the request still 
+          needs to be sent.
+        """
+        if self.ledger is None or self.ledger.lookup(UNSET_OP, oclcNumber) is None:
+            return False
+        self._logRecord_(f"{oclcNumber} holding already removed")
+        self._deleteOutcome_(oclcNumber, COMPLETED)
+        return True
+
+    def _applyUnsetResponse_(self, status:int, response:dict, oclcNumber:str) -> str:
+        """ 
+        Saves the outcome of an unset holding request.
+
+        Parameters:
+        - status of the web service after the request.
+        - response from OCLC.
+        - oclcNumber that was sent.
+
+        Return:
+        - COMPLETED if the holding was removed, FAILED if it wasn't, LBD_OP
+          if it wasn't because local bib data is attached, or None if the
+          server returned an error status and the number is still pending.
+        """
+        if status != 200:
+            logit(f"Server error status: {status} on OCLC number {oclcNumber}")
+            self.error_count['unset'] += 1
+            return None
+        # OCLC couldn't find the OCLC number sent do do a lookup of the record.
+        if not response.get('controlNumber'):
+            self.error_count['unset'] += 1
+            if self.holdings_store is not None:
+                self.holdings_store.remove(oclcNumber)
+            logit(f"{oclcNumber} not a listed holding")
+            outcome = FAILED
+        # Some other error which requires staff to take a look at.
+        elif not response.get('success') and 'delete attached LBD' in response.get('message'):
+            logit(f"OCLC suggests removing LBD {oclcNumber} (if you own it)")
+            outcome = LBD_OP
+        else: # Done with this record.
+            if self.holdings_store is not None:
+                self.holdings_store.remove(oclcNumber)
+            if self.ledger is not None:
+                self.ledger.confirm(UNSET_OP, oclcNumber)
+            self._logRecord_(f"removed holding with OCLC number {oclcNumber}")
+            outcome = COMPLETED
+        self._deleteOutcome_(oclcNumber, COMPLETED if outcome == COMPLETED else FAILED)
+        return outcome
+
     def deleteLocalBibData(self, oclcNumber:str, configFile:str='prod.json') -> bool:
         """ 
         Deletes Local Bib Data. If your institution doesn't own the bib data 
@@ -783,10 +1593,33 @@ class RecordManager:
         Return:
         - True if there were no critical web service errors and False otherwise. A critical web service error requires saving a check point of work done.
         """
+        if self._confirmedLbd_(oclcNumber):
+            return True
         ws = DeleteWebService(configFile=configFile, debug=self.debug)
         response = ws.sendRequest(oclcNumber=oclcNumber)
-        if ws.status_code != 200:
-            logit(f"Server error status: {ws.status_code} on OCLC number {oclcNumber}")
+        return self._applyLbdResponse_(ws.status_code, response, oclcNumber)
+
+    def _confirmedLbd_(self, oclcNumber:str) -> bool:
+        if self.ledger is None or self.ledger.lookup(LBD_OP, oclcNumber) is None:
+            return False
+        self._logRecord_(f"{oclcNumber} LBD already deleted")
+        return True
+
+    def _applyLbdResponse_(self, status:int, response:dict, oclcNumber:str) -> bool:
+        """ 
+        Saves the outcome of a local bib data delete request. See 
+        deleteLocalBibData() for the responses.
+
+        Parameters:
+        - status of the web service after the request.
+        - response from OCLC.
+        - oclcNumber that was sent.
+
+        Return:
+        - True if there were no critical web service errors and False otherwise.
+        """
+        if status != 200:
+            logit(f"Server error status: {status} on OCLC number {oclcNumber}")
             self.error_count['delete'] += 1
             return True
         try:
@@ -798,11 +1631,93 @@ class RecordManager:
                 return False            
             if 'CONFLICT' in response.get('type'):
                 logit(f"{oclcNumber} {description} {reason}")
+                self._journal_(LBD_OP, oclcNumber=oclcNumber, action=FAILED, reason=reason)
+            else:
+                if self.ledger is not None:
+                    self.ledger.confirm(LBD_OP, oclcNumber)
+                self._journal_(LBD_OP, oclcNumber=oclcNumber, action=COMPLETED)
         except AttributeError:
             if self.debug:
                 logit(f"{oclcNumber} failed with response:\n{response}")
         return True
   
+    def _applyMatchResponse_(self, status:int, response:dict, record:Record, requestedNumber:str) -> str:
+        """ 
+        Updates a record with the response to a match request.
+
+        Parameters:
+        - status of the web service after the request.
+        - response from OCLC.
+        - record that was sent.
+        - requestedNumber the OCLC number the record had when it was sent.
+
+        Return:
+        - UPDATED if OCLC matched the record to a bib, NEWBIB_OP if the record
+          needs to be added as a new bib, FAILED if the match failed, or None
+          if the server returned an error status and the record is unchanged.
+        """
+        if status != 200:
+            logit(f"Server error status: {status} on record {record.getTitleControlNumber()}")
+            self.error_count['match'] += 1
+            return None
+        brief_records = response.get('briefRecords')
+        if brief_records:
+            new_number = brief_records[0].get('oclcNumber')
+            if not new_number:
+                return NEWBIB_OP
+            record.updateOclcNumber(new_number)
+            record.setUpdated()
+            self._recordOutcome_(MATCH_OP, record, requestedNumber, MATCH)
+            return UPDATED
+        self._matchFailed_(record, requestedNumber, response)
+        return FAILED
+
+    def _applyNewBib_(self, record:Record, requestedNumber:str, newNumber:str) -> bool:
+        """ 
+        Updates a record with the OCLC number of the bib added for it.
+
+        Parameters:
+        - record that was added as a new bib.
+        - requestedNumber the OCLC number the record had when it was matched.
+        - newNumber of the new bib, or an empty string if it wasn't added.
+
+        Return:
+        - True if the record was updated and its holding needs to be set.
+        """
+        if not newNumber:
+            return False
+        record.updateOclcNumber(newNumber)
+        # If interrupted from here on, the new bib only needs its holding set.
+        self._recordOutcome_(NEWBIB_OP, record, requestedNumber, MATCH, action=UPDATED)
+        return True
+
+    def _newBibSet_(self, record:Record, requestedNumber:str):
+        record.setUpdated()
+        self._recordOutcome_(MATCH_OP, record, requestedNumber, MATCH)
+
+    def _matchFailed_(self, record:Record, requestedNumber:str, response:dict):
+        """ 
+        Logs a record that couldn't be matched or added, and marks it failed
+        so it isn't sent again.
+
+        Parameters:
+        - record that was sent.
+        - requestedNumber the OCLC number the record had when it was matched.
+        - response from the match request, saved for diagnostics.
+
+        Return:
+        - None
+        """
+        tcn = record.getTitleControlNumber()
+        logit(f"{tcn} match results {response}")
+        sampler = getSampler()
+        if sampler is not None and sampler.anomaly(failed=True):
+            logit(f"DEBUG failed: {tcn} sent {sampler.truncate(record.asXml())}")
+        self.errors[tcn] = response
+        # Stop the record getting reprocessed.
+        record.setFailed()
+        self._recordOutcome_(MATCH_OP, record, requestedNumber, MATCH)
+
     def matchHoldings(self, configs:str='prod.json', records:list=[], recordLimit:int=-1) -> bool:
         """ 
         Matches local records that are missing OCLC numbers to known bibs at OCLC, and updates the record with 
@@ -823,62 +1738,79 @@ class RecordManager:
             else:
                 self.add_records = records[:]
         ws = MatchWebService(configFile=configs, debug=self.debug)
+        set_ws = SetWebService(configFile=configs, debug=self.debug)
         records_processed = 0
-        for record in self.add_records:
-            if record.getAction() != MATCH:
-                continue
-            if recordLimit >= 0 and records_processed >= recordLimit:
-                logit(f"matchHoldings found {error_count} errors in {records_processed} (limited)")
-                return True
-            records_processed += 1
-            # response code 400 headers: '{'Date': 'Wed, 12 Jun 2024 20:00:45 GMT', 'Content-Type': 'application/json;charset=UTF-8', 'Content-Length': '106', 'Connection': 'keep-alive', ... 'Expires': '0', 'X-Content-Type-Options': 'nosniff', 'Pragma': 'no-cache', 'x-amzn-Remapped-Date': 'Wed, 12 Jun 2024 20:00:45 GMT'}'
-            # content: 'b'{"type":"BAD_REQUEST","title":"Unable to crosswalk the record.","detail":"The record has parsing errors."}''
-            # epl01376669 -> {'type': 'BAD_REQUEST', 'title': 'Unable to crosswalk the record.', 'detail': 'The record has parsing errors.'}
-            try:
-                response = ws.sendRequest(xmlBibRecord=record.asXml())
-            except Exception as e:
-                logit(f"The matchHoldings web service reported an error. Saving state because:\n{e}")
-                return False
-            if ws.status_code != 200:
-                logit(f"Server error status: {ws.status_code} on record {record.getTitleControlNumber()}")
-                self.error_count['match'] += 1
-                return True
-            brief_records = response.get('briefRecords')
-            if brief_records:
+        self._startProgress_('match', self.action_index.count(MATCH))
+        try:
+            for record in self.action_index.records(MATCH):
+                if recordLimit >= 0 and records_processed >= recordLimit:
+                    logit(f"matchHoldings found {error_count} errors in {records_processed} (limited)")
+                    return True
+                if self.pastDeadline():
+                    return True
+                records_processed += 1
+                if self.progress is not None:
+                    self.progress.tick()
+                requested_number = record.getOclcNumber()
+                # response code 400 headers: '{'Date': 'Wed, 12 Jun 2024 20:00:45 GMT', 'Content-Type': 'application/json;charset=UTF-8', 'Content-Length': '106', 'Connection': 'keep-alive', ... 'Expires': '0', 'X-Content-Type-Options': 'nosniff', 'Pragma': 'no-cache', 'x-amzn-Remapped-Date': 'Wed, 12 Jun 2024 20:00:45 GMT'}'
+                # content: 'b'{"type":"BAD_REQUEST","title":"Unable to crosswalk the record.","detail":"The record has parsing errors."}''
+                # epl01376669 -> {'type': 'BAD_REQUEST', 'title': 'Unable to crosswalk the record.', 'detail': 'The record has parsing errors.'}
                 try:
-                    new_number = brief_records[0].get('oclcNumber')
-                    if new_number:
-                        record.updateOclcNumber(new_number)
-                        record.setUpdated()
+                    response = ws.sendRequest(xmlBibRecord=record.asXml(), tcn=record.getTitleControlNumber())
+                except Exception as e:
+                    logit(f"The matchHoldings web service reported an error. Saving state because:\n{e}")
+                    return False
+                outcome = self._applyMatchResponse_(ws.status_code, response, record, requested_number)
+                if outcome is None:
+                    return True
+                if outcome != NEWBIB_OP:
+                    continue
+                # Need to create a new bib, get the OCLC number
+                # and set it as a holding for the library then update 
+                # the record.
+                self._logRecord_(f"adding TCN {record.getTitleControlNumber()} as new bib.")
+                new_number = self.addBibRecord(configs=configs, records=[record])
+                if self._applyNewBib_(record, requested_number, new_number):
+                    try:
+                        is_set = self._setHolding_(set_ws, record)
+                    except Exception as e:
+                        logit(f"The setHoldings web service reported an error:\n{e}")
+                        is_set = False
+                    if is_set:
+                        self._newBibSet_(record, requested_number)
                         continue
-                    else:
-                        # Need to create a new bib, get the OCLC number
-                        # and set it as a holding for the library then update 
-                        # the record.
-                        logit(f"adding TCN {record.getTitleControlNumber()} as new bib.")
-                        new_number = self.addBibRecord(configs=configs, records=[record])
-                        if new_number:
-                            record.updateOclcNumber(new_number)
-                            if self.setHoldings(configs=configs, records=[record]):
-                                record.setUpdated()
-                                continue
-                except IndexError:
-                    pass
-            # Save the response for diagnostics
-            tcn = record.getTitleControlNumber()
-            logit(f"{tcn} match results {response}")
-            self.errors[tcn] = response
-            # Stop the record getting reprocessed.
-            record.setFailed()
+                self._matchFailed_(record, requested_number, response)
+        finally:
+            self._finishProgress_()
         logit(f"matchHoldings found {self.error_count['match']} errors")
         return True
     
+    def pastDeadline(self) -> bool:
+        """ 
+        Tests if the run's deadline leaves no time for new requests. The
+        requests in flight are still finished.
+
+        Parameters:
+        - None
+
+        Return:
+        - True if no more requests should be sent and False otherwise.
+        """
+        if self.deadline is None or not self.deadline.passed():
+            return False
+        if not self.deadline_reached:
+            self.deadline_reached = True
+            logit(f"stopping for the deadline of {self.deadline}, no more requests will be sent", timestamp=True)
+        return True
+
     ####### End of Record Update methods #########
     def generateUpdatedSlimFlat(self, flatFile:str=None):
         """ 
         Writes a slim flat file of the records that need to be updated in the ILS.
         By default the output is to stdout, but if a file name is provided, any
-        updated records will be appended to that file.
+        updated records will be appended to that file. Records already written
+        with their current OCLC number are skipped, so running the update
+        again on the same manager, or recovering it, doesn't repeat them.
 
         Parameters:
         - flatFile name of the flat file to append the slim-flat record.
@@ -887,11 +1819,17 @@ class RecordManager:
         - The number of records that were output to the slim flat file.
         """
         records_as_slim = 0
-        for record in self.add_records:
-            if record.getAction() == UPDATED:
-                # Appends data to file_name or stdout if not provided. See record asSlimFlat
-                record.asSlimFlat(fileName=flatFile)
-                records_as_slim += 1
+        # Updated records whose holding has since been set are completed,
+        # but still carry a new OCLC number for the ILS.
+        for record in self.action_index.records(UPDATED, COMPLETED):
+            if record.getAction() == COMPLETED and not record.isOclcNumberUpdated():
+                continue
+            if record.overlay_number == record.getOclcNumber():
+                continue
+            # Appends data to file_name or stdout if not provided. See record asSlimFlat
+            record.asSlimFlat(fileName=flatFile)
+            self._overlayWritten_(record)
+            records_as_slim += 1
         return records_as_slim
 
     def _showResults_(self):
@@ -910,44 +1848,157 @@ class RecordManager:
         # Print out errors
         for key, value in self.error_count.items():
             logit(f"{key} errors: {value}")
+        if self.timer.stages:
+            for line in self.timer.report(records=self.run_record_count):
+                logit(line)
+        for line in WebService.latencies.report():
+            logit(line)
 
-    def runUpdate(self, webServiceConfig:str='prod.json', recordLimit=-1):
+    def runUpdate(self, webServiceConfig:str='prod.json', recordLimit=-1, ingest=None):
         """ 
         Convience method that runs all updates (adds, deletes, and matching).
 
         Parameters:
         - Configuration JSON file.
+        - ingest optional Ingest to read and normalize the add records while
+          they are sent, with the pipelined update.
 
         Return:
         - None
         """
-        if not self.unsetHoldings(configs=webServiceConfig, recordLimit=recordLimit):
+        self.run_record_count = len(self.add_records) + len(self.delete_numbers)
+        # Outcomes are saved to the state database as they happen. Streamed
+        # records are saved once they have all been read.
+        if ingest is None:
+            with self.timer.stage('snapshot'):
+                self._snapshotState_()
+        if self.pipeline_workers > 0 or ingest is not None:
+            # Each record moves on to match and re-set as soon as it can.
+            with self.timer.stage('pipeline'):
+                pipeline = UpdatePipeline(self, configs=webServiceConfig, workers=self.pipeline_workers, recordLimit=recordLimit, scheduler=self.scheduler)
+                if ingest is not None:
+                    ingest.start()
+                pipeline_ok = pipeline.run(ingest=ingest)
+            if ingest is not None:
+                self.run_record_count = len(self.add_records) + ingest.delete_count
+        else:
+            self._runStages_(webServiceConfig, recordLimit)
+            pipeline_ok = True
+        # Add date to bib overlay file name. The overlay is written before
+        # any state is saved, so the saved records know they are in it.
+        bib_overlay_file_name = overlayFileName(self.configs.get('bibOverlayFileName'), datetime.now().strftime('%Y%m%d'), self.shard)
+        with self.timer.stage('slim flat'):
+            self.generateUpdatedSlimFlat(bib_overlay_file_name)
+        if not pipeline_ok:
+            self._showResults_()
+            self.saveState()
+        elif self.deadline_reached and self.getRemainingCount() > 0:
+            # Save the work left for the next window.
+            self.saveState()
+        with self.timer.stage('save'):
+            if self.holdings_store is not None:
+                self.holdings_store.commit()
+            if self.state_store is not None:
+                self.state_store.saveErrors(self.error_count)
+                self.state_store.commit()
+            self._stopCheckpoints_()
+            self.saveFingerprints()
+            if self.shard is not None:
+                self.saveErrorReport(errorReportName(shard=self.shard))
+        self._showResults_()
+        if self.deadline_reached:
+            self._showRemaining_()
+
+    def _showRemaining_(self):
+        """ 
+        Reports the requests left when the run stopped for its deadline.
+
+        Parameters:
+        - None
+
+        Return:
+        - None
+        """
+        deletes = len(self.delete_numbers)
+        sets = self.getRecordCount(SET)
+        matches = self.getRecordCount(MATCH)
+        updates = self.getRecordCount(UPDATED)
+        logit(f"deadline reached: {deletes} delete(s), {sets} set(s), {matches} match(es) and {updates} updated number(s) left.")
+        if self.getRemainingCount() > 0:
+            logit(f"use --recover to finish them.")
+
+    def _runStages_(self, webServiceConfig:str, recordLimit:int):
+        """ 
+        Runs the unset, set, match and second set passes one after another.
+
+        Parameters:
+        - webServiceConfig configuration JSON file.
+        - recordLimit maximum records per pass, -1 for all.
+
+        Return:
+        - None
+        """
+        with self.timer.stage('unset'):
+            unset_ok = self.unsetHoldings(configs=webServiceConfig, recordLimit=recordLimit)
+        if not unset_ok:
             self._showResults_()
             self.saveState()
             # return
         # This will add some holdings, but fail because the numbers have changed. 
         # That feed back is reflected in the records, and those that need updating
         # will be resent.
-        if not self.setHoldings(configs=webServiceConfig, recordLimit=recordLimit):
+        with self.timer.stage('set'):
+            set_ok = self.setHoldings(configs=webServiceConfig, recordLimit=recordLimit)
+        if not set_ok:
             self._showResults_()
             self.saveState()
             # return
-        # Send failed set requests back for matching.
-        if not self.matchHoldings(configs=webServiceConfig, recordLimit=recordLimit):
+        # Send failed set requests back for matching. Add bib and set
+        # requests made while matching are counted in this stage.
+        with self.timer.stage('match'):
+            match_ok = self.matchHoldings(configs=webServiceConfig, recordLimit=recordLimit)
+        if not match_ok:
             self._showResults_()
             self.saveState()
             # return
         # Second round for records with updates.
-        if not self.setHoldings(configs=webServiceConfig, recordLimit=recordLimit):
+        with self.timer.stage('set updated'):
+            set_ok = self.setHoldings(configs=webServiceConfig, recordLimit=recordLimit)
+        if not set_ok:
             self._showResults_()
             self.saveState()
             # return
-        # Add date to bib overlay file name. 
-        bib_overlay_file_name = f"{self.configs.get('bibOverlayFileName')}_{datetime.now().strftime('%Y%m%d')}.flat"
-        self.generateUpdatedSlimFlat(bib_overlay_file_name)
 
     
 # Main entry to the application if not testing.
+def _newManager_(args, rejectTags:dict, deadline:Deadline=None) -> RecordManager:
+    """ 
+    Creates a record manager with the settings on the command line.
+
+    Parameters:
+    - args parsed command line arguments.
+    - rejectTags dictionary of tags that reject a bib record.
+    - deadline optional Deadline of the run.
+
+    Return:
+    - RecordManager
+    """
+    manager = RecordManager(ignoreTags=rejectTags, debug=args.debug, configFile=args.config, holdingsDb=args.holdings_db, fingerprintDb=args.fingerprint_db, stateDb=args.state_db, compressCheckpoints=args.compress_checkpoints, ledgerDb=args.ledger_db,
+        holdingsReadOnly=args.shard is not None)
+    if args.shard:
+        manager.shard = args.shard
+        manager.backup_prefix = f"oclc_update_{args.shard.tag}_"
+        manager.seed_holdings = False
+    manager.progress_seconds = args.progress
+    manager.pipeline_workers = args.pipeline
+    manager.deadline = deadline
+    if args.schedule:
+        (weights, caps) = args.schedule
+        manager.scheduler = WorkScheduler(weights=weights, caps=caps)
+        if manager.pipeline_workers <= 0:
+            manager.pipeline_workers = PIPELINE_WORKERS
+    return manager
+
 def main(argv):
     """ 
     Main function, entry point for the application.
@@ -973,13 +2024,41 @@ def main(argv):
     parser.add_argument('--add', action='store', metavar='[/foo/my_nums.flat|.mrk]', help='List of bib records to add as holdings. This flag can read both flat and mrk format.')
     parser.add_argument('--config', action='store', default='prod.json', metavar='[/foo/prod.json]', help='Optional alternate configurations for running oclc.py and report.py. The default behaviour looks for a file called prod.json in the working directory.')
     parser.add_argument('-d', '--debug', action='store_true', default=False, help='Turns on debugging.')
+    parser.add_argument('--debug-sample', action='store', type=float, default=0.0, metavar='RATE', help='Log debug output for this fraction of records and requests, like 0.01 for 1 in 100, and always for error statuses, exceptions and failed matches. Lighter than --debug. Default 0, off unless --debug-slow is used.')
+    parser.add_argument('--debug-slow', action='store', type=float, default=0.0, metavar='MS', help='With sampled debugging, also log requests slower than MS milliseconds.')
+    parser.add_argument('--daemon', action='store', metavar='[/foo/drop]', help='Run until stopped, updating OCLC with each batch of --add files (.flat, .mrk or .zip) and --delete lists (.lst, .txt or .json) dropped in this directory. The web service session and auth token are kept between updates, and work an update leaves is retried after a backoff of 5 to 45 seconds. Work left by the last process is recovered first. Not used with --add, --delete, --recover, --delta, --report, --stream, --debug or --shard.')
+    parser.add_argument('--debug-max-chars', action='store', type=int, default=2000, metavar='N', help='Longest payload logged by sampled debugging. Default 2000.')
+    parser.add_argument('--deadline', action='store', type=parseDeadline, metavar='HH:MM', help='Time the run has to be finished by, like the end of a maintenance window. New requests stop --drain-seconds before it, the requests in flight are finished, and the state is saved for --recover along with the slim flat file of the records updated so far. A time that has passed today is tomorrow.')
     parser.add_argument('--delete', action='store', metavar='[/foo/oclc_nums.lst]', help='List of OCLC numbers to delete as holdings.')
+    parser.add_argument('--delta', action='store_true', default=False, help='Only send --add records that are new or changed since the last run, and delete the OCLC numbers of records that have vanished. Uses --fingerprint-db.')
+    parser.add_argument('--drain-seconds', action='store', type=float, default=DRAIN_SECONDS, metavar='T', help=f"Seconds before --deadline or --max-runtime that new requests stop, to finish the requests in flight and save the state. Default {DRAIN_SECONDS:.0f}.")
+    parser.add_argument('--fingerprint-db', action='store', metavar='[/foo/fingerprints.db]', help='(Optional) store of record fingerprints saved after each run. Default \'oclc_fingerprints.db\' with --delta.')
+    parser.add_argument('--checkpoint-records', action='store', type=int, default=1000, metavar='N', help='Save a checkpoint every N records processed, 0 for never. Default 1000.')
+    parser.add_argument('--checkpoint-seconds', action='store', type=float, default=300.0, metavar='T', help='Save a checkpoint at least every T seconds, 0 for never. Default 300.')
+    parser.add_argument('--compress-checkpoints', action='store_true', default=False, help='gzip the adds checkpoint file.')
+    parser.add_argument('--ledger-db', action='store', default='oclc_update_ledger.db', metavar='[/foo/ledger.db]', help='SQLite ledger of the set, unset and LBD delete requests OCLC confirmed. It is cleared at the start of a run and kept by --recover so confirmed requests are not sent again. Default \'oclc_update_ledger.db\'.')
+    parser.add_argument('--telemetry', action='store', metavar='[/foo/telemetry.jsonl]', help='(Optional) append one JSON line per OCLC request to this file, with the endpoint, status, latency, bytes sent and received, and the OCLC number or TCN.')
+    parser.add_argument('--state-db', action='store', metavar='[/foo/oclc_update_state.db]', help='(Optional) SQLite database to save the run state in, instead of the oclc_update_*.json files. Use the same file with --recover.')
+    parser.add_argument('--holdings-db', action='store', metavar='[/foo/holdings.db]', help='(Optional) local holdings store. Seeded by --report if used, otherwise used in place of a report to normalize the add and delete lists. Updated with every holding set or unset.')
+    parser.add_argument('--metrics-file', action='store', metavar='[/var/lib/node_exporter/oclc.prom]', help='(Optional) write Prometheus metrics of the run to this file for the node_exporter textfile collector.')
+    parser.add_argument('--metrics-seconds', action='store', type=float, default=15.0, metavar='T', help='Seconds between writes of --metrics-file. Default 15.')
+    parser.add_argument('--latency-file', action='store', metavar='[/foo/oclc_latency.json]', help='(Optional) merge the request latency histograms of the run into this JSON file, so percentiles cover every run. Print it with histogram.py.')
+    parser.add_argument('--max-runtime', action='store', type=parseRuntime, metavar='T', help='Longest the run can take, like 90m, 2h, 1h30m or 5400 seconds, after which it stops as with --deadline. If both are given the earlier is used.')
     parser.add_argument('--limit', action='store', default=-1, help='Limit the number of records processed. Example: 10 would limit to 10 adds and 10 deletes.')
     parser.add_argument('--report', action='store', metavar='[/foo/oclcholdingsreport.csv]', help='(Optional) OCLC\'s holdings report in CSV format which will used to normalize the add and delete lists')
-    parser.add_argument('--recover', action='store_true', default=False, help='Used to recover a previously interrupted process.')
+    parser.add_argument('--profile', action='store', nargs='?', const='all', choices=list(PROFILE_PHASES), metavar='PHASE', help=f"(Optional) profile a phase of the run, one of {', '.join(PROFILE_PHASES)} (default all), with cProfile and log the top memory allocators after each stage. Writes oclc4_PHASE.pstats.")
+    parser.add_argument('--pipeline', action='store', type=int, default=0, metavar='N', help='Send up to N requests at once, moving each record on to matching and a second set as soon as its response arrives instead of after a full pass. Default 0, one pass after another.')
+    parser.add_argument('--schedule', action='store', type=parseSchedule, metavar='QUEUE=WEIGHT[:CAP],...', help=f"Share the requests of the pipelined update between the unset, set, match, newbib and update queues by weight, and optionally cap a queue's requests in flight. 'update' is the second set of records OCLC gave a new number. Default 'unset=1,set=1,match=4,newbib=4,update=4'. Uses --pipeline {PIPELINE_WORKERS} unless --pipeline is given.")
+    parser.add_argument('--shard', action='store', type=parseShard, metavar='i/N', help='Run as shard i of N, from 1/N to N/N. Each shard sends the adds and deletes whose OCLC number, or TCN if there is none, hashes to it, and keeps its own log, journal, checkpoints, ledger and --state-db. Merge the shards\' slim flat files and error reports with shard.py. Not used with --delta. The shards share --holdings-db and only read it, so it isn\'t reseeded from --report or updated by the run.')
+    parser.add_argument('--stream', action='store_true', default=False, help=f"Read and normalize the --add records while they are sent, so the first request goes out as soon as the first record is read. Uses the pipelined update, with --pipeline {PIPELINE_WORKERS} unless --pipeline is given. Deletes are sent once every add has been read. Not used with --recover, --delta or --debug.")
+    parser.add_argument('--progress', action='store', type=float, default=0.0, metavar='T', help='Log a progress line with the rate, error rate and ETA of each stage every T seconds, instead of a line per record. Default 0, off.')
+    parser.add_argument('--recover', action='store_true', default=False, help='Used to recover a previously interrupted process. Outcomes in the journal are replayed over the checkpoint files or, if --add or --delete are used, over those lists.')
     parser.add_argument('--version', action='version', version='%(prog)s ' + VERSION)
     
     args = parser.parse_args()
+    if args.shard:
+        # Each shard writes its own log.
+        setLogFilePrefix(f"./oclc4_{args.shard.tag}_")
     logit(f"=== oclc4 version: {VERSION}")
     configs = {}
     if not exists(args.config):
@@ -993,48 +2072,139 @@ def main(argv):
         args.limit = -1
     if args.debug:
         logit(f"args.limit is set to '{args.limit}'", timestamp=True)
+    if args.debug_sample > 0 or args.debug_slow > 0:
+        startSampling(rate=args.debug_sample, slowMs=args.debug_slow, maxChars=args.debug_max_chars)
     reject_tags = configs.get("rejectTags")
+    # The run ends at the deadline or after the longest run time, whichever is first.
+    deadline = None
+    ends = []
+    if args.deadline:
+        ends.append(args.deadline)
+    if args.max_runtime:
+        ends.append(datetime.now() + timedelta(seconds=args.max_runtime))
+    if ends:
+        deadline = Deadline(min(ends), drainSeconds=args.drain_seconds)
+        logit(f"the run ends by {deadline}, no new requests are sent after {deadline.stop_at.strftime('%H:%M:%S')}")
     if args.debug and reject_tags:
         logit(f"filtering bibs on {reject_tags}")
     # Start with creating a record manager object.
-    manager = RecordManager(ignoreTags=reject_tags, debug=args.debug, configFile=args.config)
+    if args.delta and not args.fingerprint_db:
+        args.fingerprint_db = 'oclc_fingerprints.db'
+    if args.shard:
+        if args.delta:
+            # A shard only sees its own adds, so every other shard's records would look vanished.
+            logit(f"*error, --shard can't be used with --delta.")
+            sys.exit(1)
+        if args.holdings_db and not exists(args.holdings_db):
+            # The shards share the store and only read it.
+            logit(f"*error, --shard needs an existing --holdings-db, {args.holdings_db} not found.")
+            sys.exit(1)
+        # Each shard has its own ledger, state, journal and checkpoints.
+        args.ledger_db = args.shard.fileName(args.ledger_db)
+        if args.state_db:
+            args.state_db = args.shard.fileName(args.state_db)
+        logit(f"running as shard {args.shard}")
+    if args.daemon:
+        if args.add or args.delete or args.recover or args.delta or args.report or args.stream or args.debug or args.shard:
+            logit(f"*error, --daemon reads its lists from {args.daemon} and recovers by itself, so it can't be used with --add, --delete, --recover, --delta, --report, --stream, --debug or --shard.")
+            sys.exit(1)
+        if not isdir(args.daemon):
+            logit(f"*error, --daemon directory {args.daemon} not found.")
+            sys.exit(1)
+        runDaemon(args, reject_tags, deadline)
+        return
+    manager = _newManager_(args, reject_tags, deadline)
+    if args.profile:
+        profiler = Profiler(f"oclc4_{args.profile}.pstats", stages=PROFILE_PHASES[args.profile])
+        manager.timer.addObserver(profiler)
+        profiler.start()
+        # The debug run exits before the update, so save the profile at exit.
+        atexit.register(profiler.stop)
     # An interrupted process may need to be restarted. In this case 
     # there _should_ be two files one for deletes called 
     # '{backup_prefix}deletes.json', the second called 
-    # '{backup_prefix}adds.json'. If these files don't exist the 
+    # '{backup_prefix}adds.jsonl'. If these files don't exist the 
     # the process will stop with an error message. 
-    if args.recover:
+    journal_file = f"{manager.backup_prefix}journal.jsonl"
+    # Streaming needs the whole file for a delta, a debug listing or a journal replay.
+    stream = args.stream and args.add and not (args.recover or args.delta or args.debug)
+    if args.stream and not stream:
+        logit(f"--stream ignored, it needs --add and can't be used with --recover, --delta or --debug.")
+    if args.recover and not (args.add or args.delete):
         logit(f"starting to read adds and deletes from backup", timestamp=True)
-        manager.restoreState()
+        with manager.timer.stage('restore'):
+            manager.restoreState()
         logit(f"done", timestamp=True)
-    else: # Normal operation.
+    else: # Normal operation, or recovering by replaying the journal over the original lists.
         if args.delete:
             logit(f"starting to read deletes in {args.delete}", timestamp=True)
-            manager.readDeleteList(fileName=args.delete)
+            with manager.timer.stage('read deletes'):
+                manager.readDeleteList(fileName=args.delete)
             logit(f"done", timestamp=True)
-        if args.add:
+        if args.add and stream:
+            logit(f"adds in {args.add} will be read as they are sent", timestamp=True)
+        elif args.add:
             logit(f"starting to read adds in {args.add}", timestamp=True)
-            manager.readFlatOrMrkRecords(fileName=args.add)
+            with manager.timer.stage('read adds'):
+                manager.readFlatOrMrkRecords(fileName=args.add)
+            logit(f"done", timestamp=True)
+        if args.shard:
+            manager.selectShard()
+        if args.delta:
+            logit(f"starting to compare adds to {args.fingerprint_db}", timestamp=True)
+            with manager.timer.stage('delta'):
+                manager.selectDelta()
             logit(f"done", timestamp=True)
         if args.report:
             logit(f"starting to read report {args.report}", timestamp=True)
-            manager.readHoldingsReport(fileName=args.report)
+            with manager.timer.stage('read report'):
+                manager.readHoldingsReport(fileName=args.report)
             logit(f"done", timestamp=True)
-        logit(f"starting to normalize lists", timestamp=True)
-        manager.normalizeLists(recordLimit=args.limit)
-        logit(f"done", timestamp=True)
-        if args.debug:
+        elif args.holdings_db:
+            logit(f"starting to read holdings store {args.holdings_db}", timestamp=True)
+            with manager.timer.stage('read holdings'):
+                manager.readHoldingsStore()
+            logit(f"done", timestamp=True)
+        if not stream:
+            logit(f"starting to normalize lists", timestamp=True)
+            with manager.timer.stage('normalize'):
+                manager.normalizeLists(recordLimit=args.limit)
+            logit(f"done", timestamp=True)
+        if args.debug and not args.recover:
             # Save the state for checking, then use --recover to use these lists.
             manager.saveState()
             logit(f"Debug mode halting so you can check results before submission.")
             logit(f"Debug mode requires the user to now run again using the --recover flag to continue.") 
             sys.exit(0)
+    if args.recover:
+        logit(f"starting to replay {journal_file}", timestamp=True)
+        with manager.timer.stage('replay'):
+            manager.replayJournal(journal_file)
+        logit(f"done", timestamp=True)
+    # Confirmations only apply to the update they were made in.
+    if not args.recover and manager.ledger is not None:
+        manager.ledger.clear()
+    # Outcomes are journaled as they happen in case the process is killed
+    # before it can save its state.
+    manager.openJournal(journal_file, append=args.recover)
+    ingest = None
+    if stream:
+        ingest = Ingest(manager, args.add, recordLimit=args.limit)
+        if manager.pipeline_workers <= 0:
+            manager.pipeline_workers = PIPELINE_WORKERS
+    manager.startCheckpoints(everyRecords=args.checkpoint_records, everySeconds=args.checkpoint_seconds)
+    if args.telemetry:
+        startTelemetry(args.telemetry)
+    exporter = None
+    if args.metrics_file:
+        exporter = MetricsExporter(manager, args.metrics_file, everySeconds=args.metrics_seconds)
+        exporter.start()
     # The update process can take some time (like hours for reclamation) 
     # and if the process is interrupted by an impatient ILS admin, or the
     # server is shutdown, the recovery files are generated so the process
     # can restart with the '--recover' switch. 
     try:
-        manager.runUpdate(webServiceConfig=args.config, recordLimit=args.limit)
+        manager.runUpdate(webServiceConfig=args.config, recordLimit=args.limit, ingest=ingest)
     except KeyboardInterrupt:
         logit(f"system interrupt received")
         manager.saveState()
@@ -1043,6 +2213,43 @@ def main(argv):
         logit(f"an exception ({e}) occured, saving state.")
         manager.saveState()
         logit(f"progress saved.")
+    finally:
+        manager.closeJournal()
+        if exporter is not None:
+            exporter.stop()
+        if args.latency_file:
+            WebService.latencies.save(args.latency_file)
+
+def runDaemon(args, rejectTags:dict, deadline:Deadline=None):
+    """ 
+    Runs updates from the files dropped in the --daemon directory until
+    the process is stopped, or its deadline. See daemon.py.
+
+    Parameters:
+    - args parsed command line arguments.
+    - rejectTags dictionary of tags that reject a bib record.
+    - deadline optional Deadline of the run.
+
+    Return:
+    - None
+    """
+    daemon = Daemon(args.daemon, newManager=lambda: _newManager_(args, rejectTags, deadline), configFile=args.config,
+        recordLimit=args.limit, checkpointRecords=args.checkpoint_records, checkpointSeconds=args.checkpoint_seconds)
+    if args.telemetry:
+        startTelemetry(args.telemetry)
+    if args.metrics_file:
+        daemon.exporter = MetricsExporter(daemon.manager, args.metrics_file, everySeconds=args.metrics_seconds)
+        daemon.exporter.start()
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        logit(f"daemon stopped after {daemon.batches} update(s)")
+    finally:
+        if daemon.exporter is not None:
+            daemon.exporter.stop()
+        daemon.close()
+        if args.latency_file:
+            WebService.latencies.save(args.latency_file)
 
 if __name__ == "__main__":
     if len(sys.argv) == 1:
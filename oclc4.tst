@@ -22,6 +22,36 @@ TODO: Fix this so it doesn't rely on Web Service to set just use a record object
 # .035.   |a(OCoLC)1259157052|z(OCoLC)782078600
 # .035.   |a(CaAE) o782078599
 
+Records OCLC gave a new number, and records that were matched, still need
+a bib overlay once their holding is set. Records set under their own
+number don't.
+>>> from record import Record
+>>> recman = RecordManager()
+>>> renumbered = Record(["*** DOCUMENT BOUNDARY ***", "FORM=VM", ".001. |aocn782078599", ".035.   |a(OCoLC)782078600"])
+>>> matched = Record(["*** DOCUMENT BOUNDARY ***", "FORM=VM", ".001. |aocn782078601", ".035.   |a(Sirsi) o782078601"], action='match')
+>>> unchanged = Record(["*** DOCUMENT BOUNDARY ***", "FORM=VM", ".001. |aocn782078602", ".035.   |a(OCoLC)782078602"])
+>>> recman.add_records = [renumbered, matched, unchanged]
+>>> renumbered.updateOclcNumber('1259157052')
+>>> renumbered.setCompleted()
+>>> matched.updateOclcNumber('55555')
+>>> matched.setCompleted()
+>>> unchanged.setCompleted()
+>>> recman.generateUpdatedSlimFlat()
+*** DOCUMENT BOUNDARY ***
+FORM=VM
+.001. |aocn782078599
+.035.   |a(OCoLC)1259157052|z(OCoLC)782078600
+*** DOCUMENT BOUNDARY ***
+FORM=VM
+.001. |aocn782078601
+.035.   |a(Sirsi) o782078601
+.035.   |a(OCoLC)55555
+2
+
+They are only written once.
+>>> recman.generateUpdatedSlimFlat()
+0
+
 Test cleanup and restoreState
 -----------------------------
 
@@ -41,7 +71,7 @@ Save the lists
 Note that when the time stamp changes this test will fail because the output's time stamp doesn't match.
 >>> recman.saveState()
 [2024-05-05 22:09:26] saving records' state to backup
-[2024-05-05 22:09:26] adds state saved to oclc_update_adds.json
+[2024-05-05 22:09:26] adds state saved to oclc_update_adds.jsonl
 [2024-05-05 22:09:26] deletes state saved to oclc_update_deletes.json
 [2024-05-05 22:09:26] done.
 >>> recman = RecordManager()
@@ -50,8 +80,8 @@ Note that when the time stamp changes this test will fail because the output's t
 Restore the lists 
 -----------------
 >>> recman.restoreState()
-reading oclc_update_adds.json
-adds state restored successfully from oclc_update_adds.json 
+reading oclc_update_adds.jsonl
+adds state restored successfully from oclc_update_adds.jsonl 
 deletes state restored successfully from oclc_update_deletes.json 
 True
 >>> recman._showState_()
@@ -64,9 +94,9 @@ True
 Test _test_file_ and clean up after save and restore state tests 
 ----------------------------------------------------------------
 
->>> tested = recman._test_file_('oclc_update_adds.json')
+>>> tested = recman._test_file_('oclc_update_adds.jsonl')
 >>> if tested[0] == True:
-...     os.unlink('oclc_update_adds.json')
+...     os.unlink('oclc_update_adds.jsonl')
 >>> tested = recman._test_file_('oclc_update_deletes.json')
 >>> if tested[0] == True:
 ...     os.unlink('oclc_update_deletes.json')
@@ -264,6 +294,222 @@ FORM=VM
 3333: previously requested as a delete; ignoring
 1111: duplicate add request
 
+Test selectDelta and saveFingerprints
+-------------------------------------
+A first run has no fingerprints so every record is sent.
+>>> recman = RecordManager(fingerprintDb='test_fingerprints.db')
+>>> recman.readFlatOrMrkRecords('test/testB.flat')
+>>> recman.selectDelta()
+delta: 2 new or changed, 0 unchanged, 0 vanished record(s)
+>>> for record in recman.add_records:
+...     record.setCompleted()
+>>> recman.saveFingerprints()
+saved 2 fingerprint(s), removed 0 to test_fingerprints.db
+
+The next run skips unchanged records and deletes the holding of the record that vanished.
+>>> recman = RecordManager(fingerprintDb='test_fingerprints.db')
+>>> recman.readFlatOrMrkRecords('test/delta00.flat')
+>>> recman.selectDelta()
+delta: 0 new or changed, 1 unchanged, 1 vanished record(s)
+>>> recman.delete_numbers
+['782078599']
+
+A vanished TCN is kept until its holding is removed, so a run that didn't
+get to the unset, or whose unset failed, sends it again.
+>>> recman.saveFingerprints()
+saved 0 fingerprint(s), removed 0 to test_fingerprints.db
+>>> recman = RecordManager(fingerprintDb='test_fingerprints.db')
+>>> recman.readFlatOrMrkRecords('test/delta00.flat')
+>>> recman.selectDelta()
+delta: 0 new or changed, 1 unchanged, 1 vanished record(s)
+>>> from record import COMPLETED
+>>> recman._deleteOutcome_('782078599', COMPLETED)
+>>> recman.saveFingerprints()
+saved 0 fingerprint(s), removed 1 to test_fingerprints.db
+
+Updated records still need to be set again, so they aren't saved either.
+>>> recman = RecordManager(fingerprintDb='test_fingerprints.db')
+>>> recman.readFlatOrMrkRecords('test/testB.flat')
+>>> recman.selectDelta()
+delta: 1 new or changed, 1 unchanged, 0 vanished record(s)
+>>> recman.add_records[0].setUpdated()
+>>> recman.saveFingerprints()
+saved 0 fingerprint(s), removed 0 to test_fingerprints.db
+>>> recman.fingerprint_store.close()
+>>> os.unlink('test_fingerprints.db')
+
+Test the journal and replayJournal
+----------------------------------
+Outcomes are journaled as they happen. Here the first record's holding was
+set on a new control number and one delete was done before the process died.
+>>> recman = RecordManager()
+>>> recman.readFlatOrMrkRecords('test/testB.flat')
+>>> recman.delete_numbers = ['1111', '2222']
+>>> recman.openJournal('test_journal.jsonl')
+>>> record = recman.add_records[0]
+>>> record.updateOclcNumber('779882430')
+>>> record.setUpdated()
+>>> recman._recordOutcome_('set', record, '779882439', 'set')
+>>> recman._deleteOutcome_('1111', 'done')
+>>> recman.generateUpdatedSlimFlat('test_overlay.flat')
+1
+>>> recman.closeJournal()
+
+Recovering replays the outcomes over the original lists.
+>>> recman = RecordManager()
+>>> recman.readFlatOrMrkRecords('test/testB.flat')
+>>> recman.delete_numbers = ['1111', '2222']
+>>> recman.replayJournal('test_journal.jsonl')
+replayed 2 outcome(s) from test_journal.jsonl
+2
+>>> [(r.getOclcNumber(), r.prev_oclc_number, r.getAction()) for r in recman.add_records]
+[('779882430', '779882439', 'updated'), ('782078599', '', 'set')]
+>>> recman.delete_numbers
+['2222']
+
+The record was already written to the bib overlay, so it isn't again.
+>>> recman.add_records[0].overlay_number
+'779882430'
+>>> recman.generateUpdatedSlimFlat('test_overlay.flat')
+0
+>>> os.unlink('test_overlay.flat')
+
+Replaying again changes nothing since the records have moved on.
+>>> recman.replayJournal('test_journal.jsonl')
+replayed 1 outcome(s) from test_journal.jsonl
+1
+>>> recman.add_records[0].getAction()
+'updated'
+>>> os.unlink('test_journal.jsonl')
+
+Test saveState and restoreState with a state database
+-----------------------------------------------------
+>>> recman = RecordManager(stateDb='test_state.db')
+>>> recman.readFlatOrMrkRecords('test/testB.flat')
+>>> recman.delete_numbers = ['1111', '2222']
+>>> recman.saveState() # doctest: +ELLIPSIS
+[...] saving records' state to backup
+[...] state saved to test_state.db
+[...] done.
+
+Outcomes update the database as they happen.
+>>> record = recman.add_records[0]
+>>> record.setCompleted()
+>>> recman._recordOutcome_('set', record, '779882439', 'set')
+>>> recman._deleteOutcome_('1111', 'done')
+>>> recman.state_store.close()
+
+>>> recman = RecordManager(stateDb='test_state.db')
+>>> recman.restoreState()
+adds state restored successfully from test_state.db 
+deletes state restored successfully from test_state.db 
+True
+>>> [(r.getOclcNumber(), r.getAction()) for r in recman.add_records]
+[('779882439', 'done'), ('782078599', 'set')]
+>>> recman.delete_numbers
+['2222']
+>>> recman.state_store.close()
+>>> os.unlink('test_state.db')
+
+Test background checkpoints
+---------------------------
+A checkpoint is written every 2 outcomes to the files restoreState() reads.
+>>> recman = RecordManager()
+>>> recman.readFlatOrMrkRecords('test/testB.flat')
+>>> recman.delete_numbers = ['1111']
+>>> recman.startCheckpoints(everyRecords=2, everySeconds=0)
+>>> for record in recman.add_records:
+...     record.setCompleted()
+...     recman._recordOutcome_('set', record, record.getOclcNumber(), 'set')
+>>> recman.checkpointer.wait() # doctest: +ELLIPSIS
+[...] checkpoint of 2 adds and 1 deletes saved
+>>> recman = RecordManager()
+>>> recman.restoreState()
+reading oclc_update_adds.jsonl
+adds state restored successfully from oclc_update_adds.jsonl 
+deletes state restored successfully from oclc_update_deletes.json 
+True
+>>> [r.getAction() for r in recman.add_records], recman.delete_numbers
+(['done', 'done'], ['1111'])
+
+Only the records that changed since the last checkpoint are copied for the
+next one, along with records streamed in since.
+>>> recman.startCheckpoints(everyRecords=2, everySeconds=0)
+>>> recman.add_records[0].setFailed()
+>>> recman._recordOutcome_('set', recman.add_records[0], recman.add_records[0].getOclcNumber(), 'done')
+>>> recman._addRecord_(Record(recman.add_records[1].record[:]))
+>>> sorted(recman.checkpoint_changed)
+[0, 2]
+>>> recman._recordOutcome_('set', recman.add_records[2], recman.add_records[2].getOclcNumber(), 'set')
+>>> recman._recordOutcome_('set', recman.add_records[2], recman.add_records[2].getOclcNumber(), 'set')
+>>> recman.checkpointer.wait() # doctest: +ELLIPSIS
+[...] checkpoint of 3 adds and 1 deletes saved
+>>> import json
+>>> [json.loads(line)['action'] for line in open('oclc_update_adds.jsonl')]
+['failed', 'done', 'set']
+>>> recman._stopCheckpoints_()
+>>> os.path.exists('oclc_update_adds.jsonl')
+False
+
+Test compressed checkpoints
+---------------------------
+Adds are saved one compact record per line, gzipped if asked.
+>>> recman = RecordManager(compressCheckpoints=True)
+>>> recman.readFlatOrMrkRecords('test/testB.flat')
+>>> recman.delete_numbers = ['1111']
+>>> recman.saveState() # doctest: +ELLIPSIS
+[...] saving records' state to backup
+[...] adds state saved to oclc_update_adds.jsonl.gz
+[...] deletes state saved to oclc_update_deletes.json
+[...] done.
+>>> import gzip, json
+>>> [line[:9] for line in gzip.open('oclc_update_adds.jsonl.gz', 'rt')]
+['{"data":[', '{"data":[']
+
+The checkpoint is found whether or not it is compressed.
+>>> recman = RecordManager()
+>>> recman.restoreState()
+reading oclc_update_adds.jsonl.gz
+adds state restored successfully from oclc_update_adds.jsonl.gz 
+deletes state restored successfully from oclc_update_deletes.json 
+True
+>>> [r.getTitleControlNumber() for r in recman.add_records]
+['ocn779882439', 'ocn782078599']
+
+Checkpoints saved as a JSON array by older versions can still be restored.
+>>> with open('oclc_update_adds.json', 'w') as f:
+...     _ = f.write(json.dumps([r._toDict_() for r in recman.add_records], indent=2))
+>>> recman = RecordManager()
+>>> recman.restoreState()
+reading oclc_update_adds.json
+adds state restored successfully from oclc_update_adds.json 
+The oclc_update_deletes.json file is empty (or missing).
+True
+>>> [r.getTitleControlNumber() for r in recman.add_records]
+['ocn779882439', 'ocn782078599']
+
+Test the ledger of confirmed requests
+-------------------------------------
+Requests the ledger has as confirmed are not sent again, so no web service is needed.
+>>> recman = RecordManager(ledgerDb='test_ledger.db')
+>>> recman.readFlatOrMrkRecords('test/testB.flat')
+>>> recman.ledger.confirm('set', '779882439')
+>>> recman.ledger.confirm('set', '782078599', '782078590')
+>>> [recman._setHolding_(None, record) for record in recman.add_records]
+779882439 holding already set
+782078599 holding already set
+[True, True]
+>>> [(r.getOclcNumber(), r.getAction()) for r in recman.add_records]
+[('779882439', 'done'), ('782078590', 'updated')]
+>>> recman.ledger.confirm('lbd', '1111')
+>>> recman.deleteLocalBibData('1111')
+1111 LBD already deleted
+True
+>>> recman.ledger.close()
+>>> for f in os.listdir('.'):
+...     if f.startswith('test_ledger.db'):
+...         os.unlink(f)
+
 Test readHoldingsReport method
 ------------------------------
 >>> recman = RecordManager()
@@ -274,6 +520,26 @@ The holding report is missing, empty or not the correct format. Expected a .csv
 >>> recman.readHoldingsReport('test/report.csv')
 loaded 19 delete records: ['267', '1210', '1834', '171857']...
 
+Test readHoldingsStore method
+-----------------------------
+Reading a report seeds the holdings store, and a later run can normalize against the store.
+>>> recman = RecordManager(holdingsDb='test_holdings.db')
+>>> recman.readHoldingsReport('test/holdingssmall.csv')
+seeded test_holdings.db with 4 holdings
+>>> recman.holdings_store.close()
+>>> recman = RecordManager(holdingsDb='test_holdings.db')
+>>> recman.readHoldingsStore()
+loaded 4 holdings from test_holdings.db
+>>> recman.readDeleteList('test/deletelong.lst')
+>>> recman.normalizeLists()
+4 delete record(s)
+0 add record(s)
+0 record(s) to check
+1 rejected record(s)
+6666: OCLC has no such holding to delete
+>>> recman.holdings_store.close()
+>>> os.unlink('test_holdings.db')
+
 
 Test _test_file_
 ----------------
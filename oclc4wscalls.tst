@@ -45,8 +45,9 @@ Test the unsetHoldings method
 >>> oclc_number_list = ['70826883', '1111111111111111', '70826883']
 >>> recman.unsetHoldings(oclcNumbers=oclc_number_list)
 removed holding with OCLC number 70826883
+1111111111111111 not a listed holding
 removed holding with OCLC number 70826883
-unsetHoldings found 0 errors
+unsetHoldings found 1 errors
 True
 
 
@@ -0,0 +1,408 @@
+###############################################################################
+#
+# Purpose: Pipelined update where each record moves through the stages on its own.
+# Date:    Mon 19 Oct 2026
+# Copyright (c) 2026 Andrew Nisbet
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from logit import logit
+from progress import Progress
+from scheduler import WorkScheduler, QUEUES, UNSET_QUEUE, SET_QUEUE, MATCH_QUEUE, NEWBIB_QUEUE, UPDATE_QUEUE
+from record import SET, MATCH, UPDATED, COMPLETED
+from journal import NEWBIB_OP, LBD_OP
+from workqueue import WorkQueue
+from ws2 import SetWebService, UnsetWebService, MatchWebService, DeleteWebService, AddBibWebService
+
+# Stages of the graph. A record goes to SET_STAGE, then to MATCH_STAGE if
+# OCLC doesn't know its number, to ADDBIB_STAGE and BIBSET_STAGE if it
+# doesn't match a bib, and to RESET_STAGE once if its number was updated.
+# Deletes go to UNSET_STAGE, then to LBD_STAGE if local bib data is attached.
+UNSET_STAGE  = 'unset'
+LBD_STAGE    = 'lbd'
+SET_STAGE    = 'set'
+MATCH_STAGE  = 'match'
+ADDBIB_STAGE = 'addbib'
+BIBSET_STAGE = 'bibset'
+RESET_STAGE  = 'reset'
+
+WEB_SERVICES = {
+    UNSET_STAGE: UnsetWebService,
+    LBD_STAGE: DeleteWebService,
+    SET_STAGE: SetWebService,
+    MATCH_STAGE: MatchWebService,
+    ADDBIB_STAGE: AddBibWebService,
+    BIBSET_STAGE: SetWebService,
+    RESET_STAGE: SetWebService,
+}
+# The scheduler queue of each stage. Sets of updated numbers have their own
+# queue so they can be sent ahead of new adds.
+STAGE_QUEUES = {
+    UNSET_STAGE: UNSET_QUEUE,
+    LBD_STAGE: UNSET_QUEUE,
+    SET_STAGE: SET_QUEUE,
+    MATCH_STAGE: MATCH_QUEUE,
+    ADDBIB_STAGE: NEWBIB_QUEUE,
+    BIBSET_STAGE: NEWBIB_QUEUE,
+    RESET_STAGE: UPDATE_QUEUE,
+}
+# Seconds between checks for newly read records while requests are in flight.
+POLL_SECONDS = 0.05
+
+class UpdatePipeline:
+    """
+    Runs the unset, set, match, add bib and second set requests of an
+    update as a graph of stages instead of one full pass after another.
+    A record moves to its next stage as soon as its response arrives, so
+    a record whose set fails is matched straight away, and up to 'workers'
+    requests are in flight at once.
+
+    Requests are sent from a pool of worker threads, each with its own
+    web services. Responses are applied on the calling thread with the
+    same RecordManager methods the sequential passes use, so the journal,
+    ledger, state and holdings stores are only used from one thread.
+    A WorkScheduler shares the request slots between the delete, set,
+    match, new bib and updated number queues by weight. By default work
+    that finishes a record gets more turns than new records, which keeps
+    the number of half-finished records small if the run is interrupted.
+    """
+    def __init__(self, manager, configs:str='prod.json', workers:int=4, recordLimit:int=-1, deleteLBD:bool=True, scheduler:WorkScheduler=None):
+        """
+        Constructor
+
+        Parameters:
+        - manager RecordManager with the add records and delete numbers.
+        - configs path to the web service configuration.
+        - workers maximum number of requests in flight.
+        - recordLimit maximum number of adds and deletes to start, -1 for all.
+        - deleteLBD True to delete local bib data that blocks an unset.
+        - scheduler optional WorkScheduler, with the default weights if not given.
+
+        Returns:
+        - UpdatePipeline object.
+        """
+        self.manager = manager
+        self.configs = configs
+        self.workers = max(1, workers)
+        self.record_limit = recordLimit
+        self.delete_lbd = deleteLBD
+        self.local = threading.local()
+        # Follow-on work of (stage, item, context) by scheduler queue.
+        self.ready = {queue: deque() for queue in QUEUES}
+        self.scheduler = scheduler if scheduler is not None else WorkScheduler()
+        # future: (stage, item, context).
+        self.pending = {}
+        # Stages stopped by a server error or exception.
+        self.stopped = set()
+        # Records already sent to RESET_STAGE.
+        self.reset = set()
+        self.critical = False
+        self.started = {UNSET_STAGE: 0, SET_STAGE: 0}
+
+    def _webService_(self, stage:str):
+        services = getattr(self.local, 'services', None)
+        if services is None:
+            services = self.local.services = {}
+        ws = services.get(stage)
+        if ws is None:
+            ws = services[stage] = WEB_SERVICES[stage](configFile=self.configs, debug=self.manager.debug)
+        return ws
+
+    def _send_(self, stage:str, item, oclcNumber:str) -> tuple:
+        """
+        Sends a stage's request. Runs on a worker thread.
+
+        Returns:
+        - tuple of (web service status, response).
+        """
+        ws = self._webService_(stage)
+        if stage == MATCH_STAGE:
+            response = ws.sendRequest(xmlBibRecord=item.asXml(), tcn=item.getTitleControlNumber())
+        elif stage == ADDBIB_STAGE:
+            response = ws.sendRequest(xmlBibRecord=item.asXml(useMinFields=False, ignoreControlNumber=True), tcn=item.getTitleControlNumber())
+        else:
+            response = ws.sendRequest(oclcNumber=oclcNumber)
+        return (ws.status_code, response)
+
+    def _underLimit_(self, stage:str) -> bool:
+        return self.record_limit < 0 or self.started[stage] < self.record_limit
+
+    def _ready_(self, stage:str, item, context, first:bool=False):
+        """
+        Queues follow-on work. Work that finishes a step already started,
+        like the set of a new bib, goes to the front of its queue.
+        """
+        if first:
+            self.ready[STAGE_QUEUES[stage]].appendleft((stage, item, context))
+        else:
+            self.ready[STAGE_QUEUES[stage]].append((stage, item, context))
+
+    def _nextWork_(self, unsetQueue:WorkQueue, setQueue:WorkQueue) -> tuple:
+        """
+        Picks the next request to send from the queue the scheduler picks.
+        Work the ledger shows is already confirmed is applied here without
+        a request.
+
+        Returns:
+        - tuple of (stage, item, context), or None if there is nothing to
+          send, or every queue with work is at its cap.
+        """
+        manager = self.manager
+        while True:
+            available = [queue for queue in QUEUES if self.ready[queue]]
+            for (stage, source) in ((UNSET_STAGE, unsetQueue), (SET_STAGE, setQueue)):
+                if stage not in self.stopped and self._underLimit_(stage) and source.hasNext():
+                    available.append(STAGE_QUEUES[stage])
+            queue = self.scheduler.pick(available)
+            if queue is None:
+                return None
+            if self.ready[queue]:
+                (stage, item, context) = self.ready[queue].popleft()
+                if stage in self.stopped:
+                    continue
+                if stage in (BIBSET_STAGE, RESET_STAGE) and manager._confirmedSet_(item):
+                    self._afterSet_(stage, item, context, True)
+                    continue
+                if stage == LBD_STAGE and manager._confirmedLbd_(item):
+                    # Deleted by an earlier run, so there's no error to count.
+                    continue
+                return (stage, item, context)
+            if queue == UNSET_QUEUE:
+                (stage, source) = (UNSET_STAGE, unsetQueue)
+            else:
+                (stage, source) = (SET_STAGE, setQueue)
+            (position, item) = source.next()
+            if manager.progress is not None:
+                manager.progress.tick()
+            if stage == UNSET_STAGE:
+                if not item:
+                    source.done(position)
+                    continue
+                self.started[stage] += 1
+                if manager._confirmedUnset_(item):
+                    source.done(position)
+                    continue
+                return (stage, item, position)
+            self.started[stage] += 1
+            if not item.getOclcNumber():
+                # Records without a number can only be matched.
+                source.done(position)
+                if item.getAction() == MATCH:
+                    self._ready_(MATCH_STAGE, item, item.getOclcNumber())
+                continue
+            if manager._confirmedSet_(item):
+                source.done(position)
+                self._afterSet_(SET_STAGE, item, None, True)
+                continue
+            return (stage, item, position)
+
+    def _submit_(self, executor, stage:str, item, context):
+        if stage in (UNSET_STAGE, LBD_STAGE):
+            oclc_number = item
+        else:
+            oclc_number = item.getOclcNumber()
+        if stage in (SET_STAGE, BIBSET_STAGE, RESET_STAGE):
+            # Responses are applied against the number and action the record was sent with.
+            context = (context, oclc_number, item.getAction())
+        future = executor.submit(self._send_, stage, item, oclc_number)
+        self.pending[future] = (stage, item, context)
+        self.scheduler.started(STAGE_QUEUES[stage])
+
+    def _stop_(self, stage:str, critical:bool=False):
+        self.stopped.add(stage)
+        if critical:
+            self.critical = True
+
+    def _afterSet_(self, stage:str, record, context, isSet:bool):
+        """
+        Sends a record on from one of the set stages.
+        """
+        if stage == BIBSET_STAGE:
+            (requested_number, match_response) = context
+            if isSet:
+                self.manager._newBibSet_(record, requested_number)
+            else:
+                self.manager._matchFailed_(record, requested_number, match_response)
+                return
+        if not isSet:
+            return
+        if record.getAction() == MATCH and stage == SET_STAGE:
+            self._ready_(MATCH_STAGE, record, record.getOclcNumber())
+        elif record.getAction() == UPDATED and id(record) not in self.reset:
+            self.reset.add(id(record))
+            self._ready_(RESET_STAGE, record, None)
+
+    def _apply_(self, future, unsetQueue:WorkQueue, setQueue:WorkQueue):
+        """
+        Applies a response, or the exception raised sending the request, and
+        queues the record's next stage.
+        """
+        manager = self.manager
+        (stage, item, context) = self.pending.pop(future)
+        self.scheduler.finished(STAGE_QUEUES[stage])
+        try:
+            (status, response) = future.result()
+            error = None
+        except Exception as e:
+            (status, response) = (None, None)
+            error = e
+        if stage == UNSET_STAGE:
+            position = context
+            if error is not None:
+                logit(f"The unsetHoldings web service reported an error. Saving state because:\n{error}")
+                self._stop_(stage, critical=True)
+                return
+            outcome = manager._applyUnsetResponse_(status, response, item)
+            if outcome is None:
+                self._stop_(stage)
+            elif outcome == COMPLETED:
+                unsetQueue.done(position)
+            else:
+                unsetQueue.fail(position)
+                if outcome == LBD_OP and self.delete_lbd:
+                    self._ready_(LBD_STAGE, item, None, first=True)
+        elif stage == LBD_STAGE:
+            if error is not None:
+                logit(f"The deleteLocalBibData web service reported an error. Saving state because:\n{error}")
+                self._stop_(stage, critical=True)
+                return
+            manager.error_count['unset'] += manager._applyLbdResponse_(status, response, item)
+        elif stage in (SET_STAGE, BIBSET_STAGE, RESET_STAGE):
+            (context, oclc_number, from_action) = context
+            if error is not None:
+                if stage == BIBSET_STAGE:
+                    logit(f"The setHoldings web service reported an error:\n{error}")
+                    self._afterSet_(stage, item, context, False)
+                    return
+                logit(f"The setHoldings web service reported an error. Saving state because:\n{error}")
+                manager.error_count['set'] += 1
+                self._stop_(stage, critical=True)
+                return
+            is_set = manager._applySetResponse_(status, response, item, oclc_number, from_action)
+            if stage == SET_STAGE and is_set:
+                setQueue.done(context)
+            if not is_set and stage != BIBSET_STAGE:
+                # Don't set the record to any status, this failure is a web-services problem.
+                self._stop_(stage)
+                return
+            self._afterSet_(stage, item, context, is_set)
+        elif stage == MATCH_STAGE:
+            requested_number = context
+            if error is not None:
+                logit(f"The matchHoldings web service reported an error. Saving state because:\n{error}")
+                self._stop_(stage, critical=True)
+                return
+            outcome = manager._applyMatchResponse_(status, response, item, requested_number)
+            if outcome is None:
+                self._stop_(stage)
+            elif outcome == NEWBIB_OP:
+                manager._logRecord_(f"adding TCN {item.getTitleControlNumber()} as new bib.")
+                self._ready_(ADDBIB_STAGE, item, (requested_number, response))
+            elif outcome == UPDATED:
+                self._afterSet_(MATCH_STAGE, item, None, True)
+        elif stage == ADDBIB_STAGE:
+            (requested_number, match_response) = context
+            new_number = ''
+            if error is not None:
+                logit(f"The AddBibWebService reported an error. Saving state because:\n{error}")
+            else:
+                try:
+                    numbers = manager.extract_oclc_numbers(response)
+                    new_number = numbers[0] if numbers else ''
+                except Exception as e:
+                    logit(f"The AddBibWebService reported an error. Saving state because:\n{e}")
+            if manager._applyNewBib_(item, requested_number, new_number):
+                self._ready_(BIBSET_STAGE, item, (requested_number, match_response), first=True)
+            else:
+                manager._matchFailed_(item, requested_number, match_response)
+
+    def run(self, ingest=None) -> bool:
+        """
+        Sends every request of the update and waits for the responses.
+
+        Parameters:
+        - ingest optional started Ingest that streams the add records in
+          while requests are sent. The deletes are sent once it has read
+          every record, since an add can cancel a delete.
+
+        Returns:
+        - True if there were no critical web service errors and False
+          otherwise, in which case the state needs to be saved.
+        """
+        manager = self.manager
+        if ingest is None:
+            unset_queue = WorkQueue(manager.delete_numbers, name='unset')
+            set_queue = WorkQueue(manager.action_index.records(SET, UPDATED, MATCH), name='set')
+            # Checkpoints save the outstanding numbers from the queue.
+            manager.unset_queue = unset_queue
+        else:
+            unset_queue = WorkQueue([], name='unset')
+            set_queue = WorkQueue([], name='set')
+        manager.queues[unset_queue.name] = unset_queue
+        manager.queues[set_queue.name] = set_queue
+        if manager.progress_seconds > 0:
+            manager.progress = Progress('update', len(unset_queue) + len(set_queue), everySeconds=manager.progress_seconds,
+                errors=lambda: sum(manager.error_count.values()))
+        reading = ingest is not None
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='oclc') as executor:
+                while True:
+                    if reading:
+                        # Wait for records only if there are no responses to wait for.
+                        for record in ingest.poll(timeout=0.0 if self.pending else POLL_SECONDS):
+                            if record.getAction() in (SET, MATCH):
+                                set_queue.items.append(record)
+                        if ingest.done:
+                            reading = False
+                            unset_queue.items.extend(manager.delete_numbers)
+                            manager.unset_queue = unset_queue
+                            # Outcomes are saved against the snapshot from here on.
+                            manager._snapshotState_()
+                        if manager.progress is not None:
+                            manager.progress.total = len(unset_queue) + len(set_queue)
+                    # Past the deadline the requests in flight are finished,
+                    # and the rest of the records read, but nothing more is sent.
+                    while len(self.pending) < self.workers and not manager.pastDeadline():
+                        work = self._nextWork_(unset_queue, set_queue)
+                        if work is None:
+                            break
+                        self._submit_(executor, *work)
+                    if not self.pending:
+                        if reading:
+                            continue
+                        break
+                    (done, _) = wait(list(self.pending), timeout=POLL_SECONDS if reading else None, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._apply_(future, unset_queue, set_queue)
+        finally:
+            if ingest is not None and not ingest.done:
+                ingest.stop()
+                # The deletes weren't sent, and only the adds read so far are known.
+                manager.delete_numbers = ingest.deletes()
+            else:
+                # Whatever happens, only the outstanding numbers are left to delete.
+                manager.delete_numbers = unset_queue.remaining()
+            manager.unset_queue = None
+            manager._finishProgress_()
+        for stage, count in manager.error_count.items():
+            logit(f"{stage} errors: {count}")
+        return not self.critical
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    doctest.testfile("pipeline.tst")
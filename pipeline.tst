@@ -0,0 +1,199 @@
+Tests for the pipelined update
+==============================
+
+>>> from pipeline import UpdatePipeline, SET_STAGE, MATCH_STAGE, ADDBIB_STAGE, BIBSET_STAGE, RESET_STAGE, UNSET_STAGE
+>>> from oclc4 import RecordManager
+>>> from record import Record
+
+The requests are answered by a stand-in for OCLC that records what was sent.
+Numbers ending in 7 have been replaced by the number with a 0 on the end,
+numbers ending in 9 are unknown, and 'boom' raises an exception.
+>>> class FakePipeline(UpdatePipeline):
+...     def __init__(self, *args, **kwargs):
+...         super().__init__(*args, **kwargs)
+...         self.sent = []
+...     def _send_(self, stage, item, oclcNumber):
+...         self.sent.append((stage, oclcNumber))
+...         if oclcNumber == 'boom':
+...             raise ConnectionError('connection reset')
+...         if stage in (SET_STAGE, BIBSET_STAGE, RESET_STAGE, UNSET_STAGE):
+...             if oclcNumber.endswith('9'):
+...                 return (200, {'controlNumber': None, 'requestedControlNumber': oclcNumber, 'success': False})
+...             if oclcNumber.endswith('7'):
+...                 return (200, {'controlNumber': oclcNumber + '0', 'requestedControlNumber': oclcNumber, 'success': True})
+...             return (200, {'controlNumber': oclcNumber, 'requestedControlNumber': oclcNumber, 'success': True})
+...         if stage == MATCH_STAGE:
+...             if item.getTitleControlNumber() == 'epl04':
+...                 return (200, {'numberOfRecords': 1, 'briefRecords': [{}]})
+...             return (200, {'numberOfRecords': 1, 'briefRecords': [{'oclcNumber': '5555'}]})
+...         return (200, '<record xmlns="http://www.loc.gov/MARC21/slim"><datafield tag="035"><subfield code="a">(OCoLC)4242</subfield></datafield></record>')
+
+Test records moving through the stages
+--------------------------------------
+A record is set, a record whose number changed is set again with the new
+number, and a record without a number is matched and then set.
+>>> manager = RecordManager()
+>>> manager.add_records = [Record([], tcn="epl01", oclcNumber="1111"),
+...     Record([], tcn="epl02", oclcNumber="2227"),
+...     Record([], action="match", tcn="epl03")]
+>>> manager.delete_numbers = ['3333', '4444']
+>>> pipeline = FakePipeline(manager, workers=2)
+>>> pipeline.run()
+removed holding with OCLC number 3333
+1111 holding set
+removed holding with OCLC number 4444
+22270 holding set
+5555 holding set
+set errors: 0
+unset errors: 0
+match errors: 0
+delete errors: 0
+True
+>>> [(r.getTitleControlNumber(), r.getAction(), r.getOclcNumber()) for r in manager.add_records]
+[('epl01', 'done', '1111'), ('epl02', 'done', '22270'), ('epl03', 'done', '5555')]
+>>> sorted(pipeline.sent)
+[('match', ''), ('reset', '22270'), ('reset', '5555'), ('set', '1111'), ('set', '2227'), ('unset', '3333'), ('unset', '4444')]
+>>> manager.delete_numbers
+[]
+
+A record that doesn't match is added as a new bib and its holding set,
+with the requests made as soon as each response arrives.
+>>> manager = RecordManager()
+>>> manager.add_records = [Record([], action="match", tcn="epl04")]
+>>> pipeline = FakePipeline(manager, workers=4)
+>>> pipeline.run()
+adding TCN epl04 as new bib.
+4242 holding set
+4242 holding set
+set errors: 0
+unset errors: 0
+match errors: 0
+delete errors: 0
+True
+>>> [(r.getTitleControlNumber(), r.getAction(), r.getOclcNumber()) for r in manager.add_records]
+[('epl04', 'done', '4242')]
+>>> [stage for (stage, number) in pipeline.sent]
+['match', 'addbib', 'bibset', 'reset']
+
+Test a web service exception
+----------------------------
+An exception stops the stage and the run reports it so the state can be
+saved. Deletes that were not sent are left to the next run.
+>>> manager = RecordManager()
+>>> manager.add_records = [Record([], tcn="epl05", oclcNumber="boom")]
+>>> manager.delete_numbers = ['boom', '6666']
+>>> pipeline = FakePipeline(manager, workers=1)
+>>> pipeline.run()
+The unsetHoldings web service reported an error. Saving state because:
+connection reset
+The setHoldings web service reported an error. Saving state because:
+connection reset
+set errors: 1
+unset errors: 0
+match errors: 0
+delete errors: 0
+False
+>>> manager.delete_numbers
+['boom', '6666']
+>>> manager.add_records[0].getAction()
+'set'
+
+Test streaming the add records
+------------------------------
+Records are sent as they are read, and the deletes once every add has been
+read, less the delete the add of 3333 cancelled.
+>>> from ingest import Ingest
+>>> manager = RecordManager()
+>>> manager.delete_numbers = ['3333', '4444']
+>>> ingest = Ingest(manager, 'test/addlong.flat')
+>>> ingest.start()
+>>> pipeline = FakePipeline(manager, workers=2)
+>>> import io
+>>> from contextlib import redirect_stdout
+>>> out = io.StringIO()
+>>> with redirect_stdout(out):
+...     ok = pipeline.run(ingest=ingest)
+>>> ok
+True
+
+The order of the log lines depends on when records are read.
+>>> sorted(line for line in out.getvalue().split('\n') if 'holding' in line)
+['1111 holding set', '2222 holding set', '5555 holding set', 'removed holding with OCLC number 4444']
+>>> sorted(pipeline.sent)
+[('match', ''), ('reset', '5555'), ('set', '1111'), ('set', '2222'), ('unset', '4444')]
+>>> manager.delete_numbers
+[]
+
+Test scheduling
+---------------
+With one request at a time and no weight for deletes, every add is
+finished before the first delete is sent, and the second set of an
+updated number goes ahead of the next new add.
+>>> from scheduler import WorkScheduler
+>>> manager = RecordManager()
+>>> manager.add_records = [Record([], tcn="epl01", oclcNumber="2227"),
+...     Record([], tcn="epl02", oclcNumber="1111"),
+...     Record([], action="match", tcn="epl03")]
+>>> manager.delete_numbers = ['3333', '4444']
+>>> pipeline = FakePipeline(manager, workers=1, scheduler=WorkScheduler(weights={'unset': 0}))
+>>> with redirect_stdout(io.StringIO()):
+...     ok = pipeline.run()
+>>> pipeline.sent
+[('set', '2227'), ('reset', '22270'), ('set', '1111'), ('match', ''), ('reset', '5555'), ('unset', '3333'), ('unset', '4444')]
+
+Test a deadline
+---------------
+Once the deadline passes no more requests are sent, but the one in flight
+is finished and the work left stays in the manager's state.
+>>> class SentDeadline:
+...     # Passes once two requests have been sent.
+...     def __init__(self, pipeline):
+...         self.pipeline = pipeline
+...     def passed(self):
+...         return len(self.pipeline.sent) >= 2
+...     def __str__(self):
+...         return '06:30'
+>>> manager = RecordManager()
+>>> manager.add_records = [Record([], tcn="epl01", oclcNumber="2227"),
+...     Record([], tcn="epl02", oclcNumber="1111")]
+>>> manager.delete_numbers = ['3333', '4444']
+>>> pipeline = FakePipeline(manager, workers=1, scheduler=WorkScheduler(weights={'unset': 0}))
+>>> manager.deadline = SentDeadline(pipeline)
+>>> out = io.StringIO()
+>>> with redirect_stdout(out):
+...     ok = pipeline.run()
+>>> ok, pipeline.sent
+(True, [('set', '2227'), ('reset', '22270')])
+>>> [line.split('] ')[-1] for line in out.getvalue().splitlines() if 'deadline' in line]
+['stopping for the deadline of 06:30, no more requests will be sent']
+>>> [(r.getTitleControlNumber(), r.getAction(), r.getOclcNumber()) for r in manager.add_records]
+[('epl01', 'done', '22270'), ('epl02', 'set', '1111')]
+>>> manager.delete_numbers, manager.deadline_reached
+(['3333', '4444'], True)
+
+Test a confirmed LBD delete
+---------------------------
+Local bib data the ledger shows was already deleted isn't deleted again,
+or counted as an error.
+>>> import os, tempfile
+>>> class LbdPipeline(FakePipeline):
+...     def _send_(self, stage, item, oclcNumber):
+...         if stage == UNSET_STAGE and oclcNumber == '8888':
+...             self.sent.append((stage, oclcNumber))
+...             return (200, {'controlNumber': oclcNumber, 'success': False, 'message': 'delete attached LBD'})
+...         return super()._send_(stage, item, oclcNumber)
+>>> manager = RecordManager(ledgerDb=os.path.join(tempfile.mkdtemp(), 'ledger.db'))
+>>> manager.ledger.confirm('lbd', '8888')
+>>> manager.delete_numbers = ['8888']
+>>> pipeline = LbdPipeline(manager, workers=1)
+>>> pipeline.run()
+OCLC suggests removing LBD 8888 (if you own it)
+8888 LBD already deleted
+set errors: 0
+unset errors: 0
+match errors: 0
+delete errors: 0
+True
+>>> pipeline.sent
+[('unset', '8888')]
+>>> manager.closeStores()
@@ -0,0 +1,139 @@
+###############################################################################
+#
+# Purpose: cProfile and tracemalloc profiles of a run.
+# Date:    Mon 19 Oct 2026
+# Copyright (c) 2026 Andrew Nisbet
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+import cProfile
+import io
+import pstats
+import tracemalloc
+from logit import logit
+
+class Profiler:
+    """
+    Profiles a run with cProfile and writes the statistics to a '.pstats'
+    file, which can be read with 'python -m pstats' or snakeviz. Memory
+    is traced with tracemalloc, and a snapshot of the top allocators is
+    logged after each stage.
+
+    Only the named stages are profiled if any are given, otherwise
+    everything from start() to stop(). Register the profiler with
+    StageTimer.addObserver() to have it follow the stages of a run.
+    """
+    def __init__(self, fileName:str, stages:list=None, top:int=10):
+        """
+        Constructor
+
+        Parameters:
+        - fileName of the '.pstats' file to write.
+        - stages names of the stages to profile, or None for the whole run.
+        - top number of functions and allocators to log.
+
+        Returns:
+        - Profiler object.
+        """
+        self.file_name = fileName
+        self.stages = set(stages) if stages else None
+        self.top = top
+        self.profile = cProfile.Profile()
+        self.running = False
+        self.snapshots = 0
+
+    def start(self):
+        """
+        Starts tracing memory and, when profiling the whole run, timing calls.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.stages is None:
+            self._enable_()
+
+    def _enable_(self):
+        if not self.running:
+            self.profile.enable()
+            self.running = True
+
+    def _disable_(self):
+        if self.running:
+            self.profile.disable()
+            self.running = False
+
+    def stageStarted(self, name:str):
+        if self.stages is not None and name in self.stages:
+            self._enable_()
+
+    def stageEnded(self, stage):
+        if self.stages is not None and stage.name in self.stages:
+            self._disable_()
+        self.snapshot(stage.name)
+
+    def snapshot(self, label:str):
+        """
+        Logs the memory in use and the lines that allocated the most.
+
+        Parameters:
+        - label of the snapshot, like the stage that just ended.
+
+        Returns:
+        - None
+        """
+        if not tracemalloc.is_tracing():
+            return
+        (current, peak) = tracemalloc.get_traced_memory()
+        logit(f"memory after {label}: {current / 1048576:.1f} MiB in use, {peak / 1048576:.1f} MiB peak")
+        statistics = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        )).statistics('lineno')
+        for statistic in statistics[:self.top]:
+            frame = statistic.traceback[0]
+            logit(f"  {statistic.size / 1024:10.1f} KiB {statistic.count:8} blocks  {frame.filename}:{frame.lineno}")
+        self.snapshots += 1
+
+    def stop(self):
+        """
+        Stops profiling, writes the '.pstats' file and logs the functions
+        with the most cumulative time.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        self._disable_()
+        if tracemalloc.is_tracing():
+            self.snapshot('run')
+            tracemalloc.stop()
+        self.profile.dump_stats(self.file_name)
+        stream = io.StringIO()
+        pstats.Stats(self.profile, stream=stream).sort_stats('cumulative').print_stats(self.top)
+        for line in stream.getvalue().splitlines():
+            if line.strip():
+                logit(line)
+        logit(f"profile saved to {self.file_name}")
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    doctest.testfile("profiling.tst")
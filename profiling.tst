@@ -0,0 +1,45 @@
+Tests for Profiler
+==================
+
+>>> import os, pstats, tracemalloc
+>>> from profiling import Profiler
+>>> from timing import StageTimer
+
+Test profiling the whole run
+----------------------------
+>>> profiler = Profiler('test_profile.pstats', top=3)
+>>> profiler.start()
+>>> tracemalloc.is_tracing()
+True
+>>> data = [str(i) * 10 for i in range(10000)]
+>>> profiler.stop()  # doctest: +ELLIPSIS
+memory after run: ...
+profile saved to test_profile.pstats
+>>> tracemalloc.is_tracing()
+False
+>>> isinstance(pstats.Stats('test_profile.pstats'), pstats.Stats)
+True
+
+Test profiling named stages
+---------------------------
+Only the 'normalize' stage is profiled, but memory is logged after every stage.
+>>> timer = StageTimer()
+>>> profiler = Profiler('test_profile.pstats', stages=['normalize'], top=1)
+>>> timer.addObserver(profiler)
+>>> profiler.start()
+>>> profiler.running
+False
+>>> with timer.stage('read adds'):
+...     data = sorted(data)  # doctest: +ELLIPSIS
+memory after read adds: ...
+>>> with timer.stage('normalize'):  # doctest: +ELLIPSIS
+...     profiler.running
+True
+memory after normalize: ...
+>>> profiler.running
+False
+>>> profiler.snapshots
+2
+>>> profiler.stop()  # doctest: +ELLIPSIS
+memory after run: ...
+>>> os.unlink('test_profile.pstats')
@@ -0,0 +1,141 @@
+###############################################################################
+#
+# Purpose: Throttled progress lines for the long stages of an update.
+# Date:    Mon 19 Oct 2026
+# Copyright (c) 2026 Andrew Nisbet
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+from datetime import timedelta
+from time import monotonic
+from logit import logit
+
+# Weight of the latest interval in the moving average rate.
+SMOOTHING = 0.3
+
+class Progress:
+    """
+    Logs a stage's progress at most every 'everySeconds' seconds: items
+    processed out of the total, the rate over the last interval and its
+    moving average, the error rate, and the time left at the average rate.
+    Between reports tick() only adds to a counter and reads the clock.
+    """
+    def __init__(self, name:str, total:int, everySeconds:float=30.0, errors=None):
+        """
+        Constructor
+
+        Parameters:
+        - name of the stage, like 'set'.
+        - total number of items the stage will process.
+        - everySeconds seconds between progress lines.
+        - errors optional function that returns the stage's error count.
+
+        Returns:
+        - Progress object.
+        """
+        self.name = name
+        self.total = total
+        self.every_seconds = everySeconds
+        self.errors = errors
+        self.errors_start = errors() if errors else 0
+        self.processed = 0
+        self.start_time = monotonic()
+        self.last_time = self.start_time
+        self.last_processed = 0
+        self.average_rate = None
+        self.next_report = self.start_time + everySeconds
+
+    def tick(self, count:int=1):
+        """
+        Counts processed items and logs a progress line if one is due.
+
+        Parameters:
+        - count number of items processed.
+
+        Returns:
+        - None
+        """
+        self.processed += count
+        now = monotonic()
+        if now >= self.next_report:
+            self.report(now)
+
+    def errorCount(self) -> int:
+        return self.errors() - self.errors_start if self.errors else 0
+
+    def line(self, now:float) -> str:
+        """
+        Formats a progress line and updates the rates.
+
+        Parameters:
+        - now monotonic time of the report.
+
+        Returns:
+        - String like 'set: 1200/30000 (4.0%) 12.3/s now, 11.8/s avg, 6 errors (0.5%), ETA 0:40:41'.
+        """
+        interval = now - self.last_time
+        rate = (self.processed - self.last_processed) / interval if interval > 0 else 0.0
+        if self.average_rate is None:
+            elapsed = now - self.start_time
+            self.average_rate = self.processed / elapsed if elapsed > 0 else rate
+        else:
+            self.average_rate = SMOOTHING * rate + (1.0 - SMOOTHING) * self.average_rate
+        self.last_time = now
+        self.last_processed = self.processed
+        percent = 100.0 * self.processed / self.total if self.total else 100.0
+        errors = self.errorCount()
+        error_percent = 100.0 * errors / self.processed if self.processed else 0.0
+        remaining = max(0, self.total - self.processed)
+        if not remaining:
+            eta = '0:00:00'
+        elif self.average_rate > 0:
+            eta = str(timedelta(seconds=round(remaining / self.average_rate)))
+        else:
+            eta = 'unknown'
+        return (f"{self.name}: {self.processed}/{self.total} ({percent:.1f}%) {rate:.1f}/s now, {self.average_rate:.1f}/s avg, "
+            f"{errors} errors ({error_percent:.1f}%), ETA {eta}")
+
+    def report(self, now:float=None):
+        """
+        Logs a progress line now.
+
+        Parameters:
+        - now optional monotonic time, read from the clock if not given.
+
+        Returns:
+        - None
+        """
+        if now is None:
+            now = monotonic()
+        logit(self.line(now), timestamp=True)
+        self.next_report = now + self.every_seconds
+
+    def finish(self):
+        """
+        Logs the stage's totals.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
+        elapsed = monotonic() - self.start_time
+        rate = self.processed / elapsed if elapsed > 0 else 0.0
+        logit(f"{self.name}: {self.processed}/{self.total} done in {timedelta(seconds=round(elapsed))}, {rate:.1f}/s, {self.errorCount()} errors", timestamp=True)
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    doctest.testfile("progress.tst")
@@ -0,0 +1,35 @@
+Tests for Progress
+==================
+
+>>> from progress import Progress
+
+Test progress lines
+-------------------
+Times are passed to line() so the rates are predictable.
+>>> errors = {'set': 0}
+>>> progress = Progress('set', 1000, everySeconds=3600, errors=lambda: errors['set'])
+>>> start = progress.start_time
+>>> progress.tick(100)
+>>> errors['set'] += 2
+>>> progress.line(start + 10.0)
+'set: 100/1000 (10.0%) 10.0/s now, 10.0/s avg, 2 errors (2.0%), ETA 0:01:30'
+
+The average moves towards the latest rate.
+>>> progress.tick(300)
+>>> progress.line(start + 20.0)
+'set: 400/1000 (40.0%) 30.0/s now, 16.0/s avg, 2 errors (0.5%), ETA 0:00:38'
+
+Nothing is logged by tick() until a report is due.
+>>> progress.tick()
+>>> progress.processed
+401
+
+A finished stage has no time left.
+>>> progress.tick(599)
+>>> progress.line(start + 30.0).endswith('ETA 0:00:00')
+True
+
+Errors are optional, and a stalled stage has an unknown ETA.
+>>> progress = Progress('unset', 50)
+>>> progress.line(progress.start_time + 5.0)
+'unset: 0/50 (0.0%) 0.0/s now, 0.0/s avg, 0 errors (0.0%), ETA unknown'
@@ -22,6 +22,7 @@ from logit import logit
 from os import linesep
 import sys
 import html # For converting special chars into XML entity references.
+import hashlib
 
 SET = 'set'
 UNSET = 'unset'
@@ -30,12 +31,15 @@ IGNORE = 'ignore'
 UPDATED = 'updated'
 COMPLETED = 'done'
 FAILED = 'failed'
+# All the actions a record can have.
+ACTIONS = (SET, UNSET, MATCH, IGNORE, UPDATED, COMPLETED, FAILED)
 
 FLAT_DOCUMENT_REGEX     = re.compile(r'^\*\*\* DOCUMENT BOUNDARY \*\*\*[\s+]?$')
 FLAT_FORM_REGEX         = re.compile(r'^FORM=')
 FLAT_TCN_REGEX          = re.compile(r'^\.001\.\s+')
 FLAT_O_O_EIGHT_REGEX    = re.compile(r'^\.008\.\s')
 FLAT_O_THREE_FIVE_REGEX = re.compile(r'^\.035\.\s+')
+FLAT_O_O_FIVE_REGEX     = re.compile(r'^\.005\.\s')
 OCLC_PREFIX_REGEX       = re.compile(r'\(OCoLC\)')
 MRK_DOCUMENT_REGEX      = re.compile(r'^=LDR\s')
 MRK_TCN_REGEX           = re.compile(r'^=001\s')
@@ -305,6 +309,88 @@ class MarcXML:
         xml_content_str = f"{linesep}".join(a)
         return bytes(xml_content_str, 'utf-8')
 
+class ActionIndex:
+    """ 
+    Buckets of Records by action. Records move between buckets in constant
+    time as their set*() methods are called, so counting or visiting the
+    records with a given action doesn't mean scanning all of them. Records
+    are numbered as they are added so each bucket can be visited in the 
+    original order.
+    """
+    def __init__(self, records:list=[]):
+        """ 
+        Constructor
+
+        Parameters:
+        - Optional list of Records to index.
+
+        Returns:
+        - ActionIndex object.
+        """
+        self.buckets = {}
+        self.next_seq = 0
+        for record in records:
+            self.add(record)
+
+    def add(self, record):
+        """ 
+        Adds a Record to the bucket of its current action.
+
+        Parameters:
+        - Record object.
+
+        Returns:
+        - None
+        """
+        record.index = self
+        record.index_seq = self.next_seq
+        self.next_seq += 1
+        self.buckets.setdefault(record.action, {})[record.index_seq] = record
+
+    def move(self, record, oldAction:str):
+        """ 
+        Moves a Record from its old action bucket to the bucket of its
+        current action. Called by Record when its action changes.
+
+        Parameters:
+        - Record object.
+        - The action the record had before.
+
+        Returns:
+        - None
+        """
+        self.buckets.get(oldAction, {}).pop(record.index_seq, None)
+        self.buckets.setdefault(record.action, {})[record.index_seq] = record
+
+    def count(self, action:str) -> int:
+        """ 
+        Returns the number of records with a given action.
+
+        Parameters:
+        - action like 'set', 'match' or 'updated'.
+
+        Returns:
+        - integer count.
+        """
+        return len(self.buckets.get(action, {}))
+
+    def records(self, *actions) -> list:
+        """ 
+        Returns the records with any of the given actions, in the order they
+        were added. The list is a copy so records can change action while 
+        it is being visited.
+
+        Parameters:
+        - One or more actions like 'set', 'updated', or 'match'.
+
+        Returns:
+        - list of Records.
+        """
+        selected = {}
+        for action in actions:
+            selected.update(self.buckets.get(action, {}))
+        return [selected[seq] for seq in sorted(selected)]
+
 class Record:
     """ 
     A single flat record object.
@@ -339,6 +425,14 @@ class Record:
         self.oclc_number = oclcNumber
         # To put the old OCLC number in a subfield - z.
         self.prev_oclc_number = previousNumber
+        # ActionIndex this record belongs to, and its position in it.
+        self.index = None
+        self.index_seq = -1
+        # Row of this record in a StateStore, if saved in one.
+        self.state_id = None
+        # OCLC number last written to the bib overlay, so the record isn't
+        # written again under the same number. See RecordManager.generateUpdatedSlimFlat().
+        self.overlay_number = ''
         if not data:
             return
         elif data and re.search(FLAT_DOCUMENT_REGEX, data[0]):
@@ -361,7 +455,7 @@ class Record:
         return {"data": self.record, "rejectTags": self.reject_tags, 
         "action": self.action, "encoding": self.encoding, 
         "tcn": self.title_control_number, "oclcNumber": self.oclc_number, 
-        "previousNumber": self.prev_oclc_number}
+        "previousNumber": self.prev_oclc_number, "overlayNumber": self.overlay_number}
 
     # The from_dict method is a class method because it doesn't operate 
     # on an instance of the class but rather on the class itself.  
@@ -376,10 +470,17 @@ class Record:
         Returns:
         - New Record object.
         """
-        return cls(data=jdata["data"], rejectTags=jdata["rejectTags"],
+        # The data was parsed when the record was first read, so it is
+        # used as is. Parsing it again would be slow and would replace
+        # the saved OCLC number with the one in the 035.
+        record = cls(data=[], rejectTags=jdata["rejectTags"],
         action=jdata["action"], encoding=jdata["encoding"], 
         tcn=jdata["tcn"], oclcNumber=jdata["oclcNumber"], 
         previousNumber=jdata["previousNumber"])
+        record.record = jdata["data"]
+        # Checkpoints from older versions don't have it.
+        record.overlay_number = jdata.get("overlayNumber", '')
+        return record
 
     def makeFlatLineFromMrk(self, data:str) -> str:
         """ 
@@ -537,6 +638,22 @@ class Record:
         """
         return self.action
 
+    def _setAction_(self, action:str):
+        """ 
+        Changes the action of the record and moves it to the matching
+        bucket of its ActionIndex, if it has one.
+
+        Parameters:
+        - The new action like 'set', 'unset', or 'match'.
+
+        Returns:
+        - None
+        """
+        old_action = self.action
+        self.action = action
+        if self.index is not None and old_action != action:
+            self.index.move(self, old_action)
+
     def setIgnore(self):
         """ 
         Sets the action status of a record to ignore.
@@ -547,7 +664,7 @@ class Record:
         Returns:
         - None
         """
-        self.action = IGNORE
+        self._setAction_(IGNORE)
 
     def setUpdated(self):
         """ 
@@ -559,7 +676,7 @@ class Record:
         Returns:
         - None 
         """
-        self.action = UPDATED
+        self._setAction_(UPDATED)
 
     def setAdd(self):
         """ 
@@ -571,7 +688,7 @@ class Record:
         Returns:
         - None
         """
-        self.action = SET
+        self._setAction_(SET)
         
     def setDelete(self):
         """ 
@@ -583,7 +700,7 @@ class Record:
         Returns:
         - None
         """
-        self.action = UNSET
+        self._setAction_(UNSET)
 
     def setFailed(self):
         """ 
@@ -595,7 +712,7 @@ class Record:
         Returns:
         - None
         """
-        self.action = FAILED
+        self._setAction_(FAILED)
     
     def setCompleted(self):
         """ 
@@ -607,7 +724,7 @@ class Record:
         Returns:
         - None
         """
-        self.action = COMPLETED
+        self._setAction_(COMPLETED)
 
     def setLookupMatch(self):
         """ 
@@ -619,7 +736,7 @@ class Record:
         Returns:
         - None
         """
-        self.action = MATCH
+        self._setAction_(MATCH)
 
     def getOclcNumber(self) -> str:
         """ 
@@ -678,6 +795,7 @@ class Record:
         if not self.record:
             return ''
         s = open(fileName, mode='at', encoding=self.encoding) if fileName else sys.stdout
+        wrote_oclc_number = False
         for entry in self.record:
             if re.search(FLAT_DOCUMENT_REGEX, entry):
                 s.write(f"{entry}{linesep}")
@@ -688,6 +806,7 @@ class Record:
             elif re.search(FLAT_O_THREE_FIVE_REGEX, entry):
                 # If this has an OCoLC then save as a 'set' number otherwise just record it as a regular 035.
                 if re.search(OCLC_PREFIX_REGEX, entry):
+                    wrote_oclc_number = True
                     if self.prev_oclc_number:
                         s.write(f".035.   |a(OCoLC){self.oclc_number}|z(OCoLC){self.prev_oclc_number}{linesep}")
                     else:
@@ -698,6 +817,9 @@ class Record:
                     s.write(f"{entry}{linesep}")
             else:
                 continue
+        # Matched records may not have had an OCLC number to replace.
+        if not wrote_oclc_number and self.oclc_number:
+            s.write(f".035.   |a(OCoLC){self.oclc_number}{linesep}")
         if s is not sys.stdout:
             s.close()
 
@@ -745,6 +867,32 @@ class Record:
         else:
             logit(message)
 
+    def getFingerprint(self) -> str:
+        """ 
+        Computes a content hash of the record used to tell if a bib has
+        changed since it was last sent to OCLC. The '005' date of last
+        transaction and the OCLC number's '035' are left out; the OCLC
+        number is compared separately so a record overlaid with an 
+        updated number from OCLC doesn't count as a change.
+
+        Parameters:
+        - None
+
+        Returns:
+        - Hex digest string, or an empty string if the record has no data.
+        """
+        if not self.record:
+            return ''
+        digest = hashlib.sha1()
+        for entry in self.record:
+            if re.search(FLAT_O_O_FIVE_REGEX, entry):
+                continue
+            if re.search(FLAT_O_THREE_FIVE_REGEX, entry) and re.search(OCLC_PREFIX_REGEX, entry):
+                continue
+            digest.update(entry.encode('utf-8'))
+            digest.update(b'\n')
+        return digest.hexdigest()
+
     def updateOclcNumber(self, oclcNumber:str):
         """ 
         Updates the record's OCLC number, preserving any previous number in 
@@ -759,6 +907,29 @@ class Record:
         self.prev_oclc_number = self.oclc_number
         self.oclc_number = oclcNumber
 
+    def isOclcNumberUpdated(self) -> bool:
+        """ 
+        Tests if the record's OCLC number differs from the one in its MARC
+        data, either because OCLC moved the holding to a new number or the
+        record was matched or added as a new bib. These records need a bib
+        overlay in the ILS even after their holding is set.
+
+        Parameters:
+        - None
+
+        Returns:
+        - True if the OCLC number was updated, and False otherwise.
+        """
+        if not self.oclc_number:
+            return False
+        original = ''
+        for entry in self.record:
+            if re.search(FLAT_O_THREE_FIVE_REGEX, entry) or re.search(MRK_O_THREE_FIVE_REGEX, entry):
+                my_oclc_num = re.search(r'a\(OCoLC\)(\d+)', entry)
+                if my_oclc_num:
+                    original = my_oclc_num.group(1)
+        return self.oclc_number != original
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
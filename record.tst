@@ -124,6 +124,23 @@ FORM=MUSIC
 .035.   |a(OCoLC)12345678|z(OCoLC)779882439
 .035.   |a(CaAE) o779883333
 
+>>> record.isOclcNumberUpdated()
+True
+
+A matched record had no OCLC number to replace, so one is added.
+>>> matched = Record(["*** DOCUMENT BOUNDARY ***", "FORM=MUSIC", ".001. |aocn779882439", ".035.   |a(Sirsi) o779881111"])
+>>> matched.isOclcNumberUpdated()
+False
+>>> matched.updateOclcNumber('55555')
+>>> matched.isOclcNumberUpdated()
+True
+>>> matched.asSlimFlat()
+*** DOCUMENT BOUNDARY ***
+FORM=MUSIC
+.001. |aocn779882439
+.035.   |a(Sirsi) o779881111
+.035.   |a(OCoLC)55555
+
 
 Test output slim flat file to file
 ----------------------------------
@@ -419,4 +436,51 @@ Test that the 008 field is the right length (40)
 ... ]
 >>> record = Record(r)
 >>> record.asXml()
-'<record><leader>00000nam a2200000 i 4500</leader><controlfield tag="001">1886633</controlfield><controlfield tag="005">20180626122213.0</controlfield><controlfield tag="008">171109s2018    mnua   e      001 0 eng  </controlfield><datafield tag="010" ind1=" " ind2=" "><subfield code="a">  2017051171</subfield></datafield><datafield tag="040" ind1=" " ind2=" "><subfield code="a">DLC</subfield><subfield code="b">eng</subfield><subfield code="e">rda</subfield><subfield code="c">DLC</subfield><subfield code="d">UtOrBLW</subfield></datafield><datafield tag="100" ind1="1" ind2=" "><subfield code="a">Jeanroy, Amelia.</subfield></datafield><datafield tag="245" ind1="1" ind2="0"><subfield code="a">Modern pressure canning :</subfield><subfield code="b">recipes and techniques for today\'s home canner /</subfield><subfield code="c">Amelia Jeanroy ; photography by Kerry Michaels.</subfield></datafield><datafield tag="500" ind1=" " ind2=" "><subfield code="a">Includes Internet addresses and index.</subfield></datafield></record>'
\ No newline at end of file
+'<record><leader>00000nam a2200000 i 4500</leader><controlfield tag="001">1886633</controlfield><controlfield tag="005">20180626122213.0</controlfield><controlfield tag="008">171109s2018    mnua   e      001 0 eng  </controlfield><datafield tag="010" ind1=" " ind2=" "><subfield code="a">  2017051171</subfield></datafield><datafield tag="040" ind1=" " ind2=" "><subfield code="a">DLC</subfield><subfield code="b">eng</subfield><subfield code="e">rda</subfield><subfield code="c">DLC</subfield><subfield code="d">UtOrBLW</subfield></datafield><datafield tag="100" ind1="1" ind2=" "><subfield code="a">Jeanroy, Amelia.</subfield></datafield><datafield tag="245" ind1="1" ind2="0"><subfield code="a">Modern pressure canning :</subfield><subfield code="b">recipes and techniques for today\'s home canner /</subfield><subfield code="c">Amelia Jeanroy ; photography by Kerry Michaels.</subfield></datafield><datafield tag="500" ind1=" " ind2=" "><subfield code="a">Includes Internet addresses and index.</subfield></datafield></record>'
+
+Test getFingerprint
+-------------------
+The fingerprint ignores the '005' and the OCLC number, but not other changes.
+>>> a = ["*** DOCUMENT BOUNDARY ***", ".001. |aocn779882439", ".005. |a20140415031115.0", ".035.   |a(OCoLC)779882439", ".245. 00|aTreme."]
+>>> b = ["*** DOCUMENT BOUNDARY ***", ".001. |aocn779882439", ".005. |a20240101000000.0", ".035.   |a(OCoLC)1111", ".245. 00|aTreme."]
+>>> c = ["*** DOCUMENT BOUNDARY ***", ".001. |aocn779882439", ".005. |a20140415031115.0", ".035.   |a(OCoLC)779882439", ".245. 00|aTreme. Season 2"]
+>>> Record(a).getFingerprint() == Record(b).getFingerprint()
+True
+>>> Record(a).getFingerprint() == Record(c).getFingerprint()
+False
+>>> Record([]).getFingerprint()
+''
+
+
+Test ActionIndex
+----------------
+Records move between buckets as their actions change and are returned in the order added.
+>>> from record import ActionIndex, SET, MATCH, UPDATED
+>>> records = [Record([], tcn=f"tcn{i}", oclcNumber=f"{i}") for i in range(4)]
+>>> index = ActionIndex(records)
+>>> index.count(SET)
+4
+>>> records[2].setLookupMatch()
+>>> records[0].setUpdated()
+>>> records[3].setUpdated()
+>>> (index.count(SET), index.count(MATCH), index.count(UPDATED))
+(1, 1, 2)
+>>> [r.getTitleControlNumber() for r in index.records(SET, UPDATED)]
+['tcn0', 'tcn1', 'tcn3']
+>>> index.count('done')
+0
+
+Test _toDict_ and _fromDict_
+----------------------------
+A record read back from a dictionary keeps its updated OCLC number.
+>>> record = Record(["*** DOCUMENT BOUNDARY ***", "FORM=MUSIC", ".001. |aocn779882439", ".035.   |a(OCoLC)779882439"])
+>>> record.updateOclcNumber('12345678')
+>>> record.overlay_number = '12345678'
+>>> restored = Record._fromDict_(record._toDict_())
+>>> (restored.getTitleControlNumber(), restored.getOclcNumber(), restored.prev_oclc_number, restored.overlay_number)
+('ocn779882439', '12345678', '779882439', '12345678')
+>>> restored.asSlimFlat()
+*** DOCUMENT BOUNDARY ***
+FORM=MUSIC
+.001. |aocn779882439
+.035.   |a(OCoLC)12345678|z(OCoLC)779882439
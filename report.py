@@ -19,6 +19,7 @@
 #
 ###############################################################################
 import argparse
+import atexit
 from selenium import webdriver
 from selenium.webdriver import Firefox, FirefoxOptions
 from selenium.webdriver.common.by import By
@@ -35,6 +36,8 @@ import re
 import zipfile
 import os
 from logit import logit
+from holdings import HoldingsStore
+from profiling import Profiler
 
 VERSION='1.02.02d' # Fixed time-to-ready report estimate and reporting.
 # Wait durations for page loads. 
@@ -637,7 +640,8 @@ def reportToList(inputFile:str, outputFile:str, debug:bool=False):
 # param: outputFile:str name and path of the compiled list of deletes. Also defined in prod.json 
 #   in the oclcHoldingsListName setting. 
 # param: debug:bool turns on debugging.  
-def compile_report(downloadDirectory:str, reportName:str, outputFile:str, debug:bool=False):
+# param: holdingsDb:str optional local holdings store (see holdings.py) to seed with the list.
+def compile_report(downloadDirectory:str, reportName:str, outputFile:str, debug:bool=False, holdingsDb:str=None):
     latest_report_full_path = findReport(directoryPath=downloadDirectory, filePrefix=reportName)
     if not latest_report_full_path:
         logit(f"**error, there doesn't seem to be a report downloaded to {downloadDirectory} that starts with '{reportName}'", timestamp=True)
@@ -645,6 +649,11 @@ def compile_report(downloadDirectory:str, reportName:str, outputFile:str, debug:
     logit(f"converting CSV to list.", timestamp=True)
     reportToList(inputFile=latest_report_full_path, outputFile=outputFile, debug=debug)
     logit(f"done outputting {outputFile}", timestamp=True)
+    if holdingsDb:
+        store = HoldingsStore(holdingsDb)
+        count = store.seedFromList(outputFile)
+        store.close()
+        logit(f"seeded {holdingsDb} with {count} holdings", timestamp=True)
 
 def main(argv):
     parser = argparse.ArgumentParser(
@@ -665,11 +674,19 @@ def main(argv):
     parser.add_argument('--config', action='store', default='prod.json', metavar='[/foo/prod.json]', help='configurations for OCLC web services.')
     parser.add_argument('--compile', action='store_true', default=False, help='compile OCLC report into a list OCLC numbers. Assumes report has been downloaded before".')
     parser.add_argument('-d', '--debug', action='store_true', default=False, help='turn on debugging.')
+    parser.add_argument('--holdings-db', action='store', metavar='[/foo/holdings.db]', help='seed the local holdings store oclc4.py uses with the compiled list.')
     parser.add_argument('--download', action='store_true', default=False, help='assumes the report has been requested, and it is time to download it.')
+    parser.add_argument('--profile', action='store_true', default=False, help='profile the run with cProfile, writing report.pstats, and log the top memory allocators after compiling the report.')
     parser.add_argument('--order', action='store_true', default=False, help='requests a holdings report from OCLC\'s analytics self-serve portal and exit.')
     parser.add_argument('--version', action='version', version='%(prog)s ' + VERSION)
     
     args = parser.parse_args()
+    profiler = None
+    if args.profile:
+        profiler = Profiler('report.pstats')
+        profiler.start()
+        # Most ways out of the script are sys.exit(), so save the profile at exit.
+        atexit.register(profiler.stop)
     # Read in configurations.
     configs_file = args.config
     logit(f"config file: {configs_file}", timestamp=True)
@@ -697,7 +714,9 @@ def main(argv):
 
     if args.compile:
         logit(f"Compiling OCLC report", timestamp=True)
-        compile_report(report_download_directory, report_name, holdings_list_name, args.debug)
+        compile_report(report_download_directory, report_name, holdings_list_name, args.debug, holdingsDb=args.holdings_db)
+        if profiler is not None:
+            profiler.snapshot('compile')
         sys.exit(0)
 
     options = FirefoxOptions()
@@ -746,7 +765,9 @@ def main(argv):
             logit(f"**error, while downloading file starting with {full_report_name}", timestamp=True)
             sys.exit(1)
         # Find the latest report starting with 'reportName' from configs.json.
-        compile_report(downloadDirectory=report_download_directory, reportName=report_name, outputFile=holdings_list_name, debug=args.debug)
+        compile_report(downloadDirectory=report_download_directory, reportName=report_name, outputFile=holdings_list_name, debug=args.debug, holdingsDb=args.holdings_db)
+        if profiler is not None:
+            profiler.snapshot('compile')
         logout(driver)
         logit(f"done.", timestamp=True)
     if not args.debug:
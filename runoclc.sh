@@ -21,15 +21,16 @@
 ###############################################################################
 APP=$(basename -s .sh "$0")
 # Name of the file to check
-ADD_FILE_BACKUP="oclc_update_adds.json"
+ADD_FILE_BACKUP="oclc_update_adds.jsonl"
 DEL_FILE_BACKUP="oclc_update_deletes.json"
 # Name of the Python script to run
 PYTHON_SCRIPT="oclc4.py"
-VERSION="1.01.00"
+VERSION="1.03.00"
 SLEEP_TIME="2"
 DEBUG=false
 ADD_FILE=
 DEL_FILE=
+STATE_DB=
 LOG="${APP}.log"
 SHARED_DIR="/home/anisbet/Shared"
 AUTHOR_ID=anisbet
@@ -62,6 +63,9 @@ Usage: $APP [-options]
    is automatically done by report.py.
  -h, --xhelp: See -x.
  -m, --maxruns: integer max number of processing sessions. Default $MAX_RUNS.
+ -s, --statedb: Save the run state in this SQLite database instead of
+   $ADD_FILE_BACKUP and $DEL_FILE_BACKUP. Remaining work is counted
+   with statestore.py.
  -v, --version: Display version and exits.
  -x, --xhelp: display usage message and exit.
 
@@ -88,13 +92,30 @@ logerr()
     echo -e "[$time] **error: $message" | tee -a "$LOG"
     exit 1
 }
+# Tests if the last run left work to do.
+# param:  none
+# return: 0 if there are outstanding requests and 1 otherwise.
+has_work()
+{
+    if [ -n "$STATE_DB" ]; then
+        python3 statestore.py --pending "$STATE_DB" >/dev/null
+        return $?
+    fi
+    [ -f "$ADD_FILE_BACKUP" ] || [ -f "$ADD_FILE_BACKUP.gz" ] || [ -f "$DEL_FILE_BACKUP" ]
+}
 # Reports the number of records left to process.
 report_progress()
 {
+    if [ -n "$STATE_DB" ]; then
+        logit "Work left in $STATE_DB. Running $PYTHON_SCRIPT...(BG) on "
+        python3 statestore.py "$STATE_DB" | tee -a "$LOG"
+        return
+    fi
     logit "File $ADD_FILE_BACKUP (or $DEL_FILE_BACKUP) found. Running $PYTHON_SCRIPT...(BG) on "
     pipe.pl -W'", "' -K <"$DEL_FILE_BACKUP" | pipe.pl -cc0 >/dev/null
     logit "delete records and "
-    grep -c '\"action\": \"set\"' "$ADD_FILE_BACKUP"
+    # One record per line, compressed with --compress-checkpoints.
+    cat "$ADD_FILE_BACKUP" "$ADD_FILE_BACKUP.gz" 2>/dev/null | zcat -f | grep -c '"action":"set"'
     logit "add records."
 }
 
@@ -104,7 +125,7 @@ report_progress()
 # -l is for long options with double dash like --version
 # the comma separates different long options
 # -a is for long options with single dash like -version
-options=$(getopt -l "add:,delete:,help,maxruns:,version,xhelp" -o "a:d:hm:vx" -a -- "$@") || logerr "Failed to parse options...exiting."
+options=$(getopt -l "add:,delete:,help,maxruns:,statedb:,version,xhelp" -o "a:d:hm:s:vx" -a -- "$@") || logerr "Failed to parse options...exiting."
 # set --:
 # If no arguments follow this option, then the positional parameters are unset. Otherwise, the positional parameters
 # are set to the arguments, even if some of them begin with a ‘-’.
@@ -135,6 +156,11 @@ do
         [ "$DEBUG" == true ] || logit "Maximum number of recoveries set to: $1"
 		MAX_RUNS="$1"
 		;;
+    -s|--statedb)
+        shift
+        [ "$DEBUG" == true ] || logit "run state saved in: $1"
+		STATE_DB="$1"
+		;;
     -v|--version)
         logit "$0 version: $VERSION"
         exit 0
@@ -150,10 +176,12 @@ do
     shift
 done
 logit "== starting $0 version: $VERSION"
+STATE_ARGS=()
+[ -n "$STATE_DB" ] && STATE_ARGS=(--state-db="$STATE_DB")
 if [[ -f "$ADD_FILE" && -f "$DEL_FILE" ]]; then
     logit "File $ADD_FILE and $DEL_FILE found. Running $PYTHON_SCRIPT"
-    python3 "$PYTHON_SCRIPT" --add="$ADD_FILE" --delete="$DEL_FILE"
-    if [ -f "$ADD_FILE_BACKUP" ] || [ -f "$DEL_FILE_BACKUP" ]; then
+    python3 "$PYTHON_SCRIPT" --add="$ADD_FILE" --delete="$DEL_FILE" "${STATE_ARGS[@]}"
+    if has_work; then
         report_progress
     fi
 fi
@@ -161,13 +189,13 @@ fi
 count=1
 # Start the loop through any backup files.
 while true; do
-    if [ -f "$ADD_FILE_BACKUP" ] || [ -f "$DEL_FILE_BACKUP" ]; then
+    if has_work; then
         report_progress
         if [[ "$count" -ge "$MAX_RUNS" ]]; then
             logit "Finished $MAX_RUNS processing attempts."
             break
         fi
-        python3 "$PYTHON_SCRIPT" --recover &
+        python3 "$PYTHON_SCRIPT" --recover "${STATE_ARGS[@]}" &
         count=$((count + 1))
         sleep "$SLEEP_TIME"h
     else
@@ -0,0 +1,147 @@
+###############################################################################
+#
+# Purpose: Sampled and anomaly-triggered debug logging.
+# Date:    Mon 19 Oct 2026
+# Copyright (c) 2026 Andrew Nisbet
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+import threading
+
+class DebugSampler:
+    """
+    Decides which events get debug output, so diagnostics can stay on in
+    production. A 'rate' fraction of ordinary events is logged, spread
+    evenly rather than at random so runs are repeatable, and anomalies like
+    error statuses, slow responses and failed matches are always logged.
+    Payloads are cut to 'maxChars' characters.
+    """
+    def __init__(self, rate:float=0.0, slowMs:float=0.0, maxChars:int=2000):
+        """
+        Constructor
+
+        Parameters:
+        - rate fraction of ordinary events to log, 0 for anomalies only
+          and 1 for every event.
+        - slowMs responses slower than this many milliseconds are anomalies,
+          0 to ignore latency.
+        - maxChars longest payload logged, 0 for no limit.
+
+        Returns:
+        - DebugSampler object.
+        """
+        self.rate = min(max(rate, 0.0), 1.0)
+        self.slow_ms = slowMs
+        self.max_chars = maxChars
+        self.credit = 0.0
+        self.sampled = 0
+        self.anomalies = 0
+        self.lock = threading.Lock()
+
+    def sample(self) -> bool:
+        """
+        Tests if an ordinary event should be logged. Each call adds 'rate'
+        to a running credit and an event is logged whenever it reaches one.
+
+        Parameters:
+        - None
+
+        Returns:
+        - True if the event should be logged.
+        """
+        if self.rate <= 0.0:
+            return False
+        with self.lock:
+            self.credit += self.rate
+            if self.credit >= 1.0:
+                self.credit -= 1.0
+                self.sampled += 1
+                return True
+        return False
+
+    def anomaly(self, status=200, latencyMs:float=0.0, failed:bool=False, error:str='') -> str:
+        """
+        Describes why a request is an anomaly.
+
+        Parameters:
+        - status HTTP status, or None if there was no response.
+        - latencyMs time the request took.
+        - failed True if the outcome was a failure, like a failed match.
+        - error name of the exception the request raised, if any.
+
+        Returns:
+        - The reason, like 'status 500' or 'slow', or an empty string if
+          the request is ordinary.
+        """
+        if error:
+            reason = error
+        elif failed:
+            reason = 'failed'
+        elif status != 200:
+            reason = f"status {status}"
+        elif self.slow_ms > 0 and latencyMs > self.slow_ms:
+            reason = 'slow'
+        else:
+            return ''
+        with self.lock:
+            self.anomalies += 1
+        return reason
+
+    def truncate(self, payload) -> str:
+        """
+        Cuts a payload down to the longest allowed.
+
+        Parameters:
+        - payload string, bytes or other object to log.
+
+        Returns:
+        - String, ending with the number of characters cut if it was too long.
+        """
+        if isinstance(payload, bytes):
+            text = payload.decode('utf-8', errors='replace')
+        else:
+            text = str(payload)
+        if self.max_chars and len(text) > self.max_chars:
+            return f"{text[:self.max_chars]}... ({len(text) - self.max_chars} more characters)"
+        return text
+
+# The process-wide sampler, if sampled debugging is on.
+_sampler = None
+
+def startSampling(rate:float=0.0, slowMs:float=0.0, maxChars:int=2000) -> DebugSampler:
+    """
+    Turns on sampled debug logging. See DebugSampler for the parameters.
+
+    Returns:
+    - DebugSampler object.
+    """
+    global _sampler
+    _sampler = DebugSampler(rate=rate, slowMs=slowMs, maxChars=maxChars)
+    return _sampler
+
+def stopSampling():
+    global _sampler
+    _sampler = None
+
+def getSampler() -> DebugSampler:
+    """
+    Returns:
+    - The DebugSampler, or None if sampled debugging is off.
+    """
+    return _sampler
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    doctest.testfile("sampling.tst")
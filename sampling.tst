@@ -0,0 +1,60 @@
+Tests for DebugSampler
+======================
+
+>>> from sampling import DebugSampler, startSampling, stopSampling, getSampler
+
+Test sampling
+-------------
+A rate of 0.25 logs every fourth event.
+>>> sampler = DebugSampler(rate=0.25)
+>>> [sampler.sample() for i in range(8)]
+[False, False, False, True, False, False, False, True]
+>>> sampler.sampled
+2
+>>> DebugSampler().sample()
+False
+>>> DebugSampler(rate=1.0).sample()
+True
+
+Test anomalies
+--------------
+>>> sampler = DebugSampler(slowMs=1000)
+>>> sampler.anomaly(200, 20.0)
+''
+>>> sampler.anomaly(500, 20.0)
+'status 500'
+>>> sampler.anomaly(None, 20.0)
+'status None'
+>>> sampler.anomaly(200, 1500.0)
+'slow'
+>>> sampler.anomaly(failed=True)
+'failed'
+>>> sampler.anomaly(error='ReadTimeout')
+'ReadTimeout'
+>>> sampler.anomalies
+5
+
+Slow responses are ordinary without a threshold.
+>>> DebugSampler().anomaly(200, 60000.0)
+''
+
+Test truncation
+---------------
+>>> sampler = DebugSampler(maxChars=10)
+>>> sampler.truncate('0123456789abcdef')
+'0123456789... (6 more characters)'
+>>> sampler.truncate(b'short')
+'short'
+>>> DebugSampler(maxChars=0).truncate('x' * 50) == 'x' * 50
+True
+
+Test the process-wide sampler
+-----------------------------
+>>> getSampler() is None
+True
+>>> sampler = startSampling(rate=0.5)
+>>> getSampler() is sampler
+True
+>>> stopSampling()
+>>> getSampler() is None
+True
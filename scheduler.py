@@ -0,0 +1,144 @@
+###############################################################################
+#
+# Purpose: Share the requests in flight between the queues of an update.
+# Date:    Mon 19 Oct 2026
+# Copyright (c) 2026 Andrew Nisbet
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+import argparse
+
+# Queues of the pipelined update, in the order ties are broken.
+UNSET_QUEUE  = 'unset'
+SET_QUEUE    = 'set'
+MATCH_QUEUE  = 'match'
+NEWBIB_QUEUE = 'newbib'
+UPDATE_QUEUE = 'update'
+QUEUES = (UNSET_QUEUE, SET_QUEUE, MATCH_QUEUE, NEWBIB_QUEUE, UPDATE_QUEUE)
+
+# Work that finishes a record already started, like a match or the set of
+# an updated number, gets more turns than new adds and deletes.
+DEFAULT_WEIGHTS = {
+    UNSET_QUEUE: 1,
+    SET_QUEUE: 1,
+    MATCH_QUEUE: 4,
+    NEWBIB_QUEUE: 4,
+    UPDATE_QUEUE: 4,
+}
+
+class WorkScheduler:
+    """
+    Picks the queue that gets the next request slot with smooth weighted
+    round robin. Each turn every queue with work adds its weight to its
+    credit, and the queue with the most credit is picked and pays back the
+    total weight. A queue with weight 4 gets four turns for every turn of a
+    queue with weight 1, spread out rather than in a burst, and every queue
+    with a weight gets turns, so none is starved. A queue at its cap of
+    requests in flight sits out until one of its requests finishes.
+    """
+    def __init__(self, weights:dict=None, caps:dict=None):
+        """
+        Constructor
+
+        Parameters:
+        - weights optional dictionary of queue: weight, see DEFAULT_WEIGHTS.
+          Queues not given keep their default, and weight 0 only gets
+          turns when no other queue has work.
+        - caps optional dictionary of queue: most requests in flight.
+
+        Returns:
+        - WorkScheduler object.
+        """
+        self.weights = dict(DEFAULT_WEIGHTS)
+        if weights:
+            self.weights.update(weights)
+        self.caps = dict(caps) if caps else {}
+        self.credit = {queue: 0 for queue in QUEUES}
+        self.in_flight = {queue: 0 for queue in QUEUES}
+        self.picked = {queue: 0 for queue in QUEUES}
+
+    def eligible(self, queue:str) -> bool:
+        cap = self.caps.get(queue, 0)
+        return cap <= 0 or self.in_flight[queue] < cap
+
+    def pick(self, available) -> str:
+        """
+        Picks the queue for the next request.
+
+        Parameters:
+        - available queues that have work waiting.
+
+        Returns:
+        - Name of the queue, or None if every queue with work is at its cap.
+        """
+        candidates = [queue for queue in QUEUES if queue in available and self.eligible(queue)]
+        if not candidates:
+            return None
+        weighted = [queue for queue in candidates if self.weights.get(queue, 0) > 0]
+        if not weighted:
+            # Only zero weight queues have work, so take them in order.
+            self.picked[candidates[0]] += 1
+            return candidates[0]
+        total = 0
+        best = None
+        for queue in weighted:
+            self.credit[queue] += self.weights[queue]
+            total += self.weights[queue]
+            if best is None or self.credit[queue] > self.credit[best]:
+                best = queue
+        self.credit[best] -= total
+        self.picked[best] += 1
+        return best
+
+    def started(self, queue:str):
+        self.in_flight[queue] += 1
+
+    def finished(self, queue:str):
+        self.in_flight[queue] -= 1
+
+def parseSchedule(text:str) -> tuple:
+    """
+    Reads queue weights and caps from the command line.
+
+    Parameters:
+    - text like 'unset=1:2,match=8', each queue's weight and optionally
+      the most requests it can have in flight.
+
+    Returns:
+    - tuple of (weights, caps) dictionaries.
+    """
+    weights = {}
+    caps = {}
+    for part in text.split(','):
+        if not part.strip():
+            continue
+        try:
+            (queue, value) = part.split('=')
+            queue = queue.strip()
+            (weight, _, cap) = value.partition(':')
+            weights[queue] = int(weight)
+            if cap:
+                caps[queue] = int(cap)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"expected queue=weight[:cap], got '{part}'")
+        if queue not in QUEUES:
+            raise argparse.ArgumentTypeError(f"unknown queue '{queue}', expected one of {', '.join(QUEUES)}")
+        if weights[queue] < 0 or caps.get(queue, 0) < 0:
+            raise argparse.ArgumentTypeError(f"weights and caps can't be negative, got '{part}'")
+    return (weights, caps)
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    doctest.testfile("scheduler.tst")
@@ -0,0 +1,61 @@
+Tests for the work scheduler
+============================
+
+>>> from scheduler import WorkScheduler, parseSchedule
+
+Test weighted turns
+-------------------
+A queue with weight 3 gets three turns for each turn of a queue with
+weight 1, spread out.
+>>> scheduler = WorkScheduler(weights={'set': 3, 'unset': 1})
+>>> [scheduler.pick(['set', 'unset']) for i in range(8)]
+['set', 'unset', 'set', 'set', 'set', 'unset', 'set', 'set']
+
+By default matches get four turns for each set and each unset, but the
+sets and unsets still get theirs.
+>>> scheduler = WorkScheduler()
+>>> [scheduler.pick(['set', 'unset', 'match']) for i in range(12)]
+['match', 'unset', 'match', 'set', 'match', 'match', 'match', 'unset', 'match', 'set', 'match', 'match']
+>>> scheduler.picked['match'], scheduler.picked['set'], scheduler.picked['unset']
+(8, 2, 2)
+
+Only queues with work are picked.
+>>> scheduler.pick(['unset'])
+'unset'
+>>> scheduler.pick([]) is None
+True
+
+A queue with weight 0 only gets turns when no other queue has work.
+>>> scheduler = WorkScheduler(weights={'unset': 0})
+>>> [scheduler.pick(['set', 'unset']) for i in range(3)]
+['set', 'set', 'set']
+>>> scheduler.pick(['unset'])
+'unset'
+
+Test caps
+---------
+A queue at its cap sits out until one of its requests finishes.
+>>> scheduler = WorkScheduler(weights={'unset': 10}, caps={'unset': 1})
+>>> scheduler.pick(['set', 'unset'])
+'unset'
+>>> scheduler.started('unset')
+>>> [scheduler.pick(['set', 'unset']) for i in range(2)]
+['set', 'set']
+>>> scheduler.pick(['unset']) is None
+True
+>>> scheduler.finished('unset')
+>>> scheduler.pick(['set', 'unset'])
+'unset'
+
+Test reading a schedule
+-----------------------
+>>> parseSchedule('unset=1:2,update=8')
+({'unset': 1, 'update': 8}, {'unset': 2})
+>>> parseSchedule('delete=1')
+Traceback (most recent call last):
+...
+argparse.ArgumentTypeError: unknown queue 'delete', expected one of unset, set, match, newbib, update
+>>> parseSchedule('set=fast')
+Traceback (most recent call last):
+...
+argparse.ArgumentTypeError: expected queue=weight[:cap], got 'set=fast'
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+###############################################################################
+#
+# Purpose: Split an update across processes and merge the shards' output.
+# Date:    Mon 19 Oct 2026
+# Copyright (c) 2026 Andrew Nisbet
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+import argparse
+import json
+import sys
+import zlib
+from datetime import datetime
+from os.path import exists, getsize, splitext
+from checkpoint import writeAtomic
+from holdings import toOclcInt
+from logit import logit
+
+VERSION='1.00.00'
+
+def shardOf(key, count:int) -> int:
+    """
+    Picks the shard of an OCLC number or title control number. The hash is
+    CRC32 rather than hash(), which changes between processes, and OCLC
+    numbers are compared as integers so '0123' and '123' agree.
+
+    Parameters:
+    - key OCLC number or TCN.
+    - count number of shards.
+
+    Returns:
+    - Shard number from 1 to count.
+    """
+    number = toOclcInt(key)
+    text = str(number) if number is not None else str(key)
+    return zlib.crc32(text.encode('utf-8')) % count + 1
+
+class Shard:
+    """
+    One of 'count' processes that share an update. Deletes are split by
+    OCLC number, and adds by OCLC number or, if they don't have one, by
+    TCN, so an add and a delete of the same number are always in the same
+    shard and the add still cancels the delete.
+    """
+    def __init__(self, index:int, count:int):
+        """
+        Constructor
+
+        Parameters:
+        - index of this shard, from 1 to count.
+        - count number of shards.
+
+        Returns:
+        - Shard object.
+        """
+        if count < 1 or not 1 <= index <= count:
+            raise ValueError(f"shard {index}/{count} must be from 1/{max(count, 1)} to {max(count, 1)}/{max(count, 1)}")
+        self.index = index
+        self.count = count
+        self.tag = f"shard{index}of{count}"
+
+    def owns(self, key) -> bool:
+        return shardOf(key, self.count) == self.index
+
+    def ownsRecord(self, record) -> bool:
+        return self.owns(record.getOclcNumber() or record.getTitleControlNumber())
+
+    def fileName(self, path:str) -> str:
+        """
+        Names this shard's copy of a file.
+
+        Parameters:
+        - path like 'oclc_update_ledger.db'.
+
+        Returns:
+        - Path with the shard tag before the extension, like 'oclc_update_ledger_shard1of4.db'.
+        """
+        (root, ext) = splitext(path)
+        return f"{root}_{self.tag}{ext}"
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+def parseShard(text:str) -> Shard:
+    """
+    Reads a shard like '1/4' from the command line.
+
+    Parameters:
+    - text 'i/N' where i is from 1 to N.
+
+    Returns:
+    - Shard object.
+    """
+    try:
+        (index, count) = text.split('/')
+        return Shard(int(index), int(count))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N like 1/4, got '{text}'")
+
+def overlayFileName(overlayBase:str, date:str, shard:Shard=None) -> str:
+    """
+    Names the slim flat file of records to overlay in the ILS.
+
+    Parameters:
+    - overlayBase the bibOverlayFileName from the config.
+    - date like '20261019'.
+    - shard optional Shard that wrote the file.
+
+    Returns:
+    - File name like 'bib_overlay_20261019.flat' or 'bib_overlay_shard1of4_20261019.flat'.
+    """
+    if shard is None:
+        return f"{overlayBase}_{date}.flat"
+    return f"{overlayBase}_{shard.tag}_{date}.flat"
+
+def errorReportName(backupPrefix:str='oclc_update_', shard:Shard=None) -> str:
+    if shard is None:
+        return f"{backupPrefix}errors.json"
+    return f"{backupPrefix}{shard.tag}_errors.json"
+
+def mergeShards(count:int, overlayBase:str, date:str, backupPrefix:str='oclc_update_') -> bool:
+    """
+    Combines the slim flat files and error reports of a sharded run. The
+    overlay records are appended to the run's slim flat file, like an
+    unsharded run does, and the error reports are added up. How much of
+    each shard's file has been merged is saved, so merging again, after
+    a shard was recovered for example, only appends what is new.
+
+    Parameters:
+    - count number of shards.
+    - overlayBase the bibOverlayFileName from the config.
+    - date of the shards' slim flat files, like '20261019'.
+    - backupPrefix prefix of the shards' state files.
+
+    Returns:
+    - True if every shard wrote its error report, and False if any are
+      missing, in which case that shard didn't finish.
+    """
+    merged_overlay = overlayFileName(overlayBase, date)
+    # Shard overlay file: bytes of it already in the merged file.
+    offsets_file = f"{backupPrefix}merged.json"
+    offsets = {}
+    if exists(offsets_file):
+        with open(offsets_file, encoding='utf-8') as f:
+            offsets = json.load(f)
+    merged = {'error_count': {}, 'errors': {}, 'rejected': {}}
+    new_overlays = []
+    overlays = 0
+    finished = True
+    for index in range(1, count + 1):
+        shard = Shard(index, count)
+        overlay = overlayFileName(overlayBase, date, shard)
+        if exists(overlay):
+            with open(overlay, 'rb') as f:
+                offset = offsets.get(overlay, 0)
+                if offset > getsize(overlay):
+                    # The shard's file was started again.
+                    offset = 0
+                f.seek(offset)
+                data = f.read()
+            offsets[overlay] = offset + len(data)
+            text = data.decode('utf-8')
+            new_overlays.append(text)
+            records = text.count('*** DOCUMENT BOUNDARY ***')
+            overlays += records
+            logit(f"shard {shard}: {records} overlay record(s) from {overlay}")
+        report = errorReportName(backupPrefix, shard)
+        if not exists(report):
+            logit(f"*warning, shard {shard} has no error report {report}, it may not have finished.")
+            finished = False
+            continue
+        with open(report, encoding='utf-8') as f:
+            data = json.load(f)
+        for (stage, errors) in data.get('error_count', {}).items():
+            merged['error_count'][stage] = merged['error_count'].get(stage, 0) + errors
+        merged['errors'].update(data.get('errors', {}))
+        merged['rejected'].update(data.get('rejected', {}))
+    if any(new_overlays):
+        existing = ''
+        if exists(merged_overlay):
+            with open(merged_overlay, encoding='utf-8') as f:
+                existing = f.read()
+        writeAtomic(merged_overlay, [existing] + new_overlays)
+    writeAtomic(offsets_file, json.dumps(offsets, indent=2))
+    report = errorReportName(backupPrefix)
+    writeAtomic(report, json.dumps(merged, indent=2))
+    logit(f"merged {count} shard(s): {overlays} overlay record(s) in {merged_overlay}, {len(merged['errors'])} error(s) in {report}")
+    for (stage, errors) in merged['error_count'].items():
+        logit(f"{stage} errors: {errors}")
+    return finished
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog = 'shard',
+        usage='%(prog)s [options]' ,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description='''\
+            Merges the bib overlay slim flat files and error reports of an
+            update run as oclc4.py --shard 1/N ... --shard N/N.
+            ''',
+    )
+    parser.add_argument('--shards', action='store', type=int, required=True, metavar='N', help='Number of shards in the run.')
+    parser.add_argument('--config', action='store', default='prod.json', metavar='[/foo/prod.json]', help='Configuration with the bibOverlayFileName. Default prod.json.')
+    parser.add_argument('--date', action='store', default=datetime.now().strftime('%Y%m%d'), metavar='YYYYMMDD', help='Date of the shards\' slim flat files. Default today.')
+    parser.add_argument('--version', action='version', version='%(prog)s ' + VERSION)
+    args = parser.parse_args(argv)
+    with open(args.config) as f:
+        configs = json.load(f)
+    return 0 if mergeShards(args.shards, configs.get('bibOverlayFileName'), args.date) else 1
+
+if __name__ == "__main__":
+    if len(sys.argv) == 1:
+        import doctest
+        doctest.testmod()
+        doctest.testfile("shard.tst")
+    else:
+        sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,100 @@
+Tests for sharded runs
+======================
+
+>>> import io, os, json, tempfile
+>>> from contextlib import redirect_stdout
+>>> from shard import Shard, shardOf, parseShard, overlayFileName, errorReportName, mergeShards
+
+Test partitioning
+-----------------
+The shard of a key is the same in every process, and OCLC numbers with
+leading zeros land in the same shard.
+>>> [shardOf(n, 4) for n in ['1111', '2222', '3333', '0123', '123', 'epl01']]
+[4, 2, 1, 3, 3, 2]
+>>> shard = parseShard('2/4')
+>>> str(shard), shard.tag
+('2/4', 'shard2of4')
+>>> shard.owns('2222'), shard.owns('1111')
+(True, False)
+>>> shard.fileName('oclc_update_ledger.db')
+'oclc_update_ledger_shard2of4.db'
+>>> parseShard('5/4')
+Traceback (most recent call last):
+...
+argparse.ArgumentTypeError: expected i/N like 1/4, got '5/4'
+>>> parseShard('0/4')
+Traceback (most recent call last):
+...
+argparse.ArgumentTypeError: expected i/N like 1/4, got '0/4'
+
+Records without an OCLC number are split by TCN.
+>>> from record import Record
+>>> shard.ownsRecord(Record([], tcn="epl01")), shard.ownsRecord(Record([], tcn="epl01", oclcNumber="1111"))
+(True, False)
+
+Test selecting a shard's adds and deletes
+-----------------------------------------
+>>> from oclc4 import RecordManager
+>>> manager = RecordManager()
+>>> manager.shard = Shard(4, 4)
+>>> manager.add_records = [Record([], tcn="epl01", oclcNumber="1111"), Record([], tcn="epl02", oclcNumber="2222")]
+>>> manager.delete_numbers = ['1111', '3333']
+>>> manager.selectShard()
+shard 4/4: 1 of 2 add(s) and 1 of 2 delete(s)
+>>> [r.getOclcNumber() for r in manager.add_records], manager.delete_numbers
+(['1111'], ['1111'])
+
+Test file names
+---------------
+>>> overlayFileName('bib_overlay', '20261019')
+'bib_overlay_20261019.flat'
+>>> overlayFileName('bib_overlay', '20261019', Shard(1, 2))
+'bib_overlay_shard1of2_20261019.flat'
+>>> errorReportName(shard=Shard(1, 2))
+'oclc_update_shard1of2_errors.json'
+
+Test merging
+------------
+The slim flat files of the shards are appended to the run's file, and the
+error reports are added up. A shard without an error report didn't finish.
+>>> cwd = os.getcwd()
+>>> os.chdir(tempfile.mkdtemp())
+>>> with open('bib_overlay_shard1of2_20261019.flat', 'w') as f:
+...     _ = f.write("*** DOCUMENT BOUNDARY ***\nFORM=VM\n.001. |aepl01\n")
+>>> with open('oclc_update_shard1of2_errors.json', 'w') as f:
+...     json.dump({'error_count': {'set': 1, 'match': 0}, 'errors': {'epl01': 'failed'}, 'rejected': {'3333': 'already a holding'}}, f)
+>>> mergeShards(2, 'bib_overlay', '20261019')
+shard 1/2: 1 overlay record(s) from bib_overlay_shard1of2_20261019.flat
+*warning, shard 2/2 has no error report oclc_update_shard2of2_errors.json, it may not have finished.
+merged 2 shard(s): 1 overlay record(s) in bib_overlay_20261019.flat, 1 error(s) in oclc_update_errors.json
+set errors: 1
+match errors: 0
+False
+>>> with open('bib_overlay_shard2of2_20261019.flat', 'w') as f:
+...     _ = f.write("*** DOCUMENT BOUNDARY ***\nFORM=VM\n.001. |aepl02\n")
+>>> with open('oclc_update_shard2of2_errors.json', 'w') as f:
+...     json.dump({'error_count': {'set': 2, 'match': 1}, 'errors': {'epl02': 'failed'}, 'rejected': {}}, f)
+
+Merging again only appends what the shards wrote since the last merge.
+>>> mergeShards(2, 'bib_overlay', '20261019')
+shard 1/2: 0 overlay record(s) from bib_overlay_shard1of2_20261019.flat
+shard 2/2: 1 overlay record(s) from bib_overlay_shard2of2_20261019.flat
+merged 2 shard(s): 1 overlay record(s) in bib_overlay_20261019.flat, 2 error(s) in oclc_update_errors.json
+set errors: 3
+match errors: 1
+True
+>>> open('bib_overlay_20261019.flat').read().count('.001.')
+2
+>>> with redirect_stdout(io.StringIO()):
+...     finished = mergeShards(2, 'bib_overlay', '20261019')
+>>> open('bib_overlay_20261019.flat').read().count('.001.')
+2
+>>> with open('bib_overlay_shard1of2_20261019.flat', 'a') as f:
+...     _ = f.write("*** DOCUMENT BOUNDARY ***\nFORM=VM\n.001. |aepl03\n")
+>>> with redirect_stdout(io.StringIO()):
+...     finished = mergeShards(2, 'bib_overlay', '20261019')
+>>> [line for line in open('bib_overlay_20261019.flat') if line.startswith('.001.')]
+['.001. |aepl01\n', '.001. |aepl02\n', '.001. |aepl03\n']
+>>> json.load(open('oclc_update_errors.json'))['rejected']
+{'3333': 'already a holding'}
+>>> os.chdir(cwd)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+###############################################################################
+#
+# Purpose: Run state of an OCLC update kept in SQLite.
+# Date:    Mon 19 Oct 2026
+# Copyright (c) 2026 Andrew Nisbet
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+import argparse
+import json
+import sqlite3
+import sys
+from record import Record, SET, MATCH, UPDATED, FAILED
+
+VERSION='1.00.00'
+
+# Status of an OCLC number in the delete list.
+PENDING = 'pending'
+
+# Record actions that still need a request sent to OCLC.
+OUTSTANDING = (SET, MATCH, UPDATED)
+
+class StateStore:
+    """
+    The add records, delete numbers and error counts of an update run kept
+    in an indexed SQLite database instead of the oclc_update_*.json files.
+    A snapshot of the lists is written once, after which each outcome only
+    updates its own row, and changes are committed in batches. Resuming,
+    counting the work left per action, and listing failures are queries
+    rather than loading and rewriting whole files.
+    """
+    def __init__(self, fileName:str, batchSize:int=1000):
+        """
+        Constructor, creates the database if it doesn't exist.
+
+        Parameters:
+        - fileName of the SQLite database.
+        - batchSize number of changes between commits.
+
+        Returns:
+        - StateStore object.
+        """
+        self.file_name = fileName
+        self.batch_size = batchSize
+        self.changes = 0
+        self.db = sqlite3.connect(fileName)
+        self.db.execute("CREATE TABLE IF NOT EXISTS records (seq INTEGER PRIMARY KEY, tcn TEXT, action TEXT, oclc_number TEXT, previous_number TEXT, encoding TEXT, reject_tags TEXT, data TEXT, overlay_number TEXT DEFAULT '')")
+        # Databases from older versions don't record the overlay.
+        if 'overlay_number' not in [row[1] for row in self.db.execute("PRAGMA table_info(records)")]:
+            self.db.execute("ALTER TABLE records ADD COLUMN overlay_number TEXT DEFAULT ''")
+        self.db.execute("CREATE INDEX IF NOT EXISTS records_action ON records (action)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS deletes (seq INTEGER PRIMARY KEY, oclc_number TEXT, status TEXT)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS deletes_status ON deletes (status, oclc_number)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS errors (stage TEXT PRIMARY KEY, count INTEGER)")
+        self.db.commit()
+
+    def _changed_(self):
+        self.changes += 1
+        if self.changes >= self.batch_size:
+            self.commit()
+
+    def saveRecords(self, records:list):
+        """
+        Replaces the stored add records with a snapshot of the given list.
+        Each record is tagged with its row so later outcomes can update it
+        with updateRecord().
+
+        Parameters:
+        - records list of Records.
+
+        Returns:
+        - None
+        """
+        def rows():
+            for seq, record in enumerate(records):
+                record.state_id = seq
+                yield (seq, record.getTitleControlNumber(), record.getAction(), record.getOclcNumber(),
+                    record.prev_oclc_number, record.encoding, json.dumps(record.reject_tags), json.dumps(record.record), record.overlay_number)
+        with self.db:
+            self.db.execute("DELETE FROM records")
+            self.db.executemany("INSERT INTO records (seq, tcn, action, oclc_number, previous_number, encoding, reject_tags, data, overlay_number) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows())
+        self.changes = 0
+
+    def saveDeletes(self, oclcNumbers:list):
+        """
+        Replaces the stored delete list. Every number starts out pending.
+
+        Parameters:
+        - oclcNumbers list of OCLC numbers to unset.
+
+        Returns:
+        - None
+        """
+        with self.db:
+            self.db.execute("DELETE FROM deletes")
+            self.db.executemany("INSERT INTO deletes VALUES (?, ?, ?)",
+                ((seq, oclc_number, PENDING) for seq, oclc_number in enumerate(oclcNumbers)))
+        self.changes = 0
+
+    def saveErrors(self, errorCount:dict):
+        """
+        Saves the error counts of each stage.
+
+        Parameters:
+        - errorCount dictionary of stage: count.
+
+        Returns:
+        - None
+        """
+        self.db.executemany("INSERT OR REPLACE INTO errors VALUES (?, ?)", errorCount.items())
+        self._changed_()
+
+    def updateRecord(self, record:Record):
+        """
+        Saves a record's current action and OCLC numbers, and the number it
+        was written to the bib overlay with. Records that weren't part of
+        the snapshot are ignored.
+
+        Parameters:
+        - record to save.
+
+        Returns:
+        - None
+        """
+        if record.state_id is None:
+            return
+        self.db.execute("UPDATE records SET action = ?, oclc_number = ?, previous_number = ?, overlay_number = ? WHERE seq = ?",
+            (record.getAction(), record.getOclcNumber(), record.prev_oclc_number, record.overlay_number, record.state_id))
+        self._changed_()
+
+    def updateDelete(self, oclcNumber:str, status:str):
+        """
+        Saves the outcome of an unset request.
+
+        Parameters:
+        - oclcNumber that was unset.
+        - status like 'done' or 'failed'.
+
+        Returns:
+        - None
+        """
+        self.db.execute("UPDATE deletes SET status = ? WHERE seq = (SELECT MIN(seq) FROM deletes WHERE status = ? AND oclc_number = ?)",
+            (status, PENDING, oclcNumber))
+        self._changed_()
+
+    def hasRecords(self) -> bool:
+        """
+        Tests if a run has been saved.
+
+        Parameters:
+        - None
+
+        Returns:
+        - True if there are stored add records or deletes, and False otherwise.
+        """
+        return (self.db.execute("SELECT 1 FROM records LIMIT 1").fetchone() is not None
+            or self.db.execute("SELECT 1 FROM deletes LIMIT 1").fetchone() is not None)
+
+    def loadRecords(self) -> list:
+        """
+        Loads the stored add records in their original order.
+
+        Parameters:
+        - None
+
+        Returns:
+        - list of Records.
+        """
+        records = []
+        for row in self.db.execute("SELECT seq, tcn, action, oclc_number, previous_number, encoding, reject_tags, data, overlay_number FROM records ORDER BY seq"):
+            record = Record._fromDict_({"data": json.loads(row[7]), "rejectTags": json.loads(row[6]), "action": row[2],
+                "encoding": row[5], "tcn": row[1], "oclcNumber": row[3], "previousNumber": row[4], "overlayNumber": row[8] or ''})
+            record.state_id = row[0]
+            records.append(record)
+        return records
+
+    def loadDeletes(self) -> list:
+        """
+        Loads the OCLC numbers still waiting to be unset.
+
+        Parameters:
+        - None
+
+        Returns:
+        - list of OCLC numbers.
+        """
+        return [row[0] for row in self.db.execute("SELECT oclc_number FROM deletes WHERE status = ? ORDER BY seq", (PENDING,))]
+
+    def loadErrors(self) -> dict:
+        """
+        Loads the error counts of each stage.
+
+        Parameters:
+        - None
+
+        Returns:
+        - dictionary of stage: count.
+        """
+        return {row[0]: row[1] for row in self.db.execute("SELECT stage, count FROM errors")}
+
+    def countByAction(self) -> dict:
+        """
+        Counts the add records by action.
+
+        Parameters:
+        - None
+
+        Returns:
+        - dictionary of action: count.
+        """
+        return {row[0]: row[1] for row in self.db.execute("SELECT action, COUNT(*) FROM records GROUP BY action")}
+
+    def countDeletes(self) -> dict:
+        """
+        Counts the delete numbers by status.
+
+        Parameters:
+        - None
+
+        Returns:
+        - dictionary of status: count.
+        """
+        return {row[0]: row[1] for row in self.db.execute("SELECT status, COUNT(*) FROM deletes GROUP BY status")}
+
+    def pendingCount(self) -> int:
+        """
+        Counts the requests still to be sent to OCLC.
+
+        Parameters:
+        - None
+
+        Returns:
+        - Number of outstanding add records and pending deletes.
+        """
+        placeholders = ', '.join('?' * len(OUTSTANDING))
+        adds = self.db.execute(f"SELECT COUNT(*) FROM records WHERE action IN ({placeholders})", OUTSTANDING).fetchone()[0]
+        deletes = self.db.execute("SELECT COUNT(*) FROM deletes WHERE status = ?", (PENDING,)).fetchone()[0]
+        return adds + deletes
+
+    def failures(self) -> list:
+        """
+        Lists the records and deletes that failed.
+
+        Parameters:
+        - None
+
+        Returns:
+        - list of tuples of (TCN, OCLC number); deletes have an empty TCN.
+        """
+        failed = [(row[0], row[1]) for row in self.db.execute("SELECT tcn, oclc_number FROM records WHERE action = ? ORDER BY seq", (FAILED,))]
+        failed.extend(('', row[0]) for row in self.db.execute("SELECT oclc_number FROM deletes WHERE status = ? ORDER BY seq", (FAILED,)))
+        return failed
+
+    def commit(self):
+        self.db.commit()
+        self.changes = 0
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog = 'statestore',
+        usage='%(prog)s [options] state.db' ,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description='''\
+            Reports the work left in an oclc4.py --state-db database.
+            ''',
+    )
+    parser.add_argument('stateDb', help='SQLite state database written by oclc4.py --state-db.')
+    parser.add_argument('--failures', action='store_true', default=False, help='list the TCNs and OCLC numbers that failed.')
+    parser.add_argument('--pending', action='store_true', default=False, help='print the number of outstanding requests and exit with status 1 if there are none.')
+    parser.add_argument('--version', action='version', version='%(prog)s ' + VERSION)
+    args = parser.parse_args(argv)
+    store = StateStore(args.stateDb)
+    try:
+        if args.pending:
+            pending = store.pendingCount()
+            print(pending)
+            return 0 if pending else 1
+        for action, count in sorted(store.countByAction().items()):
+            print(f"{count} {action} record(s)")
+        for status, count in sorted(store.countDeletes().items()):
+            print(f"{count} {status} delete(s)")
+        for stage, count in sorted(store.loadErrors().items()):
+            print(f"{count} {stage} error(s)")
+        if args.failures:
+            for tcn, oclc_number in store.failures():
+                print(f"{tcn}|{oclc_number}")
+        return 0
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) == 1:
+        import doctest
+        doctest.testmod()
+        doctest.testfile("statestore.tst")
+    else:
+        sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,89 @@
+Tests for StateStore
+====================
+
+>>> import os
+>>> from statestore import StateStore, main
+>>> from record import Record
+
+Test saving a snapshot
+----------------------
+>>> store = StateStore('test_state.db')
+>>> store.hasRecords()
+False
+>>> records = [Record(data=[], tcn='epl001', oclcNumber='1111'), Record(data=[], tcn='epl002', oclcNumber='2222'), Record(data=[], tcn='epl003', oclcNumber='')]
+>>> records[2].setLookupMatch()
+>>> store.saveRecords(records)
+>>> store.saveDeletes(['3333', '4444', '3333'])
+>>> store.hasRecords()
+True
+>>> [record.state_id for record in records]
+[0, 1, 2]
+>>> sorted(store.countByAction().items())
+[('match', 1), ('set', 2)]
+>>> store.pendingCount()
+6
+
+Test updating outcomes
+----------------------
+>>> records[0].setCompleted()
+>>> records[0].overlay_number = '1111'
+>>> store.updateRecord(records[0])
+>>> records[1].setFailed()
+>>> store.updateRecord(records[1])
+>>> store.updateDelete('3333', 'done')
+>>> store.updateDelete('4444', 'failed')
+>>> store.saveErrors({'set': 1, 'unset': 1})
+>>> store.close()
+
+Records that were never saved are ignored.
+>>> store = StateStore('test_state.db')
+>>> store.updateRecord(Record(data=[], tcn='epl004', oclcNumber='5555'))
+
+Test loading and querying
+-------------------------
+Only the second '3333' is still pending.
+>>> store.loadDeletes()
+['3333']
+>>> [(r.getTitleControlNumber(), r.getOclcNumber(), r.getAction(), r.state_id) for r in store.loadRecords()]
+[('epl001', '1111', 'done', 0), ('epl002', '2222', 'failed', 1), ('epl003', '', 'match', 2)]
+>>> [r.overlay_number for r in store.loadRecords()]
+['1111', '', '']
+>>> sorted(store.countDeletes().items())
+[('done', 1), ('failed', 1), ('pending', 1)]
+>>> store.pendingCount()
+2
+>>> store.failures()
+[('epl002', '2222'), ('', '4444')]
+>>> sorted(store.loadErrors().items())
+[('set', 1), ('unset', 1)]
+>>> store.close()
+
+Test the command line report
+----------------------------
+>>> main(['test_state.db'])
+1 done record(s)
+1 failed record(s)
+1 match record(s)
+1 done delete(s)
+1 failed delete(s)
+1 pending delete(s)
+1 set error(s)
+1 unset error(s)
+0
+>>> main(['test_state.db', '--pending'])
+2
+0
+>>> os.unlink('test_state.db')
+
+A database from before the overlay was recorded gets the column.
+>>> import sqlite3
+>>> db = sqlite3.connect('test_state.db')
+>>> _ = db.execute("CREATE TABLE records (seq INTEGER PRIMARY KEY, tcn TEXT, action TEXT, oclc_number TEXT, previous_number TEXT, encoding TEXT, reject_tags TEXT, data TEXT)")
+>>> _ = db.execute("INSERT INTO records VALUES (0, 'epl001', 'done', '1111', '', 'utf-8', '{}', '[]')")
+>>> db.commit()
+>>> db.close()
+>>> store = StateStore('test_state.db')
+>>> [(r.getTitleControlNumber(), r.overlay_number) for r in store.loadRecords()]
+[('epl001', '')]
+>>> store.close()
+>>> os.unlink('test_state.db')
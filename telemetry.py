@@ -0,0 +1,174 @@
+###############################################################################
+#
+# Purpose: JSON-lines telemetry of the requests sent to OCLC.
+# Date:    Mon 19 Oct 2026
+# Copyright (c) 2026 Andrew Nisbet
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+import atexit
+import json
+import threading
+from datetime import datetime
+
+class Telemetry:
+    """
+    Writes one compact JSON event per line to a file that is kept open.
+    Events are buffered and flushed every 'flushEvery' events and on close,
+    so recording a request costs about as much as formatting the line.
+    """
+    def __init__(self, fileName:str, flushEvery:int=100):
+        """
+        Constructor, opens the telemetry file for appending.
+
+        Parameters:
+        - fileName of the JSON-lines file.
+        - flushEvery number of events between flushes.
+
+        Returns:
+        - Telemetry object.
+        """
+        self.file_name = fileName
+        self.flush_every = flushEvery
+        self.unflushed = 0
+        self.count = 0
+        self.lock = threading.Lock()
+        self.fp = open(fileName, 'at', encoding='utf-8')
+
+    def emit(self, **fields):
+        """
+        Writes an event. The time is added to the fields given.
+
+        Parameters:
+        - fields of the event, like endpoint, status and latency.
+
+        Returns:
+        - None
+        """
+        event = {'time': datetime.now().isoformat(timespec='milliseconds')}
+        event.update(fields)
+        line = json.dumps(event, separators=(',', ':')) + '\n'
+        with self.lock:
+            if self.fp.closed:
+                return
+            self.fp.write(line)
+            self.count += 1
+            self.unflushed += 1
+            if self.unflushed >= self.flush_every:
+                self.fp.flush()
+                self.unflushed = 0
+
+    def flush(self):
+        with self.lock:
+            if not self.fp.closed:
+                self.fp.flush()
+            self.unflushed = 0
+
+    def close(self):
+        with self.lock:
+            if not self.fp.closed:
+                self.fp.close()
+
+# The process-wide telemetry file, if any.
+_telemetry = None
+# Functions called with each request event, like metrics collectors.
+_observers = []
+
+def startTelemetry(fileName:str, flushEvery:int=100) -> Telemetry:
+    """
+    Starts recording the requests sent to OCLC. Any telemetry file
+    already open is closed first.
+
+    Parameters:
+    - fileName of the JSON-lines file.
+    - flushEvery number of events between flushes.
+
+    Returns:
+    - Telemetry object.
+    """
+    global _telemetry
+    stopTelemetry()
+    _telemetry = Telemetry(fileName, flushEvery=flushEvery)
+    return _telemetry
+
+def stopTelemetry():
+    """
+    Stops recording requests and closes the telemetry file.
+
+    Parameters:
+    - None
+
+    Returns:
+    - None
+    """
+    global _telemetry
+    if _telemetry is not None:
+        _telemetry.close()
+        _telemetry = None
+
+def getTelemetry() -> Telemetry:
+    """
+    Returns:
+    - The Telemetry requests are recorded to, or None if it isn't started.
+    """
+    return _telemetry
+
+def addObserver(observer):
+    """
+    Registers a function to be called with the fields of each request event.
+
+    Parameters:
+    - observer function that takes a dictionary of event fields.
+
+    Returns:
+    - None
+    """
+    if observer not in _observers:
+        _observers.append(observer)
+
+def removeObserver(observer):
+    if observer in _observers:
+        _observers.remove(observer)
+
+def isRecording() -> bool:
+    """
+    Tests if request events are wanted, so callers can skip timing
+    requests when nothing is listening.
+
+    Returns:
+    - True if telemetry is started or there are observers.
+    """
+    return _telemetry is not None or bool(_observers)
+
+def recordRequest(event:dict):
+    """
+    Records a request event to the telemetry file and any observers.
+
+    Parameters:
+    - event dictionary of fields, like endpoint, status and latency_ms.
+
+    Returns:
+    - None
+    """
+    if _telemetry is not None:
+        _telemetry.emit(**event)
+    for observer in _observers:
+        observer(event)
+
+atexit.register(stopTelemetry)
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    doctest.testfile("telemetry.tst")
@@ -0,0 +1,32 @@
+Tests for Telemetry
+===================
+
+>>> import json, os
+>>> from telemetry import startTelemetry, stopTelemetry, getTelemetry
+
+Test recording events
+---------------------
+>>> getTelemetry() is None
+True
+>>> telemetry = startTelemetry('test_telemetry.jsonl', flushEvery=2)
+>>> getTelemetry() is telemetry
+True
+>>> telemetry.emit(endpoint='set', status=200, latency_ms=12.5, oclcNumber='1111')
+>>> telemetry.emit(endpoint='unset', status=200, latency_ms=8.0, oclcNumber='2222')
+
+Events are flushed every 2.
+>>> events = [json.loads(line) for line in open('test_telemetry.jsonl')]
+>>> [(e['endpoint'], e['status'], e['oclcNumber']) for e in events]
+[('set', 200, '1111'), ('unset', 200, '2222')]
+>>> 'time' in events[0]
+True
+
+Stopping closes the file, and later events are dropped.
+>>> telemetry.emit(endpoint='match', status=200, latency_ms=30.1, tcn='epl001')
+>>> stopTelemetry()
+>>> getTelemetry() is None
+True
+>>> telemetry.emit(endpoint='match', status=200, latency_ms=30.1, tcn='epl002')
+>>> [json.loads(line).get('tcn') for line in open('test_telemetry.jsonl')][-1]
+'epl001'
+>>> os.unlink('test_telemetry.jsonl')
@@ -0,0 +1,165 @@
+###############################################################################
+#
+# Purpose: Time the stages of an update run.
+# Date:    Mon 19 Oct 2026
+# Copyright (c) 2026 Andrew Nisbet
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+import threading
+from contextlib import contextmanager
+from time import perf_counter, process_time
+import telemetry
+
+class StageTime:
+    """
+    Totals of one stage. A stage that runs more than once, like the second
+    set pass, adds to the same totals.
+    """
+    def __init__(self, name:str):
+        self.name = name
+        self.runs = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.network_seconds = 0.0
+        self.requests = 0
+
+    def otherSeconds(self) -> float:
+        """
+        Returns:
+        - Wall time not spent on the CPU or waiting for OCLC, like disk
+          and database I/O, or sleeping between retries.
+        """
+        return max(0.0, self.wall_seconds - self.cpu_seconds - self.network_seconds)
+
+    def requestsPerSecond(self) -> float:
+        return self.requests / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+class StageTimer:
+    """
+    Measures the wall, CPU and network time of each stage of a run. The
+    network time is the sum of the request latencies reported through
+    telemetry.py while a stage runs; the CPU time is the process's, which
+    includes background threads like checkpoint writes.
+    """
+    def __init__(self):
+        """
+        Constructor
+
+        Parameters:
+        - None
+
+        Returns:
+        - StageTimer object.
+        """
+        self.stages = {}
+        self.current = None
+        self.lock = threading.Lock()
+        self.observers = []
+
+    def addObserver(self, observer):
+        """
+        Registers an object to be told when each stage starts and ends, like
+        a Profiler.
+
+        Parameters:
+        - observer with stageStarted(name) and stageEnded(stageTime) methods.
+
+        Returns:
+        - None
+        """
+        if observer not in self.observers:
+            self.observers.append(observer)
+
+    def _observe_(self, event:dict):
+        with self.lock:
+            if self.current is not None:
+                self.current.network_seconds += event.get('latency_ms', 0.0) / 1000.0
+                self.current.requests += 1
+
+    @contextmanager
+    def stage(self, name:str):
+        """
+        Times the code run in a 'with' block as the named stage.
+
+        Parameters:
+        - name of the stage, like 'unset' or 'read adds'.
+
+        Returns:
+        - Context manager that yields the stage's StageTime.
+        """
+        stage = self.stages.setdefault(name, StageTime(name))
+        with self.lock:
+            outer = self.current
+            self.current = stage
+        telemetry.addObserver(self._observe_)
+        for observer in self.observers:
+            observer.stageStarted(name)
+        wall_start = perf_counter()
+        cpu_start = process_time()
+        try:
+            yield stage
+        finally:
+            stage.wall_seconds += perf_counter() - wall_start
+            stage.cpu_seconds += process_time() - cpu_start
+            stage.runs += 1
+            with self.lock:
+                self.current = outer
+            if outer is None:
+                telemetry.removeObserver(self._observe_)
+            for observer in self.observers:
+                observer.stageEnded(stage)
+
+    def total(self) -> StageTime:
+        """
+        Adds up the stages.
+
+        Parameters:
+        - None
+
+        Returns:
+        - StageTime of the whole run.
+        """
+        total = StageTime('total')
+        for stage in self.stages.values():
+            total.runs += stage.runs
+            total.wall_seconds += stage.wall_seconds
+            total.cpu_seconds += stage.cpu_seconds
+            total.network_seconds += stage.network_seconds
+            total.requests += stage.requests
+        return total
+
+    def report(self, records:int=0) -> list:
+        """
+        Formats the stage times as a table.
+
+        Parameters:
+        - records number of records the run processed, for the throughput.
+
+        Returns:
+        - list of lines.
+        """
+        lines = [f"{'stage':<16}{'wall s':>10}{'cpu s':>10}{'net s':>10}{'other s':>10}{'requests':>10}{'req/s':>10}"]
+        for stage in list(self.stages.values()) + [self.total()]:
+            lines.append(f"{stage.name:<16}{stage.wall_seconds:>10.2f}{stage.cpu_seconds:>10.2f}{stage.network_seconds:>10.2f}"
+                f"{stage.otherSeconds():>10.2f}{stage.requests:>10}{stage.requestsPerSecond():>10.1f}")
+        total = self.total()
+        if records and total.wall_seconds > 0:
+            lines.append(f"{records} record(s) in {total.wall_seconds:.2f} seconds, {records / total.wall_seconds:.1f} records per second")
+        return lines
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    doctest.testfile("timing.tst")
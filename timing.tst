@@ -0,0 +1,49 @@
+Tests for StageTimer
+====================
+
+>>> from time import sleep
+>>> from timing import StageTimer
+>>> import telemetry
+
+Test timing stages
+------------------
+Requests reported through telemetry while a stage runs are counted as
+network time.
+>>> timer = StageTimer()
+>>> with timer.stage('unset') as stage:
+...     telemetry.recordRequest({'endpoint': 'unset', 'status': 200, 'latency_ms': 20.0})
+...     telemetry.recordRequest({'endpoint': 'unset', 'status': 200, 'latency_ms': 30.0})
+...     sleep(0.1)
+>>> stage.requests
+2
+>>> round(stage.network_seconds, 3)
+0.05
+>>> stage.wall_seconds >= 0.1
+True
+
+The observer is removed after the stage, so later requests aren't counted.
+>>> telemetry.isRecording()
+False
+
+Running a stage again adds to its totals.
+>>> with timer.stage('set'):
+...     telemetry.recordRequest({'endpoint': 'set', 'status': 200, 'latency_ms': 10.0})
+>>> with timer.stage('set'):
+...     telemetry.recordRequest({'endpoint': 'set', 'status': 200, 'latency_ms': 10.0})
+>>> (timer.stages['set'].runs, timer.stages['set'].requests)
+(2, 2)
+>>> list(timer.stages)
+['unset', 'set']
+>>> total = timer.total()
+>>> (total.requests, round(total.network_seconds, 3))
+(4, 0.07)
+
+Test the report
+---------------
+>>> lines = timer.report(records=10)
+>>> lines[0].split()
+['stage', 'wall', 's', 'cpu', 's', 'net', 's', 'other', 's', 'requests', 'req/s']
+>>> [line.split()[0] for line in lines[1:4]]
+['unset', 'set', 'total']
+>>> lines[-1].startswith('10 record(s) in ')
+True
@@ -0,0 +1,156 @@
+###############################################################################
+#
+# Purpose: Work queue of OCLC requests for a stage of the update.
+# Date:    Mon 19 Oct 2026
+# Copyright (c) 2026 Andrew Nisbet
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+###############################################################################
+from collections import deque
+
+class WorkQueue:
+    """
+    Queue of work items, like OCLC numbers or Records, for one stage of the
+    update. Items are never removed from the underlying list; a cursor marks
+    the next pending item, and items handed out are tracked as in-flight
+    until they are marked done or failed. Every operation is constant time
+    so a stage doesn't slow down as it works through a long list.
+
+    The cursor (offset) is how far the stage has got, and remaining() is
+    the work still outstanding, so either can be checkpointed.
+    """
+    def __init__(self, items:list, name:str=''):
+        """
+        Constructor
+
+        Parameters:
+        - items list of work items.
+        - name of the stage, like 'set' or 'unset'.
+
+        Returns:
+        - WorkQueue object.
+        """
+        self.name = name
+        self.items = items
+        self.offset = 0
+        self.retries = deque()
+        self.in_flight = {}
+        self.done_count = 0
+        self.failed = {}
+
+    def hasNext(self) -> bool:
+        """
+        Tests if there is any pending work.
+
+        Parameters:
+        - None
+
+        Returns:
+        - True if there are items to hand out and False otherwise.
+        """
+        return bool(self.retries) or self.offset < len(self.items)
+
+    def next(self) -> tuple:
+        """
+        Hands out the next pending item, which is now in-flight.
+        Items put back with retry() are handed out first.
+
+        Parameters:
+        - None
+
+        Returns:
+        - tuple of (position, item), or None if there is no pending work.
+        """
+        if self.retries:
+            position = self.retries.popleft()
+        elif self.offset < len(self.items):
+            position = self.offset
+            self.offset += 1
+        else:
+            return None
+        self.in_flight[position] = self.items[position]
+        return (position, self.items[position])
+
+    def done(self, position:int):
+        """
+        Marks an in-flight item as finished.
+
+        Parameters:
+        - position of the item as returned by next().
+
+        Returns:
+        - None
+        """
+        if self.in_flight.pop(position, None) is not None:
+            self.done_count += 1
+
+    def fail(self, position:int):
+        """
+        Marks an in-flight item as failed. Failed items are not retried.
+
+        Parameters:
+        - position of the item as returned by next().
+
+        Returns:
+        - None
+        """
+        if position in self.in_flight:
+            self.failed[position] = self.in_flight.pop(position)
+
+    def retry(self, position:int):
+        """
+        Puts an in-flight item back to be handed out again.
+
+        Parameters:
+        - position of the item as returned by next().
+
+        Returns:
+        - None
+        """
+        if self.in_flight.pop(position, None) is not None:
+            self.retries.append(position)
+
+    def remaining(self) -> list:
+        """
+        Lists the work that is still outstanding, in-flight and pending, in
+        the original order.
+
+        Parameters:
+        - None
+
+        Returns:
+        - list of items.
+        """
+        waiting = sorted(list(self.in_flight) + list(self.retries))
+        return [self.items[position] for position in waiting] + self.items[self.offset:]
+
+    def pendingCount(self) -> int:
+        """
+        Counts the items that are waiting or in-flight.
+
+        Parameters:
+        - None
+
+        Returns:
+        - integer count.
+        """
+        return len(self.items) - self.offset + len(self.retries) + len(self.in_flight)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    doctest.testfile("workqueue.tst")
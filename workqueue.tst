@@ -0,0 +1,34 @@
+Tests for WorkQueue
+===================
+
+>>> from workqueue import WorkQueue
+>>> queue = WorkQueue(['1111', '2222', '3333', '4444', '5555'], name='unset')
+>>> queue.hasNext()
+True
+>>> queue.next()
+(0, '1111')
+>>> queue.done(0)
+>>> queue.next()
+(1, '2222')
+>>> queue.fail(1)
+>>> queue.next()
+(2, '3333')
+
+In-flight and pending items are both outstanding.
+>>> queue.remaining()
+['3333', '4444', '5555']
+>>> (queue.offset, queue.pendingCount(), queue.done_count, queue.failed)
+(3, 3, 1, {1: '2222'})
+
+Retried items are handed out again before the rest.
+>>> queue.retry(2)
+>>> queue.next()
+(2, '3333')
+>>> queue.done(2)
+>>> while queue.hasNext():
+...     (position, item) = queue.next()
+...     queue.done(position)
+>>> queue.next() is None
+True
+>>> (queue.remaining(), queue.pendingCount(), queue.done_count)
+([], 0, 4)
@@ -24,6 +24,11 @@ import json
 from os import linesep
 from os.path import exists
 from logit import logit
+from telemetry import isRecording, recordRequest
+from histogram import LatencyHistograms
+from sampling import getSampler
+from time import perf_counter
+import threading
 import sys
 
 TOKEN_CACHE = '_auth_.json'
@@ -35,9 +40,24 @@ AUTH_URL_KEY = 'authUrl'
 BASE_URL     = 'baseUrl'
 
 class WebService:
+    # Name of the endpoint in telemetry events and latency histograms.
+    endpoint = ''
+    # Latencies of every request sent in this process, by endpoint.
+    latencies = LatencyHistograms()
+    # Serializes reading, refreshing and caching the auth token.
+    token_lock = threading.RLock()
+    # The auth token last read or refreshed, shared by every web service
+    # in the process so the cache file is only read once.
+    auth_cache = None
+    # Each thread keeps its own session, so its connections to OCLC stay
+    # open between requests. See getSession().
+    local = threading.local()
+
     def __init__(self, configFile:str, debug:bool=False, is_test:bool=False):
         self.is_test = is_test
         self.debug = debug
+        # Set if the last request had to get a new auth token.
+        self.token_refreshed = False
         # Default server error if the response can't be retreived, otherwise get response status.
         if not exists(configFile):
             if self.is_test:
@@ -69,7 +89,12 @@ class WebService:
             "scope": self.configs.get(SCOPE_KEY)
         }
         token_url = self.configs.get(AUTH_URL_KEY)
-        response = requests.post(token_url, headers=headers, data=body)
+        self.token_refreshed = True
+        start = perf_counter()
+        try:
+            response = requests.post(token_url, headers=headers, data=body)
+        finally:
+            WebService.latencies.record('oauth', (perf_counter() - start) * 1000.0)
         self.status_code = response.status_code
         if self.debug:
             if self.is_test:
@@ -104,42 +129,108 @@ class WebService:
 
     # Tests and refreshes authentication token.
     def getAccessToken(self) -> str:
-        expiry_deadline = '1900-01-01 00:00:00Z'
-        if exists(TOKEN_CACHE):
-            with open(TOKEN_CACHE, 'r') as f:
-                self.auth_json = json.load(f)
-            f.close()
-        else:
-            if self.debug == True:
-                if self.is_test:
-                    logit(f"requesting new auth token.")
-                else:
-                    logit(f"requesting new auth token.", timestamp=True)
-            self.auth_json = self.__authenticate_worldcat_metadata__()
-        expiry_deadline = self.auth_json.get('expires_at')
-        if self._is_expired_(expiry_deadline):
-            # Refresh the token
-            if self.debug == True:
+        # Requests sent from several threads share the token cache.
+        with WebService.token_lock:
+            self.auth_json = WebService.auth_cache
+            refreshed = False
+            if self.auth_json is None and exists(TOKEN_CACHE):
+                with open(TOKEN_CACHE, 'r') as f:
+                    self.auth_json = json.load(f)
+                f.close()
+            elif self.auth_json is None:
+                if self.debug == True:
+                    if self.is_test:
+                        logit(f"requesting new auth token.")
+                    else:
+                        logit(f"requesting new auth token.", timestamp=True)
+                self.auth_json = self.__authenticate_worldcat_metadata__()
+                refreshed = True
+            expiry_deadline = self.auth_json.get('expires_at')
+            if self._is_expired_(expiry_deadline):
+                # Refresh the token
+                if self.debug == True:
+                    if self.is_test:
+                        logit(f"requesting refreshed auth token.")
+                    else:
+                        logit(f"requesting refreshed auth token.", timestamp=True)
+                self.auth_json = self.__authenticate_worldcat_metadata__()
+                refreshed = True
+            if refreshed:
+                # Cache the results for repeated requests, and for the next run.
+                with open(TOKEN_CACHE, 'w') as f:
+                    # Note to self: Use json.dump for streams files, or sockets and dumps for formatted strings.
+                    json.dump(self.auth_json, f, ensure_ascii=False, indent=2)
+            access_token = self.auth_json.get('access_token')
+            if not access_token:
                 if self.is_test:
-                    logit(f"requesting refreshed auth token.")
+                    logit(f"{self.auth_json.get('message')}", level='error')
                 else:
-                    logit(f"requesting refreshed auth token.", timestamp=True)
-            self.auth_json = self.__authenticate_worldcat_metadata__()
-        # Cache the results for repeated requests.
-        with open(TOKEN_CACHE, 'w') as f:
-            # Note to self: Use json.dump for streams files, or sockets and dumps for formatted strings.
-            json.dump(self.auth_json, f, ensure_ascii=False, indent=2)
-        access_token = self.auth_json.get('access_token')
-        if not access_token:
-            if self.is_test:
-                logit(f"{self.auth_json.get('message')}", level='error')
+                    logit(f"{self.auth_json.get('message')}", timestamp=True, level='error')
+                self.status_code = self.auth_json.get('code')
+                # Don't keep a failed authorization, ask again next time.
+                WebService.auth_cache = None
             else:
-                logit(f"{self.auth_json.get('message')}", timestamp=True, level='error')
-            self.status_code = self.auth_json.get('code')
-        return access_token
+                WebService.auth_cache = self.auth_json
+            return access_token
+
+    # The session of the calling thread, created on first use. Sessions
+    # aren't shared between threads.
+    def getSession(self) -> requests.Session:
+        session = getattr(WebService.local, 'session', None)
+        if session is None:
+            session = WebService.local.session = requests.Session()
+        return session
 
     # Manages sending request by either HTTPMethod POST, GET, or DELETE (case insensitive).
-    def sendRequest(self, requestUrl:str, headers:dict, body:str='', httpMethod:str='POST', expectXml=False) -> dict:
+    # The OCLC number or TCN, if given, are only used in telemetry events.
+    def sendRequest(self, requestUrl:str, headers:dict, body:str='', httpMethod:str='POST', expectXml=False, oclcNumber:str='', tcn:str='') -> dict:
+        self.token_refreshed = False
+        start = perf_counter()
+        error = None
+        try:
+            return self._sendRequest_(requestUrl, headers, body, httpMethod, expectXml)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            latency_ms = (perf_counter() - start) * 1000.0
+            WebService.latencies.record(self.endpoint, latency_ms)
+            # --debug already logs every request in full.
+            sampler = getSampler()
+            if sampler is not None and not self.debug:
+                self._sampleRequest_(sampler, requestUrl, httpMethod, latency_ms, error)
+            if isRecording():
+                event = {'endpoint': self.endpoint, 'method': httpMethod.upper(), 'status': self.response_status,
+                    'latency_ms': round(latency_ms, 1),
+                    'request_bytes': len(body.encode('utf-8')) if isinstance(body, str) else len(body or b''),
+                    'response_bytes': self.response_bytes, 'token_refreshed': self.token_refreshed}
+                if oclcNumber:
+                    event['oclcNumber'] = oclcNumber
+                if tcn:
+                    event['tcn'] = tcn
+                if error:
+                    event['error'] = error
+                recordRequest(event)
+
+    # Logs a request that is sampled or an anomaly, like an error status or a slow
+    # response, with its headers and content cut to the sampler's limit.
+    def _sampleRequest_(self, sampler, requestUrl:str, httpMethod:str, latencyMs:float, error:str=None):
+        reason = sampler.anomaly(self.response_status, latencyMs, error=error or '')
+        if not reason and not sampler.sample():
+            return
+        message = f"DEBUG{' ' + reason if reason else ''}: {self.endpoint} {httpMethod.upper()} {requestUrl} -> {self.response_status} in {latencyMs:.1f}ms"
+        response = self.last_response
+        if response is not None:
+            message += f" headers: '{sampler.truncate(response.headers)}'\n content: '{sampler.truncate(response.content)}'"
+        if self.is_test:
+            logit(message)
+        else:
+            logit(message, timestamp=True)
+
+    def _sendRequest_(self, requestUrl:str, headers:dict, body:str, httpMethod:str, expectXml:bool):
+        self.response_status = None
+        self.response_bytes = 0
+        self.last_response = None
         access_token = self.getAccessToken()
         if not access_token:
             return {}
@@ -149,17 +240,21 @@ class WebService:
                 logit(f"DEBUG: url={requestUrl}")
             else:
                 logit(f"DEBUG: url={requestUrl}", timestamp=True)
+        session = self.getSession()
         if httpMethod.lower() == 'get':
-            response = requests.get(url=requestUrl, headers=headers, timeout=self.timeout_duration)
+            response = session.get(url=requestUrl, headers=headers, timeout=self.timeout_duration)
         elif httpMethod.lower() == 'delete':
-            response = requests.delete(url=requestUrl, headers=headers, timeout=self.timeout_duration)
+            response = session.delete(url=requestUrl, headers=headers, timeout=self.timeout_duration)
         elif httpMethod.lower() == 'post':
-            response = requests.post(url=requestUrl, headers=headers, data=body, timeout=self.timeout_duration)
+            response = session.post(url=requestUrl, headers=headers, data=body, timeout=self.timeout_duration)
         else:
             if self.is_test:
                 logit(f"unknown HTTP method '{httpMethod}'", level='error')
             else:
                 logit(f"unknown HTTP method '{httpMethod}'", timestamp=True, level='error')
+        self.response_status = response.status_code
+        self.response_bytes = len(response.content)
+        self.last_response = response
         if self.debug:
             if self.is_test:
                 logit(f"DEBUG: response code {response.status_code} headers: '{response.headers}'\n content: '{response.content}'")
@@ -198,11 +293,13 @@ class SetWebService(WebService):
     def __init__(self, configFile:str, debug:bool=False, is_test:bool=False):
         super().__init__(configFile=configFile, debug=debug, is_test=is_test)
 
+    endpoint = 'set'
+
     def sendRequest(self, oclcNumber:str) -> dict:
         # /manage/institution/holdings/:oclcNumber/set
         url = f"{self.configs.get(BASE_URL)}/manage/institution/holdings/{oclcNumber}/set"
         header = {"Application": "application/json"}
-        return super().sendRequest(requestUrl=url, headers=header, httpMethod='POST')
+        return super().sendRequest(requestUrl=url, headers=header, httpMethod='POST', oclcNumber=oclcNumber)
 
 
 # Unset the holding on a Bibliographic record for an institution by OCLC Number.
@@ -224,11 +321,13 @@ class UnsetWebService(WebService):
     def __init__(self, configFile:str, debug:bool=False, is_test:bool=False):
         super().__init__(configFile=configFile, debug=debug, is_test=is_test)
 
+    endpoint = 'unset'
+
     def sendRequest(self, oclcNumber:str) -> dict:
         # /manage/institution/holdings/:oclcNumber/unset
         url = f"{self.configs.get(BASE_URL)}/manage/institution/holdings/{oclcNumber}/unset"
         header = {"Application": "application/json"}
-        return super().sendRequest(requestUrl=url, headers=header, httpMethod='POST')
+        return super().sendRequest(requestUrl=url, headers=header, httpMethod='POST', oclcNumber=oclcNumber)
 
 # Match a Bibliographic Record.
 # param: configFile:str name of the configuration JSON file.
@@ -285,14 +384,16 @@ class MatchWebService(WebService):
     def __init__(self, configFile:str, debug:bool=False, is_test:bool=False):
         super().__init__(configFile=configFile, debug=debug, is_test=is_test)
 
-    def sendRequest(self, xmlBibRecord:str) -> dict:
+    endpoint = 'match'
+
+    def sendRequest(self, xmlBibRecord:str, tcn:str='') -> dict:
         # /manage/bibs/match
         url = f"{self.configs.get(BASE_URL)}/manage/bibs/match"
         header = {
             "Content-Type": "application/marcxml+xml",
             "Accept": "application/json"
         }
-        return super().sendRequest(requestUrl=url, headers=header, body=xmlBibRecord, httpMethod='POST')
+        return super().sendRequest(requestUrl=url, headers=header, body=xmlBibRecord, httpMethod='POST', tcn=tcn)
 
 # Create a local holdings bibliographic record. Uploads a new Bibliographic record in Marc21 XML.
 # param: configFile:str name of the configuration JSON file.
@@ -300,8 +401,10 @@ class MatchWebService(WebService):
 class AddBibWebService(WebService):
     def __init__(self, configFile:str, debug:bool=False, is_test:bool=False):
         super().__init__(configFile=configFile, debug=debug, is_test=is_test)
+
+    endpoint = 'addbib'
     
-    def sendRequest(self, xmlBibRecord:str) -> dict:
+    def sendRequest(self, xmlBibRecord:str, tcn:str='') -> dict:
         # /worldcat/manage/bibs
         # https://developer.api.oclc.org/wc-metadata-v2#/Manage%20Local%20Bibliographic%20Data/lbd-create
         url = f"{self.configs.get(BASE_URL)}/manage/bibs"
@@ -309,7 +412,7 @@ class AddBibWebService(WebService):
             "Content-Type": "application/marcxml+xml",
             "Accept": "application/marcxml+xml"
         }
-        return super().sendRequest(requestUrl=url, headers=header, body=xmlBibRecord, httpMethod='POST', expectXml=True)
+        return super().sendRequest(requestUrl=url, headers=header, body=xmlBibRecord, httpMethod='POST', expectXml=True, tcn=tcn)
 
 # Delete: {{baseUrl}}/manage/lbds/:controlNumber DELETE
 # Delete a Local Bibliographic Data record.
@@ -328,6 +431,8 @@ class DeleteWebService(WebService):
     def __init__(self, configFile:str, debug:bool=False, is_test:bool=False):
         super().__init__(configFile=configFile, debug=debug, is_test=is_test)
 
+    endpoint = 'lbd'
+
     def sendRequest(self, oclcNumber:str) -> dict:
         # /manage/lbds/
         url = f"{self.configs.get(BASE_URL)}/manage/lbds/{oclcNumber}"
@@ -335,7 +440,7 @@ class DeleteWebService(WebService):
             # The 'documentation' says this, but the method sends back json so, there's that.
             "Accept": "application/marcxml+xml"
         }
-        return super().sendRequest(requestUrl=url, headers=header, httpMethod='DELETE')
+        return super().sendRequest(requestUrl=url, headers=header, httpMethod='DELETE', oclcNumber=oclcNumber)
 
 if __name__ == "__main__":
     import doctest
@@ -86,3 +86,31 @@ Test _is_expired_()
 True
 >>> ws._is_expired_("2050-01-31 00:59:39Z")
 False
+
+Test refreshing the auth token from several threads
+---------------------------------------------------
+Requests sent at once from several threads share the token cache, and an
+expired token is only refreshed once.
+>>> import json, os, tempfile, threading, time
+>>> config = os.path.abspath('prod.json')
+>>> class CountingWebService(SetWebService):
+...     refreshes = 0
+...     def __authenticate_worldcat_metadata__(self):
+...         CountingWebService.refreshes += 1
+...         time.sleep(0.05)
+...         return {'access_token': f"token{CountingWebService.refreshes}", 'expires_at': '2099-01-01 00:00:00Z'}
+>>> cwd = os.getcwd()
+>>> os.chdir(tempfile.mkdtemp())
+>>> with open('_auth_.json', 'w') as f:
+...     json.dump({'access_token': 'old', 'expires_at': '2000-01-01 00:00:00Z'}, f)
+>>> tokens = []
+>>> def getToken():
+...     tokens.append(CountingWebService(config).getAccessToken())
+>>> threads = [threading.Thread(target=getToken) for i in range(8)]
+>>> for thread in threads:
+...     thread.start()
+>>> for thread in threads:
+...     thread.join()
+>>> CountingWebService.refreshes, sorted(set(tokens))
+(1, ['token1'])
+>>> os.chdir(cwd)